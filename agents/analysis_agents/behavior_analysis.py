@@ -1,35 +1,64 @@
-from utils.helpers import OpenRouterClient
+from utils.helpers import OpenRouterClient, collect_stream
+from utils.async_client import AsyncOpenRouterClient, collect_stream_async
+from utils.prompt_budget import build_budgeted_analysis_prompt, log_prompt_report
+from utils.facets import has_facet
 
 class BehaviorAnalysisAgent:
     def __init__(self, api_key):
         self.client = OpenRouterClient(api_key)
+        self.async_client = AsyncOpenRouterClient(api_key)
+        self.last_prompt_report = None
     
-    def analyze(self, case_data, knowledge_base):
+    def analyze(self, case_data, knowledge_base, on_token=None):
+        analysis_prompt = self._prepare_prompt(case_data, knowledge_base)
+        model, temperature, max_tokens = self._model_params()
+        
+        if on_token is None:
+            analysis_result = self.client.chat_completion(analysis_prompt, model, temperature, max_tokens)
+        else:
+            analysis_result = collect_stream(
+                self.client.chat_completion_stream(analysis_prompt, model, temperature, max_tokens),
+                on_token
+            )
+        
+        return analysis_result
+    
+    async def analyze_async(self, case_data, knowledge_base, on_token=None):
+        analysis_prompt = self._prepare_prompt(case_data, knowledge_base)
+        model, temperature, max_tokens = self._model_params()
+        
+        if on_token is None:
+            return await self.async_client.chat_completion(analysis_prompt, model, temperature, max_tokens)
+        return await collect_stream_async(
+            self.async_client.chat_completion_stream(analysis_prompt, model, temperature, max_tokens),
+            on_token
+        )
+    
+    def _prepare_prompt(self, case_data, knowledge_base):
         relevant_laws = self._filter_behavior_related_laws(knowledge_base)
         relevant_cases = self._filter_behavior_related_cases(knowledge_base)
         
-        analysis_prompt = self._build_analysis_prompt(case_data, relevant_laws, relevant_cases)
-        
+        # 按token预算装配提示词，预算不足时先截断/丢弃相关度最低的条目
+        prompt, self.last_prompt_report = build_budgeted_analysis_prompt(
+            self._build_analysis_prompt,
+            case_data,
+            [(self._format_law(law), law.get('relevance_score')) for law in relevant_laws],
+            [(self._format_case(case), case.get('relevance_score')) for case in relevant_cases]
+        )
+        log_prompt_report("行为分析", self.last_prompt_report)
+        return prompt
+    
+    def _model_params(self):
         # 使用配置的模型参数
         model_config = getattr(self.client, 'model_config', {})
         model = model_config.get('model', 'anthropic/claude-3.5-sonnet')
         temperature = model_config.get('temperature', 0.1)
         max_tokens = model_config.get('max_tokens', 4000)
-        
-        analysis_result = self.client.chat_completion(analysis_prompt, model, temperature, max_tokens)
-        
-        return analysis_result
+        return model, temperature, max_tokens
     
     def _filter_behavior_related_laws(self, knowledge_base):
-        behavior_keywords = ['行为', '故意', '过失', '手段', '方法', '犯罪构成', '客观要件']
-        
-        relevant_laws = []
-        for item in knowledge_base:
-            if item['type'] == 'law':
-                content_text = str(item['content'])
-                if any(keyword in content_text for keyword in behavior_keywords):
-                    relevant_laws.append(item)
-        
+        # 按索引构建时预先计算的主题标签过滤
+        relevant_laws = [item for item in knowledge_base if item['type'] == 'law' and has_facet(item, 'behavior')]
         return relevant_laws[:5]
     
     def _filter_behavior_related_cases(self, knowledge_base):
@@ -40,18 +69,18 @@ class BehaviorAnalysisAgent:
         
         return relevant_cases[:3]
     
-    def _build_analysis_prompt(self, case_data, laws, cases):
+    def _build_analysis_prompt(self, case_text, laws_text, cases_text):
         prompt = f"""
         作为专业的刑法行为分析专家，请根据以下信息进行行为分析：
         
         案件信息：
-        {case_data}
+        {case_text}
         
         相关法律条文：
-        {self._format_laws(laws)}
+        {laws_text}
         
         相关案例：
-        {self._format_cases(cases)}
+        {cases_text}
         
         请从以下维度进行行为分析：
         
@@ -85,16 +114,10 @@ class BehaviorAnalysisAgent:
         
         return prompt
     
-    def _format_laws(self, laws):
-        formatted = []
-        for law in laws:
-            content = law['content']
-            formatted.append(f"【{content['条文编号']}】{content['条文内容']}\n说明：{content['解释说明']}")
-        return "\n\n".join(formatted)
+    def _format_law(self, law):
+        content = law['content']
+        return f"【{content['条文编号']}】{content['条文内容']}\n说明：{content['解释说明']}"
     
-    def _format_cases(self, cases):
-        formatted = []
-        for case in cases:
-            content = case['content']
-            formatted.append(f"案例{content['案件编号']}：{content['案件概述']}\n判决：{content['判决结果']}")
-        return "\n\n".join(formatted) 
\ No newline at end of file
+    def _format_case(self, case):
+        content = case['content']
+        return f"案例{content['案件编号']}：{content['案件概述']}\n判决：{content['判决结果']}"
\ No newline at end of file
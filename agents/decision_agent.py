@@ -1,28 +1,83 @@
-from utils.helpers import OpenRouterClient
+from utils.helpers import OpenRouterClient, collect_stream
+from utils.async_client import AsyncOpenRouterClient, collect_stream_async
+from utils.prompt_budget import (
+    DECISION_PROMPT_TOKEN_BUDGET, PromptBudget, count_tokens, format_case_data, log_prompt_report
+)
 
 class DecisionAgent:
     def __init__(self, api_key):
         self.client = OpenRouterClient(api_key)
+        self.async_client = AsyncOpenRouterClient(api_key)
+        self.last_prompt_report = None
     
     def make_decision(self, case_data, knowledge_base, subject_analysis, 
-                     behavior_analysis, scenario_analysis, result_analysis):
+                     behavior_analysis, scenario_analysis, result_analysis, on_token=None):
         
-        similar_cases = self._find_similar_cases(knowledge_base)
+        decision_prompt = self._prepare_prompt(
+            case_data, knowledge_base, subject_analysis,
+            behavior_analysis, scenario_analysis, result_analysis
+        )
+        model, temperature, max_tokens = self._model_params()
+        
+        if on_token is None:
+            final_decision = self.client.chat_completion(decision_prompt, model, temperature, max_tokens)
+        else:
+            final_decision = collect_stream(
+                self.client.chat_completion_stream(decision_prompt, model, temperature, max_tokens),
+                on_token
+            )
+        
+        return final_decision
+    
+    async def make_decision_async(self, case_data, knowledge_base, subject_analysis,
+                                  behavior_analysis, scenario_analysis, result_analysis, on_token=None):
         
-        decision_prompt = self._build_decision_prompt(
-            case_data, similar_cases, subject_analysis, 
+        decision_prompt = self._prepare_prompt(
+            case_data, knowledge_base, subject_analysis,
             behavior_analysis, scenario_analysis, result_analysis
         )
+        model, temperature, max_tokens = self._model_params()
+        
+        if on_token is None:
+            return await self.async_client.chat_completion(decision_prompt, model, temperature, max_tokens)
+        return await collect_stream_async(
+            self.async_client.chat_completion_stream(decision_prompt, model, temperature, max_tokens),
+            on_token
+        )
+    
+    def _prepare_prompt(self, case_data, knowledge_base, subject_analysis,
+                        behavior_analysis, scenario_analysis, result_analysis):
+        similar_cases = self._find_similar_cases(knowledge_base)
+        
+        # 分析结论多在末尾，超出预算时保留首尾、省略中间
+        budget = PromptBudget(DECISION_PROMPT_TOKEN_BUDGET)
+        budget.add_text('案件基本信息', format_case_data(case_data), weight=1)
+        budget.add_text('主体分析结果', subject_analysis, weight=1.5, keep_tail=True)
+        budget.add_text('行为分析结果', behavior_analysis, weight=1.5, keep_tail=True)
+        budget.add_text('情节分析结果', scenario_analysis, weight=1.5, keep_tail=True)
+        budget.add_text('结果分析结果', result_analysis, weight=1.5, keep_tail=True)
+        budget.add_items(
+            '类似案例参考',
+            [(self._format_similar_case(case), case['relevance_score']) for case in similar_cases],
+            weight=1,
+            empty_text="暂无高度相似案例"
+        )
+        sections = budget.build(count_tokens(self._build_decision_prompt('', '', '', '', '', '')))
+        self.last_prompt_report = budget.report
+        log_prompt_report("最终决策", budget.report)
         
+        return self._build_decision_prompt(
+            sections['案件基本信息'], sections['类似案例参考'], sections['主体分析结果'],
+            sections['行为分析结果'], sections['情节分析结果'], sections['结果分析结果']
+        )
+    
+    def _model_params(self):
         # 使用配置的模型参数
         model_config = getattr(self.client, 'model_config', {})
         model = model_config.get('model', 'anthropic/claude-3.5-sonnet')
         temperature = model_config.get('temperature', 0.1)
         max_tokens = model_config.get('max_tokens', 4000)
-        
-        final_decision = self.client.chat_completion(decision_prompt, model, temperature, max_tokens)
-        
-        return final_decision
+        return model, temperature, max_tokens
     
     def _find_similar_cases(self, knowledge_base):
         similar_cases = []
@@ -32,14 +87,14 @@ class DecisionAgent:
         
         return similar_cases[:5]
     
-    def _build_decision_prompt(self, case_data, similar_cases, subject_analysis, 
+    def _build_decision_prompt(self, case_text, similar_cases_text, subject_analysis, 
                               behavior_analysis, scenario_analysis, result_analysis):
         
         prompt = f"""
         作为资深的法官和刑法专家，请基于以下所有分析内容，做出最终的定罪量刑决策：
         
         【案件基本信息】
-        {case_data}
+        {case_text}
         
         【主体分析结果】
         {subject_analysis}
@@ -54,7 +109,7 @@ class DecisionAgent:
         {result_analysis}
         
         【类似案例参考】
-        {self._format_similar_cases(similar_cases)}
+        {similar_cases_text}
         
         请按照以下结构提供最终决策：
         
@@ -123,19 +178,12 @@ class DecisionAgent:
         
         return prompt
     
-    def _format_similar_cases(self, cases):
-        if not cases:
-            return "暂无高度相似案例"
-        
-        formatted = []
-        for case in cases:
-            content = case['content']
-            formatted.append(
-                f"【案例{content['案件编号']}】\n"
-                f"案情：{content['案件概述']}\n"
-                f"判决：{content['判决结果']}\n"
-                f"适用条文：{content['适用条文']}\n"
-                f"相似度：{case['relevance_score']:.2f}"
-            )
-        
-        return "\n\n".join(formatted) 
\ No newline at end of file
+    def _format_similar_case(self, case):
+        content = case['content']
+        return (
+            f"【案例{content['案件编号']}】\n"
+            f"案情：{content['案件概述']}\n"
+            f"判决：{content['判决结果']}\n"
+            f"适用条文：{content['适用条文']}\n"
+            f"相似度：{case['relevance_score']:.2f}"
+        )
\ No newline at end of file
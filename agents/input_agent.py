@@ -1,23 +1,63 @@
 import re
 import json
 from utils.helpers import OpenRouterClient
+from utils.async_client import AsyncOpenRouterClient
+from utils.llm_errors import LLMError
+
+def is_fallback_input(processed_input):
+    # 模型输出无法解析时使用的降级结构带有处理状态字段
+    return isinstance(processed_input, dict) and '处理状态' in processed_input
 
 class InputAgent:
     def __init__(self, api_key):
         self.client = OpenRouterClient(api_key)
+        self.async_client = AsyncOpenRouterClient(api_key)
         
     def process_input(self, raw_input):
         cleaned_input = self._clean_text(raw_input)
         structured_input = self._extract_key_information(cleaned_input)
         return structured_input
     
+    async def process_input_async(self, raw_input):
+        cleaned_input = self._clean_text(raw_input)
+        structured_input = await self._extract_key_information_async(cleaned_input)
+        return structured_input
+    
     def _clean_text(self, text):
         text = re.sub(r'\s+', ' ', text.strip())
         text = re.sub(r'[^\u4e00-\u9fff\w\s，。！？；：""''（）【】\-\.]', '', text)
         return text
     
     def _extract_key_information(self, text):
-        prompt = f"""请从以下案件描述中提取关键信息，并按照以下JSON格式输出：
+        prompt = self._build_extraction_prompt(text)
+        
+        try:
+            model, temperature, max_tokens = self._model_params()
+            response = self.client.chat_completion(prompt, model, temperature, max_tokens, cache_check=self._is_cacheable_response)
+        except LLMError:
+            # 鉴权失败、限流重试耗尽等错误交给调用方处理，不能以降级输入继续后续分析
+            raise
+        except Exception as e:
+            return self._fallback_input(text, f"处理异常: {str(e)}")
+        
+        return self._parse_extraction_response(text, response)
+    
+    async def _extract_key_information_async(self, text):
+        prompt = self._build_extraction_prompt(text)
+        
+        try:
+            model, temperature, max_tokens = self._model_params()
+            response = await self.async_client.chat_completion(prompt, model, temperature, max_tokens,
+                                                               cache_check=self._is_cacheable_response)
+        except LLMError:
+            raise
+        except Exception as e:
+            return self._fallback_input(text, f"处理异常: {str(e)}")
+        
+        return self._parse_extraction_response(text, response)
+    
+    def _build_extraction_prompt(self, text):
+        return f"""请从以下案件描述中提取关键信息，并按照以下JSON格式输出：
 
 案件描述：{text}
 
@@ -46,44 +86,34 @@ class InputAgent:
         "特殊情况": "其他需要考虑的特殊情况"
     }}
 }}"""
-        
+    
+    def _model_params(self):
+        # 使用配置的模型参数
+        model_config = getattr(self.client, 'model_config', {})
+        model = model_config.get('model', 'anthropic/claude-3.5-sonnet')
+        temperature = model_config.get('temperature', 0.1)
+        max_tokens = model_config.get('max_tokens', 4000)
+        return model, temperature, max_tokens
+    
+    def _is_cacheable_response(self, response):
+        # 无法解析、会降级为原始输入的响应不缓存，下次重新请求模型
+        return not is_fallback_input(self._parse_extraction_response('', response))
+    
+    def _parse_extraction_response(self, text, response):
         try:
-            # 使用配置的模型参数
-            model_config = getattr(self.client, 'model_config', {})
-            model = model_config.get('model', 'anthropic/claude-3.5-sonnet')
-            temperature = model_config.get('temperature', 0.1)
-            max_tokens = model_config.get('max_tokens', 4000)
-            
-            response = self.client.chat_completion(prompt, model, temperature, max_tokens)
-            
-            if response.startswith("API请求错误") or response.startswith("API响应格式错误") or response.startswith("编码错误") or response.startswith("未知错误"):
-                return {
-                    "原始输入": text,
-                    "处理状态": f"处理失败: {response}",
-                    "主体信息": {"姓名": "未知", "年龄": "未知", "前科情况": "未知", "其他身份特征": ""},
-                    "行为描述": {"主要行为": text[:100], "行为时间": "未知", "行为地点": "未知", "行为方式": ""},
-                    "结果情况": {"直接后果": "待分析", "损失程度": "待分析", "社会影响": "待分析"},
-                    "其他情节": {"从轻情节": "", "从重情节": "", "特殊情况": ""}
-                }
-            
             structured_data = json.loads(response)
             return structured_data
-            
         except json.JSONDecodeError:
-            return {
-                "原始输入": text,
-                "处理状态": "JSON解析失败，使用原始输入",
-                "主体信息": {"姓名": "未知", "年龄": "未知", "前科情况": "未知", "其他身份特征": ""},
-                "行为描述": {"主要行为": text[:100], "行为时间": "未知", "行为地点": "未知", "行为方式": ""},
-                "结果情况": {"直接后果": "待分析", "损失程度": "待分析", "社会影响": "待分析"},
-                "其他情节": {"从轻情节": "", "从重情节": "", "特殊情况": ""}
-            }
+            return self._fallback_input(text, "JSON解析失败，使用原始输入")
         except Exception as e:
-            return {
-                "原始输入": text,
-                "处理状态": f"处理异常: {str(e)}",
-                "主体信息": {"姓名": "未知", "年龄": "未知", "前科情况": "未知", "其他身份特征": ""},
-                "行为描述": {"主要行为": text[:100], "行为时间": "未知", "行为地点": "未知", "行为方式": ""},
-                "结果情况": {"直接后果": "待分析", "损失程度": "待分析", "社会影响": "待分析"},
-                "其他情节": {"从轻情节": "", "从重情节": "", "特殊情况": ""}
-            } 
\ No newline at end of file
+            return self._fallback_input(text, f"处理异常: {str(e)}")
+    
+    def _fallback_input(self, text, status):
+        return {
+            "原始输入": text,
+            "处理状态": status,
+            "主体信息": {"姓名": "未知", "年龄": "未知", "前科情况": "未知", "其他身份特征": ""},
+            "行为描述": {"主要行为": text[:100], "行为时间": "未知", "行为地点": "未知", "行为方式": ""},
+            "结果情况": {"直接后果": "待分析", "损失程度": "待分析", "社会影响": "待分析"},
+            "其他情节": {"从轻情节": "", "从重情节": "", "特殊情况": ""}
+        }
\ No newline at end of file
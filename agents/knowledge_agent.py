@@ -1,196 +1,1034 @@
+import base64
+import hashlib
 import json
 import os
+import re
+import threading
+import time
+from array import array
+from itertools import islice
 import numpy as np
 import faiss
-from sentence_transformers import SentenceTransformer
-from utils.helpers import OpenRouterClient
+from utils.helpers import ARTICLE_NUMERAL_CHARS, OpenRouterClient, ReadWriteLock, get_law_article_number, normalize_law_article_number
+from utils.bm25 import LEXICAL_INDEX_VERSION, BM25Index, reciprocal_rank_fusion
+from utils.corpus_log import CorpusLog
+from utils.corpus_reader import iter_json_records, write_json_records
+from utils.embedding_cache import EmbeddingCache
+from utils.facets import tag_entry
+from utils.lru_cache import LRUCache
+from utils.metadata_store import MetadataStore
+from utils.onnx_encoder import encoder_identity, load_onnx_encoder, onnx_runtime_available
+from utils.parallel_encode import ParallelEncoder, resolve_workers
+from utils.tracing import span, record_cache
+from utils.index_factory import (TYPE_MIN_TRAINING_POINTS, build_manifest, create_index, index_matches_type, manifest_matches, mmap_io_flags,
+                                 recall_latency_report, resolve_index_params, search_index, supports_remove)
 
 # 定义本地模型路径 (如果使用本地模型，请取消注释并设置正确路径)
 # LOCAL_MODEL_PATH = "E:/外快/1 LAWAGENT/local_models/all-MiniLM-L6-v2"
 LOCAL_MODEL_PATH = None # 默认从HuggingFace Hub下载
 
-class KnowledgeAgent:
-    def __init__(self, api_key):
-        self.client = OpenRouterClient(api_key)
-        
-        model_name_or_path = LOCAL_MODEL_PATH if LOCAL_MODEL_PATH and os.path.exists(LOCAL_MODEL_PATH) else 'sentence-transformers/all-MiniLM-L6-v2'
+# 编码器后端: torch(SentenceTransformer) 或 onnx(导出为ONNX后用onnxruntime推理，缺少onnxruntime时回退torch)
+ENCODER_BACKEND = 'torch'
+ONNX_EXPORT_DIR = 'data/onnx_models'
+ONNX_QUANTIZE = True
+# ONNX与PyTorch嵌入的最小余弦相似度，低于该值时不启用ONNX，保证现有索引仍然有效
+ONNX_MIN_COSINE = 0.98
+
+# 法条与案例文件，支持JSON数组或JSONL(每行一个对象)，均为流式读取
+LAWS_PATH = 'data/laws.json'
+CASES_PATH = 'data/cases.json'
+EMBEDDING_CACHE_PATH = 'data/embedding_cache.sqlite'
+
+# 向量索引类型: flat(精确), sq_fp16/sq8(标量量化), pq(乘积量化), ivf_flat, ivf_pq, hnsw
+INDEX_TYPE = 'flat'
+INDEX_PARAMS = {}
+
+QUERY_BATCH_SIZE = 64
+
+# 重建索引时的文档编码: 每批文本数，并行进程数(None为CPU核数，1为单进程)；待编码文本少于阈值时不启用多进程
+ENCODE_BATCH_SIZE = 32
+ENCODE_WORKERS = 1
+PARALLEL_ENCODE_MIN_TEXTS = 1000
+# 流式重建: 每次读取、编码并写入索引的文档数；需要训练的索引类型先缓存该数量的向量用于训练
+INGEST_CHUNK_SIZE = 8192
+INDEX_TRAINING_SAMPLE_SIZE = 65536
+
+# 查询缓存: 条目上限、过期时间(秒, None表示不过期)、是否缓存检索结果
+QUERY_CACHE_SIZE = 1024
+QUERY_CACHE_TTL = 3600
+CACHE_QUERY_RESULTS = True
+
+# 以内存映射方式打开索引文件，多进程共享页缓存
+USE_MMAP_INDEX = True
+
+# 混合检索: BM25词法检索与向量检索按倒数排名融合(RRF)；关闭时不写入BM25倒排表
+HYBRID_RETRIEVAL = True
+HYBRID_CANDIDATE_MULTIPLIER = 3
+RRF_K = 60
+
+ARTICLE_ONLY_RESIDUE_PATTERN = re.compile(rf'刑法|第[{ARTICLE_NUMERAL_CHARS}]+条|[\s，,、。；;和及与]')
+
+# 增量日志累计到该条数后自动合并进主索引
+DELTA_COMPACTION_THRESHOLD = 500
+
+# 法条与案例的修改先组提交到追加式日志，累计到该条数或距上次合并超过该秒数后写回laws/cases文件
+CORPUS_COMPACTION_THRESHOLD = 1000
+CORPUS_COMPACTION_INTERVAL = 3600
+
+_encoder_cache = {}
+_encoder_lock = threading.Lock()
+_shared_agent = None
+_shared_agent_lock = threading.Lock()
+
+def _load_torch_encoder(model_name_or_path):
+    # 调用方需持有_encoder_lock
+    encoder = _encoder_cache.get(model_name_or_path)
+    if encoder is None:
         print(f"加载SentenceTransformer模型: {model_name_or_path}")
         try:
-            self.encoder = SentenceTransformer(model_name_or_path, device='cpu')
+            with span('encoder_load', model=model_name_or_path):
+                from sentence_transformers import SentenceTransformer
+                encoder = SentenceTransformer(model_name_or_path, device='cpu')
         except Exception as e:
             print(f"加载SentenceTransformer模型失败: {e}")
             print("如果网络问题持续，请尝试手动下载模型并配置LOCAL_MODEL_PATH")
             raise
-            
+        _encoder_cache[model_name_or_path] = encoder
+    return encoder
+
+def _load_onnx_encoder(model_name_or_path):
+    # 调用方需持有_encoder_lock；ONNX不可用时返回None
+    cache_key = (model_name_or_path, 'onnx', ONNX_QUANTIZE)
+    encoder = _encoder_cache.get(cache_key)
+    if encoder is not None:
+        return encoder
+    if not onnx_runtime_available():
+        print("警告: 未安装onnxruntime，使用PyTorch编码器")
+        return None
+    try:
+        with span('encoder_load', model=model_name_or_path, backend='onnx'):
+            encoder = load_onnx_encoder(model_name_or_path, ONNX_EXPORT_DIR, ONNX_QUANTIZE, ONNX_MIN_COSINE,
+                                        lambda: _load_torch_encoder(model_name_or_path))
+    except Exception as e:
+        print(f"警告: ONNX编码器不可用，使用PyTorch编码器: {e}")
+        return None
+    _encoder_cache[cache_key] = encoder
+    return encoder
+
+def load_encoder(model_name_or_path, backend=None):
+    with _encoder_lock:
+        if (backend or ENCODER_BACKEND) == 'onnx':
+            encoder = _load_onnx_encoder(model_name_or_path)
+            if encoder is not None:
+                return encoder
+        return _load_torch_encoder(model_name_or_path)
+
+def get_shared_knowledge_agent(api_key=None):
+    global _shared_agent
+    with _shared_agent_lock:
+        if _shared_agent is None:
+            _shared_agent = KnowledgeAgent(api_key)
+            return _shared_agent
+        agent = _shared_agent
+    agent.reload_if_changed()
+    return agent
+
+def _chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def make_doc_id(doc_type, key):
+    digest = hashlib.blake2b(f"{doc_type}:{key}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') & 0x7FFFFFFFFFFFFFFF
+
+def _encode_vector(vector):
+    return base64.b64encode(np.asarray(vector, dtype='float32').tobytes()).decode('ascii')
+
+def _decode_vector(encoded):
+    return np.frombuffer(base64.b64decode(encoded), dtype='float32')
+
+class KnowledgeAgent:
+    def __init__(self, api_key, index_type=None, index_params=None):
+        self.client = OpenRouterClient(api_key)
+        self.index_type = index_type or INDEX_TYPE
+        self.index_params = resolve_index_params(index_params or INDEX_PARAMS)
+        
+        model_name_or_path = LOCAL_MODEL_PATH if LOCAL_MODEL_PATH and os.path.exists(LOCAL_MODEL_PATH) else 'sentence-transformers/all-MiniLM-L6-v2'
+        self.encoder = load_encoder(model_name_or_path)
+        self.model_name = model_name_or_path
+        # 模型名+推理后端与量化方式(ONNX另含导出文件哈希)，嵌入缓存与索引清单据此判断向量能否复用
+        self.encoder_id = encoder_identity(model_name_or_path, self.encoder)
+        
+        try:
+            self.embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, self.encoder_id)
+        except Exception as e:
+            print(f"警告: 嵌入缓存不可用，将每次重新编码: {e}")
+            self.embedding_cache = None
+        
+        self.query_embedding_cache = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+        self.query_result_cache = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+        
         self.index_path = 'data/knowledge_index.faiss'
-        self.metadata_path = 'data/knowledge_metadata.json'
+        self.metadata_base_path = 'data/knowledge_metadata.sqlite'
+        self.metadata_path = self.metadata_base_path
+        self.delta_path = 'data/knowledge_index.delta.jsonl'
+        self.manifest_path = 'data/knowledge_index.manifest.json'
+        self.corpus_log_path = 'data/knowledge_base.wal'
         self.dimension = self.encoder.get_sentence_embedding_dimension()
         
-        self._load_knowledge_base()
-        self._load_or_create_index()
+        self._index_lock = ReadWriteLock()
+        self._write_lock = threading.RLock()
+        self.index_version = 0
+        self._index_mmapped = False
+        self._delta_count = 0
+        self._index_files = None
+        self._data_signature = None
+        self._applied_seq = 0
+        self.last_encode_stats = None
+        self.corpus_log = CorpusLog(self.corpus_log_path, self._prepare_mutations, self._commit_mutations)
+        
+        with self._write_lock:
+            self._load_knowledge_base()
+            self._load_or_create_index()
+            self._data_signature = self._compute_data_signature()
     
-    def _load_or_create_index(self):
-        if os.path.exists(self.index_path) and os.path.exists(self.metadata_path):
+    def _compute_data_signature(self):
+        signature = []
+        for path in (LAWS_PATH, CASES_PATH, self.corpus_log_path, self.index_path, self.manifest_path, self.metadata_path, self.delta_path):
             try:
-                self.index = faiss.read_index(self.index_path)
-                with open(self.metadata_path, 'r', encoding='utf-8') as f:
-                    self.metadata = json.load(f)
-                # 验证维度是否匹配
-                if self.index.d != self.dimension:
-                    print(f"警告: 索引维度 ({self.index.d})与模型嵌入维度 ({self.dimension}) 不匹配. 将重建索引.")
+                stat = os.stat(path)
+                signature.append((path, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append((path, None, None))
+        return tuple(signature)
+    
+    def _index_files_state(self):
+        # 主索引与增量日志的文件标识，与上次记录不同说明其他进程追加过增量日志或合并过主索引
+        state = []
+        for path in (self.index_path, self.delta_path):
+            try:
+                stat = os.stat(path)
+                state.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                state.append(None)
+        return tuple(state)
+    
+    def reload_if_changed(self):
+        if self._compute_data_signature() == self._data_signature:
+            return False
+        with self._write_lock:
+            if self._compute_data_signature() == self._data_signature:
+                return False
+            print("检测到知识库文件变化，重新加载知识库")
+            self.reload()
+            return True
+    
+    def reload(self):
+        with self._write_lock:
+            self._load_knowledge_base()
+            self._load_or_create_index()
+            self._data_signature = self._compute_data_signature()
+    
+    def _set_index(self, index, metadata, mmapped=False):
+        with self._index_lock.write_lock():
+            previous_metadata = getattr(self, 'metadata', None)
+            self.index = index
+            self.metadata = metadata
+            self.bm25_index = BM25Index(metadata) if HYBRID_RETRIEVAL else None
+            self._index_mmapped = mmapped
+            self.index_version += 1
+        if previous_metadata is not None and previous_metadata is not metadata:
+            previous_metadata.close()
+        self.query_result_cache.clear()
+    
+    def _open_index(self, mmap=False, index_type=None):
+        if mmap:
+            return faiss.read_index(self.index_path, mmap_io_flags(index_type or self.index_type))
+        return faiss.read_index(self.index_path)
+    
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+    
+    def _metadata_path_for(self, manifest):
+        # 元数据库每次重建使用新文件名，由清单指向当前文件；旧版清单没有该字段时使用固定文件名
+        name = (manifest or {}).get('metadata_file')
+        return os.path.join(os.path.dirname(self.metadata_base_path), name) if name else self.metadata_base_path
+    
+    def _new_metadata_path(self):
+        root, ext = os.path.splitext(self.metadata_base_path)
+        return f"{root}.{time.time_ns():x}{ext}"
+    
+    def _remove_stale_metadata(self, keep):
+        # 保留当前与上一代元数据库(其他进程可能尚未重新加载)，更早的连同-wal/-shm一并删除
+        directory = os.path.dirname(self.metadata_base_path) or '.'
+        root = os.path.splitext(os.path.basename(self.metadata_base_path))[0]
+        keep = {os.path.basename(path) for path in keep}
+        for name in os.listdir(directory):
+            database = re.sub(r'-(wal|shm|journal)$', '', name)
+            if database.startswith(root) and database.endswith('.sqlite') and database not in keep:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+    
+    def _write_manifest(self, index):
+        manifest = build_manifest(index, self.index_type, self.index_params, model=self.encoder_id, corpus_seq=self._applied_seq,
+                                  metadata_file=os.path.basename(self.metadata_path), lexical_index=self._lexical_manifest())
+        manifest_tmp_path = f"{self.manifest_path}.tmp"
+        with open(manifest_tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        return manifest_tmp_path
+    
+    def _lexical_manifest(self):
+        return {'version': LEXICAL_INDEX_VERSION, 'bm25': HYBRID_RETRIEVAL}
+    
+    def _ensure_lexical_index(self, index, metadata, manifest):
+        # 词法索引与元数据保存在同一个库中；清单中的版本或BM25开关与当前不一致时，从元数据重建词法索引(不重新编码向量)
+        if (manifest or {}).get('lexical_index') == self._lexical_manifest():
+            return
+        print("词法索引版本或配置已变化，从元数据重建BM25与条文号索引")
+        metadata.clear_terms()
+        metadata.clear_articles()
+        for chunk in _chunked(metadata.iter_entries(INGEST_CHUNK_SIZE), INGEST_CHUNK_SIZE):
+            self._update_lexical_index(metadata, [(doc_id, self._entry_text(entry), entry) for doc_id, entry in chunk], replace=False)
+        manifest_tmp_path = self._write_manifest(index)
+        os.replace(manifest_tmp_path, self.manifest_path)
+    
+    def _load_or_create_index(self):
+        # 读取主索引与重放增量日志期间持有知识库日志的文件锁，其他进程不会同时追加或合并
+        with self.corpus_log.locked():
+            manifest = self._read_manifest()
+            self.metadata_path = self._metadata_path_for(manifest)
+            if os.path.exists(self.index_path) and os.path.exists(self.metadata_path):
+                try:
+                    # 清单记录了索引类型、构建参数与模型，不一致时无需读取索引文件即可重建
+                    if manifest is not None and not manifest_matches(manifest, self.index_type, self.index_params,
+                                                                     dimension=self.dimension, model=self.encoder_id):
+                        print(f"索引清单 ({manifest.get('index_type')}) 与当前配置 ({self.index_type}) 或模型不一致，将重建索引")
+                        self.rebuild_index()
+                        return
+                    has_delta = os.path.exists(self.delta_path) and os.path.getsize(self.delta_path) > 0
+                    use_mmap = USE_MMAP_INDEX and not has_delta
+                    index = self._open_index(use_mmap, (manifest or {}).get('effective_type'))
+                    # 验证维度是否匹配
+                    if index.d != self.dimension:
+                        print(f"警告: 索引维度 ({index.d})与模型嵌入维度 ({self.dimension}) 不匹配. 将重建索引.")
+                        self.rebuild_index()
+                        return
+                    if not index_matches_type(index, self.index_type):
+                        print(f"索引类型与配置 ({self.index_type}) 不一致，将重建索引")
+                        self.rebuild_index()
+                        return
+                    
+                    metadata = MetadataStore(self.metadata_path)
+                    self._delta_count, delta_seq = self._replay_delta(index, metadata)
+                    if len(metadata) != index.ntotal:
+                        metadata.close()
+                        print("警告: 索引与元数据不一致，将重建索引")
+                        self.rebuild_index()
+                    else:
+                        self._applied_seq = max((manifest or {}).get('corpus_seq', 0), delta_seq)
+                        self._ensure_lexical_index(index, metadata, manifest)
+                        self._set_index(index, metadata, use_mmap)
+                        self._index_files = self._index_files_state()
+                        print(f"索引已加载: {index.ntotal} 个文档 (增量记录 {self._delta_count} 条{', 内存映射' if use_mmap else ''})")
+                        self._recover_corpus_log()
+                except Exception as e:
+                    print(f"加载索引失败: {e}，将重建索引")
                     self.rebuild_index()
-                else:
-                    print(f"索引已加载: {self.index.ntotal} 个文档")
-            except Exception as e:
-                print(f"加载索引失败: {e}，将重建索引")
-                self.index = faiss.IndexFlatIP(self.dimension)
+            else:
+                print("索引文件不存在或元数据文件不存在，将创建新索引")
                 self.rebuild_index()
-        else:
-            print("索引文件不存在或元数据文件不存在，将创建新索引")
-            self.index = faiss.IndexFlatIP(self.dimension)
-            self.rebuild_index()
     
     def _load_knowledge_base(self):
-        try:
-            with open('data/laws.json', 'r', encoding='utf-8') as f:
-                self.laws_data = json.load(f)
-        except FileNotFoundError:
-            print("警告: data/laws.json 文件不存在，将使用空法律数据")
-            self.laws_data = []
-        except json.JSONDecodeError:
-            print("警告: data/laws.json 文件格式错误，将使用空法律数据")
-            self.laws_data = []
-        
-        try:
-            with open('data/cases.json', 'r', encoding='utf-8') as f:
-                self.cases_data = json.load(f)
-        except FileNotFoundError:
-            print("警告: data/cases.json 文件不存在，将使用空案例数据")
-            self.cases_data = []
-        except json.JSONDecodeError:
-            print("警告: data/cases.json 文件格式错误，将使用空案例数据")
-            self.cases_data = []
+        # 法条与案例文件是快照，之后的增删改记录在追加式日志中；读取时把日志叠加在快照上，不整体载入内存
+        records, last_seq = self.corpus_log.read()
+        self._overlay = self._build_overlay(records)
+        self._overlay_seq = last_seq
     
-    def rebuild_index(self):
-        if not hasattr(self, 'laws_data') or not hasattr(self, 'cases_data'):
-            print("错误: 知识库数据未加载，无法重建索引")
-            return
-        
-        all_texts = []
-        metadata = []
-        
-        for law in self.laws_data:
+    def _build_overlay(self, records):
+        # 文档ID -> (类型, 最新内容)，内容为None表示已删除
+        overlay = {}
+        for record in records:
+            overlay[record['doc_id']] = (record['kind'], record.get('record'))
+        return overlay
+    
+    def _iter_records(self, kind, warn=True, overlay=None):
+        path, label, make_document = (LAWS_PATH, '法律', self._law_document) if kind == 'law' else (CASES_PATH, '案例', self._case_document)
+        overlay = self._overlay if overlay is None else overlay
+        for record in iter_json_records(path, label, warn):
+            # 日志中修改或删除过的条目以日志为准
+            if overlay and isinstance(record, dict) and make_document(record)[0] in overlay:
+                continue
+            yield record
+        for record_kind, record in list(overlay.values()):
+            if record_kind == kind and record is not None:
+                yield record
+    
+    def _iter_laws(self, warn=True):
+        return self._iter_records('law', warn)
+    
+    def _iter_cases(self, warn=True):
+        return self._iter_records('case', warn)
+    
+    def _law_document(self, law):
+        text = f"{law.get('条文编号', '')} {law.get('条文内容', '')} {law.get('解释说明', '')}"
+        key = law.get('条文编号') or hashlib.sha1(text.encode('utf-8')).hexdigest()
+        entry = {
+            'type': 'law',
+            'id': law.get('条文编号', ''),
+            'content': law
+        }
+        return make_doc_id('law', key), text, entry
+    
+    def _case_document(self, case):
+        text = f"{case.get('案件概述', '')} {case.get('判决结果', '')} {case.get('适用条文', '')}"
+        key = case.get('案件编号') or hashlib.sha1(text.encode('utf-8')).hexdigest()
+        entry = {
+            'type': 'case',
+            'id': case.get('案件编号', ''),
+            'content': case
+        }
+        return make_doc_id('case', key), text, entry
+    
+    def _iter_raw_documents(self, warn=True):
+        for law in self._iter_laws(warn):
             if not isinstance(law, dict):
-                print(f"警告: 跳过格式不正确的法律条目: {law}")
+                if warn:
+                    print(f"警告: 跳过格式不正确的法律条目: {law}")
                 continue
-            text = f"{law.get('条文编号', '')} {law.get('条文内容', '')} {law.get('解释说明', '')}"
-            all_texts.append(text)
-            metadata.append({
-                'type': 'law',
-                'id': law.get('条文编号', ''),
-                'content': law
-            })
+            yield self._law_document(law)
         
-        for case in self.cases_data:
+        for case in self._iter_cases(warn):
             if not isinstance(case, dict):
-                print(f"警告: 跳过格式不正确的案例条目: {case}")
+                if warn:
+                    print(f"警告: 跳过格式不正确的案例条目: {case}")
                 continue
-            text = f"{case.get('案件概述', '')} {case.get('判决结果', '')} {case.get('适用条文', '')}"
-            all_texts.append(text)
-            metadata.append({
-                'type': 'case',
-                'id': case.get('案件编号', ''),
-                'content': case
-            })
+            yield self._case_document(case)
+    
+    def _latest_document_mask(self):
+        # 第一遍只读取文档ID(每个文档8字节)，标记同ID条目中最后出现的一条
+        doc_ids = np.frombuffer(array('q', (doc_id for doc_id, _, _ in self._iter_raw_documents(warn=False))), dtype='int64')
+        mask = np.zeros(len(doc_ids), dtype=bool)
+        if len(doc_ids):
+            _, last_from_end = np.unique(doc_ids[::-1], return_index=True)
+            mask[len(doc_ids) - 1 - last_from_end] = True
+        return mask
+    
+    def _iter_documents(self, mask=None):
+        # 同ID条目以后出现的为准；逐条产出，不在内存中保留全部文档
+        mask = self._latest_document_mask() if mask is None else mask
+        for position, document in enumerate(self._iter_raw_documents()):
+            if position < len(mask) and not mask[position]:
+                entry = document[2]
+                print(f"警告: {'法律' if entry['type'] == 'law' else '案例'}条目 {entry['id']} 重复，以后出现的为准")
+                continue
+            yield document
+    
+    def _collect_documents(self):
+        return list(self._iter_documents())
+    
+    def _entry_text(self, entry):
+        # 由元数据条目还原编码与分词所用的文本
+        make_document = self._law_document if entry['type'] == 'law' else self._case_document
+        return make_document(entry['content'])[1]
+    
+    def _update_lexical_index(self, store, upserts=(), delete_ids=(), replace=True):
+        # upserts: [(doc_id, text, entry)]；写入BM25倒排表与条文号索引，重建时replace=False跳过删除旧条文号
+        upserts = list(upserts)
+        delete_ids = list(delete_ids)
+        if HYBRID_RETRIEVAL:
+            bm25_index = BM25Index(store)
+            bm25_index.remove_many(delete_ids)
+            bm25_index.add_many((doc_id, text) for doc_id, text, _ in upserts)
+        articles = [
+            (normalize_law_article_number(article), doc_id)
+            for doc_id, _, entry in upserts if entry['type'] == 'law'
+            for article in get_law_article_number(entry.get('id', ''))
+        ]
+        store.replace_articles(articles, delete_ids + [doc_id for doc_id, _, _ in upserts] if replace else ())
+    
+    def _new_index(self, training_vectors=None):
+        return create_index(self.index_type, self.dimension, training_vectors, self.index_params)
+    
+    def _train_index(self, batches):
+        index = self._new_index(np.vstack([vectors for _, vectors in batches]) if batches else None)
+        for doc_ids, vectors in batches:
+            index.add_with_ids(vectors, doc_ids)
+        return index
+    
+    def _encode_documents(self, texts, show_progress_bar=False, pool=None):
+        if pool is not None and not pool.broken:
+            try:
+                return pool.encode(texts, show_progress=show_progress_bar)
+            except Exception as e:
+                print(f"警告: 多进程编码失败，改为单进程编码: {e}")
+        return self.encoder.encode(texts, batch_size=ENCODE_BATCH_SIZE, show_progress_bar=show_progress_bar)
+    
+    def _encode_texts(self, texts, show_progress_bar=False, pool=None):
+        embeddings = np.zeros((len(texts), self.dimension), dtype='float32')
         
-        if not all_texts:
-            print("警告: 没有可索引的文本数据，索引将为空")
-            self.metadata = []
-            self.index = faiss.IndexFlatIP(self.dimension)
-            os.makedirs('data', exist_ok=True)
-            faiss.write_index(self.index, self.index_path)
-            with open(self.metadata_path, 'w', encoding='utf-8') as f:
-                json.dump(self.metadata, f, ensure_ascii=False, indent=2)
-            print("空的索引已创建.")
-            return
+        cached = self.embedding_cache.get_many(texts) if self.embedding_cache else {}
+        for position, vector in list(cached.items()):
+            if vector.shape[0] == self.dimension:
+                embeddings[position] = vector
+            else:
+                del cached[position]
+        
+        missing_positions = [position for position in range(len(texts)) if position not in cached]
+        if not missing_positions:
+            return embeddings
         
-        print(f"开始编码 {len(all_texts)} 个文档...")
+        missing_texts = [texts[position] for position in missing_positions]
         try:
-            embeddings = self.encoder.encode(all_texts, show_progress_bar=True)
+            encoded = self._encode_documents(missing_texts, show_progress_bar, pool)
         except Exception as e:
             print(f"文本编码失败: {e}")
             print("请检查PyTorch和sentence-transformers的安装以及文本数据.")
-            return
+            return None
+        
+        encoded = np.array(encoded).astype('float32')
+        
+        if encoded.shape[0] > 0 and encoded.shape[1] != self.dimension:
+            print(f"错误: 嵌入维度 ({encoded.shape[1]}) 与模型维度 ({self.dimension}) 不匹配.")
+            return None
+        
+        faiss.normalize_L2(encoded)
+        embeddings[missing_positions] = encoded
+        if self.embedding_cache:
+            self.embedding_cache.put_many(missing_texts, encoded)
+        return embeddings
+    
+    def _publish_base_index(self, index, metadata_tmp_path):
+        index_tmp_path = f"{self.index_path}.tmp"
+        faiss.write_index(index, index_tmp_path)
+        # 新元数据库以新文件名发布: 其他进程仍打开着旧文件及其-wal/-shm，原地替换可能把旧的WAL重放到新库上
+        previous_metadata_path = self.metadata_path
+        metadata_path = self._new_metadata_path()
+        os.replace(metadata_tmp_path, metadata_path)
+        self.metadata_path = metadata_path
+        self._applied_seq = self._overlay_seq
+        manifest_tmp_path = self._write_manifest(index)
+        
+        with self._index_lock.write_lock():
+            previous_metadata = getattr(self, 'metadata', None)
+            if previous_metadata is not None:
+                previous_metadata.close()
+            self.index = None
             
-        embeddings = np.array(embeddings).astype('float32')
+            os.replace(index_tmp_path, self.index_path)
+            os.replace(manifest_tmp_path, self.manifest_path)
+            if os.path.exists(self.delta_path):
+                os.remove(self.delta_path)
+            self._index_files = self._index_files_state()
+            
+            self.index = index
+            self.metadata = MetadataStore(self.metadata_path)
+            self.bm25_index = BM25Index(self.metadata) if HYBRID_RETRIEVAL else None
+            self._index_mmapped = False
+            self._delta_count = 0
+            self.index_version += 1
+        self.query_result_cache.clear()
+        self._remove_stale_metadata((metadata_path, previous_metadata_path))
+    
+    def rebuild_index(self):
+        # 发布新索引时会删除增量日志，重建期间持有文件锁，其他进程的修改等待重建完成后再追加
+        with self._write_lock, self.corpus_log.locked():
+            self._rebuild_index()
+            self._data_signature = self._compute_data_signature()
+    
+    def _rebuild_index(self):
+        if not hasattr(self, '_overlay'):
+            print("错误: 知识库数据未加载，无法重建索引")
+            return
         
-        if embeddings.shape[0] > 0 and embeddings.shape[1] != self.dimension:
-            print(f"错误: 嵌入维度 ({embeddings.shape[1]}) 与模型维度 ({self.dimension}) 不匹配. 索引重建失败.")
+        os.makedirs('data', exist_ok=True)
+        mask = self._latest_document_mask()
+        total = int(mask.sum())
+        if not total:
+            print("警告: 没有可索引的文本数据，索引将为空")
+            metadata_tmp_path = MetadataStore.create_build(self.metadata_base_path).finish_build()
+            self._publish_base_index(self._new_index(), metadata_tmp_path)
+            print("空的索引已创建.")
             return
-            
-        faiss.normalize_L2(embeddings)
         
-        self.index = faiss.IndexFlatIP(self.dimension)
-        self.index.add(embeddings)
+        print(f"开始编码 {total} 个文档...")
+        rebuild_started = time.time()
+        previous_stats = self.embedding_cache.stats() if self.embedding_cache else None
+        workers = resolve_workers(ENCODE_WORKERS) if total >= PARALLEL_ENCODE_MIN_TEXTS else 1
+        pool = ParallelEncoder(self.encoder, workers, ENCODE_BATCH_SIZE) if workers > 1 else None
+        chunk_size = max(INGEST_CHUNK_SIZE, pool.workers * pool.chunk_size) if pool else INGEST_CHUNK_SIZE
+        training_size = INDEX_TRAINING_SAMPLE_SIZE if TYPE_MIN_TRAINING_POINTS.get(self.index_type, 0) else 0
+        
+        # 按块读取、编码并写入索引与元数据，内存占用与块大小相关而与语料规模无关
+        metadata_store = MetadataStore.create_build(self.metadata_base_path)
+        index = None
+        pending = []
+        pending_count = 0
+        done = 0
+        encode_seconds = 0.0
+        try:
+            for chunk in _chunked(self._iter_documents(mask), chunk_size):
+                encode_started = time.perf_counter()
+                embeddings = self._encode_texts([text for _, text, _ in chunk], pool=pool)
+                encode_seconds += time.perf_counter() - encode_started
+                if embeddings is None:
+                    metadata_store.close()
+                    print("索引重建失败.")
+                    return
+                
+                doc_ids = np.array([doc_id for doc_id, _, _ in chunk], dtype='int64')
+                # 主题标签在写入元数据时一次性计算，分析Agent直接按标签过滤
+                metadata_store.upsert_many((doc_id, tag_entry(entry)) for doc_id, _, entry in chunk)
+                # BM25倒排记录与条文号随块写入元数据库，不在内存中累积
+                self._update_lexical_index(metadata_store, chunk, replace=False)
+                done += len(chunk)
+                
+                if index is None:
+                    # 需要训练的索引先积累训练样本，训练后再把缓存的向量加入索引
+                    pending.append((doc_ids, embeddings))
+                    pending_count += len(doc_ids)
+                    if pending_count >= training_size:
+                        index = self._train_index(pending)
+                        pending = []
+                else:
+                    index.add_with_ids(embeddings, doc_ids)
+                print(f"已索引 {done}/{total} 个文档 ({done / encode_seconds if encode_seconds > 0 else 0.0:.1f} 文档/秒)")
+        finally:
+            if pool is not None:
+                pool.close()
+        if index is None:
+            index = self._train_index(pending)
+        
+        self.last_encode_stats = {'documents': done, 'seconds': encode_seconds, 'workers': workers}
+        print(f"编码 {done} 个文档用时 {encode_seconds:.1f}s ({done / encode_seconds if encode_seconds > 0 else 0.0:.1f} 文档/秒, {workers} 进程)")
+        if self.embedding_cache:
+            # 本次重建命中或写入的条目都已刷新使用时间，其余条目对应的文本已不在语料中
+            evicted = self.embedding_cache.evict_unused_since(rebuild_started)
+            stats = self.embedding_cache.stats()
+            print(f"嵌入缓存: 命中 {stats['hits'] - previous_stats['hits']} 个, "
+                  f"新编码 {stats['misses'] - previous_stats['misses']} 个, 清理失效条目 {evicted} 个")
+        
+        self._publish_base_index(index, metadata_store.finish_build())
+        print(f"成功重建索引: {index.ntotal} 个文档")
+    
+    def _replay_delta(self, index, metadata):
+        if not os.path.exists(self.delta_path):
+            return 0, 0
+        
+        final_records = {}
+        count = 0
+        last_seq = 0
+        with open(self.delta_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print("警告: 增量日志末尾存在不完整记录，已忽略")
+                    break
+                final_records[int(record['doc_id'])] = record
+                last_seq = max(last_seq, record.get('seq', 0))
+                count += 1
+        
+        if not final_records:
+            return count, last_seq
+        
+        if supports_remove(index):
+            index.remove_ids(np.array(list(final_records), dtype='int64'))
+        
+        upserts = [(doc_id, record) for doc_id, record in final_records.items() if record['op'] == 'upsert']
+        if upserts:
+            vectors = np.vstack([_decode_vector(record['embedding']) for _, record in upserts])
+            index.add_with_ids(vectors, np.array([doc_id for doc_id, _ in upserts], dtype='int64'))
+            metadata.upsert_many([(doc_id, record['entry']) for doc_id, record in upserts])
+        
+        deleted_ids = [doc_id for doc_id, record in final_records.items() if record['op'] == 'delete']
+        if deleted_ids:
+            metadata.delete_many(deleted_ids)
+        # 词法索引的写入与元数据一样可重复执行，只需重新分词增量日志中的文档
+        self._update_lexical_index(metadata, [(doc_id, self._entry_text(record['entry']), record['entry']) for doc_id, record in upserts],
+                                   deleted_ids)
+        return count, last_seq
+    
+    def _apply_document_changes(self, upserts=(), deletes=(), seq=None):
+        upserts = [(doc_id, text, tag_entry(entry)) for doc_id, text, entry in upserts]
+        delete_ids = list(deletes)
+        touched_ids = delete_ids + [doc_id for doc_id, _, _ in upserts]
+        
+        if not supports_remove(self.index):
+            if any(doc_id in self.metadata for doc_id in touched_ids):
+                print(f"{self.index_type} 索引不支持删除向量，将执行全量重建")
+                self.rebuild_index()
+                return
+        
+        embeddings = None
+        if upserts:
+            embeddings = self._encode_texts([text for _, text, _ in upserts])
+            if embeddings is None:
+                print("增量更新失败，将执行全量重建")
+                self.rebuild_index()
+                return
+        
+        delta_records = [{'op': 'delete', 'doc_id': doc_id} for doc_id in delete_ids]
+        for (doc_id, _, entry), vector in zip(upserts, embeddings if embeddings is not None else []):
+            delta_records.append({
+                'op': 'upsert',
+                'doc_id': doc_id,
+                'entry': entry,
+                'embedding': _encode_vector(vector)
+            })
+        if seq is not None:
+            # 记录对应的知识库日志序号，启动时据此判断日志中哪些修改尚未写入索引
+            for record in delta_records:
+                record['seq'] = seq
         
         os.makedirs('data', exist_ok=True)
-        faiss.write_index(self.index, self.index_path)
+        # 与知识库日志共用文件锁，多个进程的追加不会交错，也不会与合并主索引同时进行
+        with self.corpus_log.locked():
+            unchanged = self._index_files_state() == self._index_files
+            with open(self.delta_path, 'a', encoding='utf-8') as f:
+                for record in delta_records:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            if unchanged:
+                # 其他进程改动过时保留旧记录，合并前据此重新加载
+                self._index_files = self._index_files_state()
+        self._delta_count += len(delta_records)
         
-        with open(self.metadata_path, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, ensure_ascii=False, indent=2)
+        with self._index_lock.write_lock():
+            if self._index_mmapped:
+                # 内存映射的索引是只读的，首次修改前载入内存
+                self.index = self._open_index(mmap=False)
+                self._index_mmapped = False
+            
+            if supports_remove(self.index) and touched_ids:
+                self.index.remove_ids(np.array(touched_ids, dtype='int64'))
+            if delete_ids:
+                self.metadata.delete_many(delete_ids)
+            if upserts:
+                doc_ids = np.array([doc_id for doc_id, _, _ in upserts], dtype='int64')
+                self.index.add_with_ids(embeddings, doc_ids)
+                self.metadata.upsert_many([(doc_id, entry) for doc_id, _, entry in upserts])
+            # 只重新分词被修改的文档，BM25倒排表与条文号索引按文档ID增量更新
+            self._update_lexical_index(self.metadata, upserts, delete_ids)
+            self.index_version += 1
+        self.query_result_cache.clear()
+        if seq is not None:
+            self._applied_seq = max(self._applied_seq, seq)
         
-        self.metadata = metadata
-        print(f"成功重建索引: {self.index.ntotal} 个文档")
+        if self._delta_count >= DELTA_COMPACTION_THRESHOLD:
+            self.compact_index()
+        self._data_signature = self._compute_data_signature()
+    
+    def compact_index(self):
+        with self._write_lock, self.corpus_log.locked():
+            if self._index_files_state() != self._index_files:
+                # 内存中的索引缺少其他进程追加的修改，直接写出会丢失这些修改
+                print("检测到其他进程修改了增量日志或主索引，合并前重新加载")
+                self.reload()
+            if self._delta_count == 0 and not os.path.exists(self.delta_path):
+                return
+            index_tmp_path = f"{self.index_path}.tmp"
+            with self._index_lock.read_lock():
+                faiss.write_index(self.index, index_tmp_path)
+                manifest_tmp_path = self._write_manifest(self.index)
+            os.replace(index_tmp_path, self.index_path)
+            os.replace(manifest_tmp_path, self.manifest_path)
+            if os.path.exists(self.delta_path):
+                os.remove(self.delta_path)
+            self._delta_count = 0
+            # 增量修改产生的小倒排块一并合并，并清除已删除文档的倒排记录
+            with self._index_lock.read_lock():
+                self.metadata.compact_terms()
+            self._index_files = self._index_files_state()
+            self._data_signature = self._compute_data_signature()
+            print(f"增量日志已合并进主索引: {self.index.ntotal} 个文档")
     
-    def retrieve_knowledge(self, query_data, top_k=10):
+    def _apply_corpus_records(self, records):
+        final = {}
+        for record in records:
+            final[record['doc_id']] = record
+        upserts = []
+        deletes = []
+        for doc_id, record in final.items():
+            if record['op'] == 'delete':
+                deletes.append(doc_id)
+            elif record['kind'] == 'law':
+                upserts.append(self._law_document(record['record']))
+            else:
+                upserts.append(self._case_document(record['record']))
+        self._apply_document_changes(upserts=upserts, deletes=deletes, seq=records[-1]['seq'])
+    
+    def _recover_corpus_log(self):
+        # 日志已落盘但进程在写入索引前退出的修改，启动时补写进索引
+        records, _ = self.corpus_log.read()
+        pending = [record for record in records if record['seq'] > self._applied_seq]
+        if pending:
+            print(f"恢复 {len(pending)} 条尚未写入索引的知识库修改")
+            self._apply_corpus_records(pending)
+    
+    def _current_record(self, doc_id):
+        if doc_id in self._overlay:
+            return self._overlay[doc_id][1]
+        with self._index_lock.read_lock():
+            entry = self.metadata.get(doc_id)
+        return entry['content'] if entry else None
+    
+    def _prepare_mutations(self, ops):
+        # 在日志写线程中按到达顺序执行，把修改请求展开为整条记录；同批次中靠后的请求能看到前面请求的结果
+        staged = {}
+        records = []
+        results = []
+        for op in ops:
+            action = op['action']
+            if action == 'add_case':
+                doc_id = self._case_document(op['record'])[0]
+                staged[doc_id] = op['record']
+                records.append({'op': 'upsert', 'kind': 'case', 'doc_id': doc_id, 'record': op['record']})
+                results.append(True)
+                continue
+            
+            kind = 'law' if action == 'update_law' else op['kind']
+            doc_id = make_doc_id(kind, op['key'])
+            current = staged[doc_id] if doc_id in staged else self._current_record(doc_id)
+            if current is None:
+                print(f"警告: 未找到{'法律条文' if kind == 'law' else '案例'} {op['key']}，未做修改")
+                results.append(False)
+                continue
+            
+            if action == 'delete':
+                staged[doc_id] = None
+                records.append({'op': 'delete', 'kind': kind, 'doc_id': doc_id})
+            else:
+                updated = dict(current)
+                updated.update(op['changes'])
+                new_doc_id = self._law_document(updated)[0]
+                if new_doc_id != doc_id:
+                    staged[doc_id] = None
+                    records.append({'op': 'delete', 'kind': 'law', 'doc_id': doc_id})
+                staged[new_doc_id] = updated
+                records.append({'op': 'upsert', 'kind': 'law', 'doc_id': new_doc_id, 'record': updated})
+            results.append(True)
+        return records, results
+    
+    def _commit_mutations(self, records):
+        # 日志记录已落盘: 更新叠加视图，整批修改以一次增量更新写入索引
+        with self._write_lock:
+            overlay = dict(self._overlay)
+            overlay.update(self._build_overlay(records))
+            self._overlay = overlay
+            self._overlay_seq = records[-1]['seq']
+            self._apply_corpus_records(records)
+            if (self.corpus_log.pending_records >= CORPUS_COMPACTION_THRESHOLD
+                    or time.time() - self.corpus_log.last_compaction >= CORPUS_COMPACTION_INTERVAL):
+                self.compact_corpus()
+    
+    def compact_corpus(self):
+        # 把日志中的修改写回laws/cases快照文件后清空日志；快照与当前视图一致，索引不变
+        with self._write_lock:
+            self.reload_if_changed()
+            
+            def write_snapshot(records):
+                overlay = self._build_overlay(records)
+                write_json_records(LAWS_PATH, self._iter_records('law', overlay=overlay))
+                write_json_records(CASES_PATH, self._iter_records('case', overlay=overlay))
+            
+            merged = self.corpus_log.compact(write_snapshot)
+            self._load_knowledge_base()
+            self._data_signature = self._compute_data_signature()
+            if merged:
+                print(f"知识库修改日志已合并进快照文件: {merged} 条")
+    
+    def _query_to_text(self, query_data):
         if isinstance(query_data, dict):
             query_text = self._dict_to_text(query_data)
         else:
             query_text = str(query_data)
+        return " ".join(query_text.split())
+    
+    def _encode_queries(self, query_texts, batch_size=QUERY_BATCH_SIZE):
+        query_embeddings = np.zeros((len(query_texts), self.dimension), dtype='float32')
+        missing_positions = []
+        for position, query_text in enumerate(query_texts):
+            cached = self.query_embedding_cache.get(query_text)
+            record_cache('query_embedding', cached is not None)
+            if cached is None:
+                missing_positions.append(position)
+            else:
+                query_embeddings[position] = cached
         
-        if not hasattr(self, 'index') or not hasattr(self, 'metadata') or self.index.ntotal == 0:
-            print("警告: 知识库索引为空或未初始化")
-            return []
-        
-        query_embedding = self.encoder.encode([query_text])
-        query_embedding = np.array(query_embedding).astype('float32')
-        faiss.normalize_L2(query_embedding)
+        if missing_positions:
+            with span('query_encode', queries=len(missing_positions)):
+                encoded = self.encoder.encode([query_texts[position] for position in missing_positions], batch_size=batch_size)
+            encoded = np.array(encoded).astype('float32')
+            faiss.normalize_L2(encoded)
+            for position, vector in zip(missing_positions, encoded):
+                query_embeddings[position] = vector
+                self.query_embedding_cache.put(query_texts[position], vector)
         
-        k_search = min(top_k, self.index.ntotal)
-        if k_search == 0:
-            return []
+        return query_embeddings
+    
+    def _search_hits(self, query_embeddings, top_k, nprobe, ef_search):
+        with self._index_lock.read_lock():
+            index_version = self.index_version
+            k_search = min(top_k, self.index.ntotal)
+            if k_search == 0:
+                return [[] for _ in range(query_embeddings.shape[0])], index_version
             
-        scores, indices = self.index.search(query_embedding, k_search)
+            scores, doc_ids = search_index(self.index, query_embeddings, k_search, nprobe, ef_search)
         
-        retrieved_knowledge = []
-        for score, idx in zip(scores[0], indices[0]):
-            if 0 <= idx < len(self.metadata):
-                item = self.metadata[idx].copy()
-                item['relevance_score'] = float(score)
-                retrieved_knowledge.append(item)
+        hits = []
+        for row_scores, row_ids in zip(scores, doc_ids):
+            hits.append([(int(doc_id), float(score), {}) for score, doc_id in zip(row_scores, row_ids) if doc_id >= 0])
+        return hits, index_version
+    
+    def _article_hits(self, query_text):
+        hits = []
+        with self._index_lock.read_lock():
+            for article in get_law_article_number(query_text):
+                for doc_id in self.metadata.article_doc_ids(normalize_law_article_number(article)):
+                    if all(doc_id != hit[0] for hit in hits):
+                        hits.append((doc_id, 1.0, {'match_type': 'article'}))
+        return hits
+    
+    def _is_article_only_query(self, query_text):
+        return not ARTICLE_ONLY_RESIDUE_PATTERN.sub('', query_text)
+    
+    def _fuse_hits(self, query_text, dense_hits, article_hits, top_k):
+        lexical_hits = []
+        with self._index_lock.read_lock():
+            # 倒排表在元数据库中，持锁避免检索时元数据库被重建替换
+            if self.bm25_index is not None:
+                lexical_hits = self.bm25_index.search(query_text, top_k * HYBRID_CANDIDATE_MULTIPLIER)
+        dense_scores = {doc_id: score for doc_id, score, _ in dense_hits}
+        bm25_scores = dict(lexical_hits)
+        fused = reciprocal_rank_fusion(
+            [[doc_id for doc_id, _, _ in dense_hits], [doc_id for doc_id, _ in lexical_hits]],
+            RRF_K
+        )
         
-        return retrieved_knowledge
+        hits = list(article_hits)
+        article_ids = {doc_id for doc_id, _, _ in article_hits}
+        for doc_id, fusion_score in fused:
+            if len(hits) >= top_k:
+                break
+            if doc_id in article_ids:
+                continue
+            hits.append((doc_id, dense_scores.get(doc_id, 0.0), {
+                'fusion_score': fusion_score,
+                'bm25_score': bm25_scores.get(doc_id, 0.0)
+            }))
+        return hits[:top_k]
     
-    def add_new_case(self, case_data):
-        self.cases_data.append(case_data)
+    def _hits_to_items(self, hits):
+        items = []
+        with self._index_lock.read_lock():
+            entries = self.metadata.get_many([doc_id for doc_id, _, _ in hits])
+            for doc_id, score, extras in hits:
+                entry = entries.get(doc_id)
+                if entry is not None:
+                    item = entry.copy()
+                    item['relevance_score'] = score
+                    item.update(extras)
+                    items.append(item)
+        return items
+    
+    def retrieve_knowledge(self, query_data, top_k=10, nprobe=None, ef_search=None, hybrid=None):
+        return self.retrieve_knowledge_batch([query_data], top_k, nprobe=nprobe, ef_search=ef_search, hybrid=hybrid)[0]
+    
+    def retrieve_knowledge_batch(self, queries, top_k=10, batch_size=QUERY_BATCH_SIZE, nprobe=None, ef_search=None, hybrid=None):
+        queries = list(queries)
+        if not queries:
+            return []
         
-        os.makedirs('data', exist_ok=True)
-        with open('data/cases.json', 'w', encoding='utf-8') as f:
-            json.dump(self.cases_data, f, ensure_ascii=False, indent=2)
+        if getattr(self, 'index', None) is None or self.index.ntotal == 0:
+            print("警告: 知识库索引为空或未初始化")
+            return [[] for _ in queries]
+        
+        hybrid = HYBRID_RETRIEVAL if hybrid is None else hybrid
+        nprobe = nprobe or self.index_params['nprobe']
+        ef_search = ef_search or self.index_params['ef_search']
+        query_texts = [self._query_to_text(query_data) for query_data in queries]
         
-        self.rebuild_index()
+        all_hits = [None] * len(queries)
+        pending_positions = []
+        for position, query_text in enumerate(query_texts):
+            if CACHE_QUERY_RESULTS:
+                all_hits[position] = self.query_result_cache.get((query_text, top_k, nprobe, ef_search, hybrid, self.index_version))
+                record_cache('query_result', all_hits[position] is not None)
+            if all_hits[position] is not None:
+                continue
+            if hybrid and self._is_article_only_query(query_text):
+                article_hits = self._article_hits(query_text)
+                if article_hits:
+                    all_hits[position] = article_hits[:top_k]
+                    continue
+            pending_positions.append(position)
+        
+        if pending_positions:
+            dense_k = top_k * HYBRID_CANDIDATE_MULTIPLIER if hybrid else top_k
+            query_embeddings = self._encode_queries([query_texts[position] for position in pending_positions], batch_size)
+            with span('vector_search', queries=len(pending_positions)):
+                searched_hits, index_version = self._search_hits(query_embeddings, dense_k, nprobe, ef_search)
+            for position, hits in zip(pending_positions, searched_hits):
+                if hybrid:
+                    query_text = query_texts[position]
+                    hits = self._fuse_hits(query_text, hits, self._article_hits(query_text), top_k)
+                all_hits[position] = hits
+                if CACHE_QUERY_RESULTS:
+                    self.query_result_cache.put((query_texts[position], top_k, nprobe, ef_search, hybrid, index_version), hits)
+        
+        return [self._hits_to_items(hits) for hits in all_hits]
     
-    def update_law_content(self, law_id, new_content):
-        for law in self.laws_data:
-            if law.get('条文编号') == law_id:
-                law.update(new_content)
-                break
+    def query_cache_stats(self):
+        return {
+            'embedding': self.query_embedding_cache.stats(),
+            'result': self.query_result_cache.stats()
+        }
+    
+    def evaluate_index_types(self, configs, queries=None, top_k=10):
+        documents = self._collect_documents()
+        if not documents:
+            print("警告: 知识库为空，无法评估索引")
+            return []
         
-        os.makedirs('data', exist_ok=True)
-        with open('data/laws.json', 'w', encoding='utf-8') as f:
-            json.dump(self.laws_data, f, ensure_ascii=False, indent=2)
+        doc_vectors = self._encode_texts([text for _, text, _ in documents])
+        if doc_vectors is None:
+            return []
         
-        self.rebuild_index()
+        if queries:
+            query_vectors = self._encode_queries([self._query_to_text(query) for query in queries])
+        else:
+            sample_size = min(100, len(documents))
+            positions = np.random.default_rng(0).choice(len(documents), sample_size, replace=False)
+            query_vectors = doc_vectors[positions]
+        
+        return recall_latency_report(doc_vectors, query_vectors, configs, top_k)
+    
+    def add_new_case(self, case_data):
+        # 修改写入日志并生效后返回；并发的修改由日志写线程合并为一次fsync
+        return self.corpus_log.submit({'action': 'add_case', 'record': case_data})
+    
+    def update_law_content(self, law_id, new_content):
+        return self.corpus_log.submit({'action': 'update_law', 'key': law_id, 'changes': dict(new_content)})
+    
+    def delete_case(self, case_id):
+        return self.corpus_log.submit({'action': 'delete', 'kind': 'case', 'key': case_id})
+    
+    def delete_law(self, law_id):
+        return self.corpus_log.submit({'action': 'delete', 'kind': 'law', 'key': law_id})
     
     def _dict_to_text(self, data_dict):
         text_parts = []
@@ -206,4 +1044,4 @@ class KnowledgeAgent:
                 text_parts.append(f"{prefix}{str(obj)}")
         
         extract_text(data_dict)
-        return " ".join(text_parts) 
\ No newline at end of file
+        return " ".join(text_parts)
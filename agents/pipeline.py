@@ -0,0 +1,232 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from agents.analysis_agents.subject_analysis import SubjectAnalysisAgent
+from agents.analysis_agents.behavior_analysis import BehaviorAnalysisAgent
+from agents.analysis_agents.scenario_analysis import ScenarioAnalysisAgent
+from agents.analysis_agents.result_analysis import ResultAnalysisAgent
+from agents.input_agent import InputAgent
+from agents.decision_agent import DecisionAgent
+from utils.llm_errors import LLMError, LLMTimeoutError
+from utils.tracing import current_trace, start_trace, span
+
+ANALYSIS_AGENTS = [
+    ('subject_analysis', '主体分析', SubjectAnalysisAgent),
+    ('behavior_analysis', '行为分析', BehaviorAnalysisAgent),
+    ('scenario_analysis', '情节分析', ScenarioAnalysisAgent),
+    ('result_analysis', '结果分析', ResultAnalysisAgent),
+]
+
+DEFAULT_AGENT_TIMEOUT = 180
+
+class AgentCancelled(Exception):
+    pass
+
+def _failure_message(label, error):
+    return f"分析失败: {label}出现异常 - {str(error)}"
+
+def _timeout_error(label, timeout):
+    return LLMTimeoutError(f"分析超时: {label}超过{timeout}秒未返回")
+
+def _raise_for_failures(failures):
+    # 任一分析Agent失败时不再生成最终决策；优先抛出不可重试的错误(如API Key无效)，其次是限流等重试耗尽的错误
+    if not failures:
+        return
+    errors = [error for _, _, error in failures]
+    llm_errors = [error for error in errors if isinstance(error, LLMError)]
+    error = next((error for error in llm_errors if not error.retryable), None) or (llm_errors or errors)[0]
+    error.stage = 'analysis'
+    error.failures = {key: str(failure) for key, _, failure in failures}
+    raise error
+
+def _run_analysis_agent(key, agent_class, api_key, model_config, processed_input, relevant_knowledge, on_token=None):
+    agent = agent_class(api_key)
+    agent.client.model_config = model_config
+    with span(f'analysis.{key}'):
+        if on_token is None:
+            return agent.analyze(processed_input, relevant_knowledge)
+        return agent.analyze(processed_input, relevant_knowledge, on_token=on_token)
+
+def run_analysis_agents(api_key, model_config, processed_input, relevant_knowledge,
+                        on_complete=None, concurrent=True, timeout=DEFAULT_AGENT_TIMEOUT,
+                        on_token=None, thread_initializer=None):
+    results = {}
+    failures = []
+    # 超时或阶段结束后置位: 被放弃的线程不再回调界面，流式输出在下一个token处中断
+    cancelled = {key: threading.Event() for key, _, _ in ANALYSIS_AGENTS}
+    
+    def token_callback(key, label):
+        if on_token is None:
+            return None
+        
+        def callback(chunk):
+            if cancelled[key].is_set():
+                raise AgentCancelled(key)
+            on_token(key, label, chunk)
+        return callback
+    
+    def finish(key, label, result, error=None):
+        if error is not None:
+            failures.append((key, label, error))
+        results[key] = result
+        if on_complete:
+            on_complete(key, label, result)
+    
+    if not concurrent:
+        for key, label, agent_class in ANALYSIS_AGENTS:
+            try:
+                result = _run_analysis_agent(key, agent_class, api_key, model_config, processed_input,
+                                             relevant_knowledge, token_callback(key, label))
+            except Exception as e:
+                finish(key, label, _failure_message(label, e), e)
+                break
+            finish(key, label, result)
+        _raise_for_failures(failures)
+        return results
+    
+    executor = ThreadPoolExecutor(max_workers=len(ANALYSIS_AGENTS), thread_name_prefix='analysis',
+                                  initializer=thread_initializer)
+    started = {}
+    
+    def run_agent(key, agent_class, callback):
+        if cancelled[key].is_set():
+            raise AgentCancelled(key)
+        started[key] = time.monotonic()
+        return _run_analysis_agent(key, agent_class, api_key, model_config, processed_input, relevant_knowledge, callback)
+    
+    submitted = time.monotonic()
+    futures = {}
+    for key, label, agent_class in ANALYSIS_AGENTS:
+        # 复制上下文，使工作线程中的耗时与token统计记入当前追踪
+        future = executor.submit(contextvars.copy_context().run, run_agent, key, agent_class, token_callback(key, label))
+        futures[future] = (key, label)
+    
+    pending = set(futures)
+    try:
+        while pending:
+            # 每个Agent从开始运行起单独计时，尚未开始的从提交时算起
+            now = time.monotonic()
+            deadlines = {future: started.get(futures[future][0], submitted) + timeout for future in pending}
+            for future in [future for future in pending if deadlines[future] <= now]:
+                key, label = futures[future]
+                cancelled[key].set()
+                future.cancel()
+                pending.discard(future)
+                error = _timeout_error(label, timeout)
+                finish(key, label, error.message, error)
+            if not pending:
+                break
+            
+            done, pending = wait(pending, timeout=min(deadlines[future] for future in pending) - now,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                key, label = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    finish(key, label, _failure_message(label, e), e)
+                    continue
+                finish(key, label, result)
+    finally:
+        for event in cancelled.values():
+            event.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    _raise_for_failures(failures)
+    return results
+
+async def _run_analysis_agent_async(key, agent_class, api_key, model_config, processed_input, relevant_knowledge, on_token=None):
+    agent = agent_class(api_key)
+    agent.client.model_config = model_config
+    with span(f'analysis.{key}'):
+        return await agent.analyze_async(processed_input, relevant_knowledge, on_token=on_token)
+
+async def run_analysis_agents_async(api_key, model_config, processed_input, relevant_knowledge,
+                                    on_complete=None, timeout=DEFAULT_AGENT_TIMEOUT, on_token=None):
+    results = {}
+    failures = []
+    
+    async def run_one(key, label, agent_class):
+        callback = None if on_token is None else (lambda chunk: on_token(key, label, chunk))
+        try:
+            result = await asyncio.wait_for(
+                _run_analysis_agent_async(key, agent_class, api_key, model_config, processed_input,
+                                          relevant_knowledge, callback),
+                timeout
+            )
+        except asyncio.TimeoutError:
+            error = _timeout_error(label, timeout)
+            failures.append((key, label, error))
+            result = error.message
+        except Exception as e:
+            failures.append((key, label, e))
+            result = _failure_message(label, e)
+        results[key] = result
+        if on_complete:
+            on_complete(key, label, result)
+    
+    await asyncio.gather(*(run_one(key, label, agent_class) for key, label, agent_class in ANALYSIS_AGENTS))
+    _raise_for_failures(failures)
+    return results
+
+async def analyze_case_async(api_key, model_config, case_description, knowledge_agent,
+                             on_complete=None, on_token=None, timeout=DEFAULT_AGENT_TIMEOUT, on_stage=None):
+    args = (api_key, model_config, case_description, knowledge_agent, on_complete, on_token, timeout, on_stage)
+    if current_trace() is not None:
+        # 调用方已开启追踪时由调用方汇总
+        return await _analyze_case_async(*args)
+    with start_trace('analyze_case', model=model_config.get('model')) as trace:
+        result = await _analyze_case_async(*args)
+    result['trace'] = trace.summary()
+    return result
+
+async def _analyze_case_async(api_key, model_config, case_description, knowledge_agent,
+                              on_complete, on_token, timeout, on_stage):
+    input_agent = InputAgent(api_key)
+    input_agent.client.model_config = model_config
+    with span('input'):
+        try:
+            processed_input = await input_agent.process_input_async(case_description)
+        except LLMError as e:
+            e.stage = 'input'
+            raise
+    if on_stage:
+        on_stage('processed_input', processed_input)
+    
+    # 向量检索是CPU密集的同步调用，放到线程中避免阻塞事件循环
+    with span('retrieval'):
+        relevant_knowledge = await asyncio.to_thread(knowledge_agent.retrieve_knowledge, processed_input)
+    if on_stage:
+        on_stage('relevant_knowledge', relevant_knowledge)
+    
+    with span('analysis'):
+        analysis_results = await run_analysis_agents_async(
+            api_key, model_config, processed_input, relevant_knowledge,
+            on_complete=on_complete, timeout=timeout, on_token=on_token
+        )
+    
+    if on_stage:
+        on_stage('analysis', analysis_results)
+    
+    decision_agent = DecisionAgent(api_key)
+    decision_agent.client.model_config = model_config
+    decision_callback = None if on_token is None else (lambda chunk: on_token('final_decision', '最终决策', chunk))
+    with span('decision'):
+        final_decision = await decision_agent.make_decision_async(
+            processed_input,
+            relevant_knowledge,
+            analysis_results['subject_analysis'],
+            analysis_results['behavior_analysis'],
+            analysis_results['scenario_analysis'],
+            analysis_results['result_analysis'],
+            on_token=decision_callback
+        )
+    
+    return {
+        'processed_input': processed_input,
+        'relevant_knowledge': relevant_knowledge,
+        **analysis_results,
+        'final_decision': final_decision
+    }
@@ -0,0 +1,318 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Union
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
+from agents.knowledge_agent import get_shared_knowledge_agent
+from agents.pipeline import analyze_case_async
+from utils.async_client import close_shared_http_client
+from utils.llm_errors import LLMError
+from utils.tracing import metrics_payload
+
+# 同时执行的分析任务数，以及排队上限(超出后返回503)
+API_WORKERS = 4
+API_QUEUE_SIZE = 32
+API_DEFAULT_TIMEOUT = 300
+API_MAX_TIMEOUT = 900
+API_RETRIEVE_TIMEOUT = 30
+# 已结束任务保留多久以供轮询(秒)
+API_JOB_TTL = 3600
+API_QUEUE_RETRY_AFTER = 5
+API_STREAM_HEARTBEAT = 15
+
+class RetrieveRequest(BaseModel):
+    query: Union[str, Dict[str, Any]]
+    top_k: int = 10
+    hybrid: Optional[bool] = None
+
+class AnalyzeRequest(BaseModel):
+    case: str
+    model: str = "anthropic/claude-3.5-sonnet"
+    temperature: float = 0.1
+    max_tokens: int = 4000
+    timeout: Optional[float] = None
+    # False时立即返回任务编号，通过 /jobs/{job_id} 轮询结果
+    wait: bool = True
+
+class Job:
+    def __init__(self, request, api_key, stream=False):
+        self.id = uuid.uuid4().hex
+        self.request = request
+        self.api_key = api_key
+        self.timeout = min(request.timeout or API_DEFAULT_TIMEOUT, API_MAX_TIMEOUT)
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.error_detail = None
+        self.done = asyncio.Event()
+        self.events = asyncio.Queue() if stream else None
+        self.task = None
+
+    @property
+    def model_config(self):
+        return {
+            "model": self.request.model,
+            "temperature": self.request.temperature,
+            "max_tokens": self.request.max_tokens
+        }
+
+    def emit(self, event, data=None):
+        if self.events is not None:
+            self.events.put_nowait((event, data))
+
+    def to_dict(self, include_result=True):
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'error': self.error,
+            'error_detail': self.error_detail
+        }
+        if include_result:
+            data['result'] = self.result
+        return data
+
+class JobQueue:
+    def __init__(self, workers=API_WORKERS, max_size=API_QUEUE_SIZE):
+        self.workers = workers
+        self.max_size = max_size
+        self.queue = None
+        self.jobs = {}
+        self.knowledge_agent = None
+        self._worker_tasks = []
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_size)
+        self.knowledge_agent = await asyncio.to_thread(get_shared_knowledge_agent)
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def stats(self):
+        counts = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            'workers': self.workers,
+            'queue_size': self.queue.qsize() if self.queue else 0,
+            'queue_capacity': self.max_size,
+            'jobs': counts
+        }
+
+    def _purge_finished(self):
+        cutoff = time.time() - API_JOB_TTL
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finished_at and job.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    def submit(self, job):
+        self._purge_finished()
+        # 队列满时抛出asyncio.QueueFull，由调用方转换为503
+        self.queue.put_nowait(job)
+        self.jobs[job.id] = job
+        return job
+
+    def cancel(self, job):
+        if job.done.is_set():
+            return False
+        job.status = 'cancelled'
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            self._finish(job)
+        return True
+
+    def _finish(self, job):
+        job.finished_at = time.time()
+        job.done.set()
+        job.emit('end')
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                if job.status != 'cancelled':
+                    await self._run(job)
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job):
+        job.status = 'running'
+        job.started_at = time.time()
+        job.emit('status', {'status': 'running'})
+
+        def on_stage(stage, payload):
+            job.emit('stage', {'stage': stage, 'data': payload})
+
+        def on_complete(key, label, result):
+            job.emit('analysis', {'key': key, 'label': label, 'text': result})
+
+        def on_token(key, label, chunk):
+            job.emit('token', {'key': key, 'label': label, 'text': chunk})
+
+        job.task = asyncio.ensure_future(analyze_case_async(
+            job.api_key,
+            job.model_config,
+            job.request.case,
+            self.knowledge_agent,
+            on_complete=on_complete,
+            on_token=on_token if job.events is not None else None,
+            on_stage=on_stage
+        ))
+        try:
+            job.result = await asyncio.wait_for(job.task, job.timeout)
+            job.status = 'succeeded'
+        except asyncio.TimeoutError:
+            job.status = 'timeout'
+            job.error = f"分析超时: 超过{job.timeout}秒未完成"
+        except asyncio.CancelledError:
+            if job.status != 'cancelled':
+                raise
+            job.error = "任务已取消"
+        except LLMError as e:
+            job.status = 'failed'
+            job.error = e.message
+            # 出错阶段与各分析Agent的失败原因，调用方据此决定是否重试
+            job.error_detail = {'type': type(e).__name__, 'stage': e.stage, 'retryable': e.retryable,
+                                'status_code': e.status_code, 'failures': e.failures}
+        except Exception as e:
+            job.status = 'failed'
+            job.error = f"{type(e).__name__}: {e}"
+        finally:
+            job.task = None
+            self._finish(job)
+
+job_queue = JobQueue()
+
+@asynccontextmanager
+async def lifespan(app):
+    await job_queue.start()
+    try:
+        yield
+    finally:
+        await job_queue.stop()
+        await close_shared_http_client()
+
+app = FastAPI(title="法律领域RAG系统 API", lifespan=lifespan)
+
+def _resolve_api_key(header_key):
+    api_key = header_key or os.environ.get('OPENROUTER_API_KEY')
+    if not api_key:
+        raise HTTPException(status_code=401, detail="缺少OpenRouter API Key，请设置请求头 X-OpenRouter-Api-Key 或服务端环境变量 OPENROUTER_API_KEY")
+    return api_key
+
+def _submit(job):
+    try:
+        return job_queue.submit(job)
+    except asyncio.QueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="分析队列已满，请稍后重试",
+            headers={'Retry-After': str(API_QUEUE_RETRY_AFTER)}
+        )
+
+def _job_response(job):
+    status_codes = {'succeeded': 200, 'timeout': 504, 'failed': 502, 'cancelled': 409}
+    return JSONResponse(job.to_dict(), status_code=status_codes.get(job.status, 200))
+
+@app.get("/health")
+async def health():
+    index = getattr(job_queue.knowledge_agent, 'index', None)
+    return {
+        'status': 'ok',
+        'documents': index.ntotal if index is not None else 0,
+        **job_queue.stats()
+    }
+
+@app.get("/metrics")
+async def metrics():
+    payload, content_type = metrics_payload()
+    if payload is None:
+        raise HTTPException(status_code=404, detail="未安装prometheus_client，指标不可用")
+    return Response(payload, media_type=content_type)
+
+@app.post("/retrieve")
+async def retrieve(request: RetrieveRequest):
+    try:
+        items = await asyncio.wait_for(
+            asyncio.to_thread(job_queue.knowledge_agent.retrieve_knowledge, request.query, request.top_k, hybrid=request.hybrid),
+            API_RETRIEVE_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"检索超时: 超过{API_RETRIEVE_TIMEOUT}秒未完成")
+    return {'items': items}
+
+@app.post("/analyze")
+async def analyze(request: AnalyzeRequest, x_openrouter_api_key: Optional[str] = Header(None)):
+    job = _submit(Job(request, _resolve_api_key(x_openrouter_api_key)))
+    if not request.wait:
+        return JSONResponse(
+            {'job_id': job.id, 'status': job.status, 'status_url': f"/jobs/{job.id}"},
+            status_code=202
+        )
+    await job.done.wait()
+    return _job_response(job)
+
+@app.post("/analyze/stream")
+async def analyze_stream(request: AnalyzeRequest, x_openrouter_api_key: Optional[str] = Header(None)):
+    job = _submit(Job(request, _resolve_api_key(x_openrouter_api_key), stream=True))
+
+    async def event_stream():
+        yield f"event: job\ndata: {json.dumps({'job_id': job.id}, ensure_ascii=False)}\n\n"
+        try:
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(job.events.get(), API_STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if event == 'end':
+                    yield f"event: {job.status}\ndata: {json.dumps(job.to_dict(), ensure_ascii=False)}\n\n"
+                    return
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        finally:
+            # 客户端断开时取消任务，释放工作槽位
+            job_queue.cancel(job)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={'Cache-Control': 'no-cache'})
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return job.to_dict(include_result=job.done.is_set())
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = job_queue.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    job_queue.cancel(job)
+    return job.to_dict(include_result=False)
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser(description="启动法律领域RAG系统的HTTP分析服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+    # 只能单进程运行: 任务队列与知识库索引都在进程内共享
+    uvicorn.run(app, host=args.host, port=args.port, workers=1)
+
+if __name__ == "__main__":
+    main()
@@ -9,17 +9,21 @@ if sys.platform == 'win32':
 
 import streamlit as st
 import json
+import threading
+import time
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from agents.input_agent import InputAgent
-from agents.knowledge_agent import KnowledgeAgent
-from agents.analysis_agents.subject_analysis import SubjectAnalysisAgent
-from agents.analysis_agents.behavior_analysis import BehaviorAnalysisAgent
-from agents.analysis_agents.scenario_analysis import ScenarioAnalysisAgent
-from agents.analysis_agents.result_analysis import ResultAnalysisAgent
+from agents.knowledge_agent import get_shared_knowledge_agent
 from agents.decision_agent import DecisionAgent
+from agents.pipeline import ANALYSIS_AGENTS, run_analysis_agents
 from utils.helpers import OpenRouterClient
+from utils.llm_errors import LLMError, LLMRateLimitError
+from utils.tracing import current_trace, start_trace, span, start_metrics_server
 
 def main():
     st.set_page_config(page_title="法律领域RAG系统", layout="wide")
+    # 设置了LAWAGENT_METRICS_PORT时暴露Prometheus指标
+    start_metrics_server()
     
     st.title("🏛️ 法律领域RAG系统")
     st.subheader("刑法案件智能分析与定罪建议")
@@ -80,6 +84,20 @@ def main():
                 help="生成文本的最大长度"
             )
         
+        parallel_analysis = st.checkbox(
+            "并行执行四个分析Agent",
+            value=True,
+            help="同时发起主体、行为、情节、结果分析，总耗时约等于最慢的一个分析"
+        )
+        st.session_state.parallel_analysis = parallel_analysis
+        
+        stream_output = st.checkbox(
+            "流式显示分析输出",
+            value=True,
+            help="模型生成的内容逐字显示，无需等待整段分析完成"
+        )
+        st.session_state.stream_output = stream_output
+        
         # 显示当前配置
         st.info(f"📋 当前配置:\n模型: {model_name}\n温度: {temperature}\nToken: {max_tokens}")
         
@@ -133,7 +151,7 @@ def main():
                 if openrouter_api_key:
                     try:
                         with st.spinner("正在重建知识库索引..."):
-                            knowledge_agent = KnowledgeAgent(openrouter_api_key)
+                            knowledge_agent = get_shared_knowledge_agent(openrouter_api_key)
                             knowledge_agent.rebuild_index()
                         st.success("✅ 知识库索引重建完成")
                     except Exception as e:
@@ -215,7 +233,8 @@ def main():
         
         if st.button("🚀 开始分析", type="primary"):
             if case_description and openrouter_api_key:
-                analyze_case(case_description, openrouter_api_key, col2)
+                with start_trace('analyze_case'):
+                    analyze_case(case_description, openrouter_api_key, col2)
             elif not case_description:
                 st.error("❌ 请输入案件描述")
             else:
@@ -291,6 +310,21 @@ def test_manual_api(api_key, model_name, temperature, max_tokens):
     except Exception as e:
         st.error(f"❌ 未知错误: {str(e)}")
 
+# 流式输出时两次界面刷新之间的最小间隔(秒)
+STREAM_RENDER_INTERVAL = 0.1
+
+def make_stream_writer(placeholder):
+    state = {'text': '', 'rendered_at': 0.0}
+    
+    def write(chunk):
+        state['text'] += chunk
+        now = time.monotonic()
+        if now - state['rendered_at'] >= STREAM_RENDER_INTERVAL:
+            state['rendered_at'] = now
+            placeholder.markdown(state['text'] + " ▌")
+    
+    return write
+
 def analyze_case(case_description, api_key, result_col):
     with result_col:
         progress_bar = st.progress(0)
@@ -310,59 +344,134 @@ def analyze_case(case_description, api_key, result_col):
             input_agent = InputAgent(api_key)
             # 传递模型配置
             input_agent.client.model_config = model_config
-            processed_input = input_agent.process_input(case_description)
+            with span('input'):
+                processed_input = input_agent.process_input(case_description)
             progress_bar.progress(0.1)
             
             status_text.text("🔍 正在检索知识库...")
-            knowledge_agent = KnowledgeAgent(api_key)
-            relevant_knowledge = knowledge_agent.retrieve_knowledge(processed_input)
+            knowledge_agent = get_shared_knowledge_agent(api_key)
+            with span('retrieval'):
+                relevant_knowledge = knowledge_agent.retrieve_knowledge(processed_input)
             progress_bar.progress(0.3)
             
-            status_text.text("👤 正在进行主体分析...")
-            subject_agent = SubjectAnalysisAgent(api_key)
-            subject_agent.client.model_config = model_config
-            subject_analysis = subject_agent.analyze(processed_input, relevant_knowledge)
-            progress_bar.progress(0.4)
+            stream_output = st.session_state.get('stream_output', True)
+            live_area = st.empty()
+            stream_placeholders = {}
+            decision_placeholder = None
+            if stream_output:
+                with live_area.container():
+                    for key, label, _ in ANALYSIS_AGENTS:
+                        with st.expander(label, expanded=True):
+                            stream_placeholders[key] = st.empty()
+                    st.subheader("🎯 最终决策建议")
+                    decision_placeholder = st.empty()
+            stream_writers = {key: make_stream_writer(placeholder) for key, placeholder in stream_placeholders.items()}
             
-            status_text.text("⚖️ 正在进行行为分析...")
-            behavior_agent = BehaviorAnalysisAgent(api_key)
-            behavior_agent.client.model_config = model_config
-            behavior_analysis = behavior_agent.analyze(processed_input, relevant_knowledge)
-            progress_bar.progress(0.6)
+            def on_analysis_token(key, label, chunk):
+                stream_writers[key](chunk)
             
-            status_text.text("🔍 正在进行情节分析...")
-            scenario_agent = ScenarioAnalysisAgent(api_key)
-            scenario_agent.client.model_config = model_config
-            scenario_analysis = scenario_agent.analyze(processed_input, relevant_knowledge)
-            progress_bar.progress(0.7)
+            # 分析Agent在线程池中运行，需要挂上当前会话的上下文才能刷新界面
+            script_run_ctx = get_script_run_ctx()
             
-            status_text.text("📊 正在进行结果分析...")
-            result_agent = ResultAnalysisAgent(api_key)
-            result_agent.client.model_config = model_config
-            result_analysis = result_agent.analyze(processed_input, relevant_knowledge)
-            progress_bar.progress(0.8)
+            def attach_script_run_ctx():
+                add_script_run_ctx(threading.current_thread(), script_run_ctx)
+            
+            parallel_analysis = st.session_state.get('parallel_analysis', True)
+            if parallel_analysis:
+                status_text.text("🧠 正在并行进行主体、行为、情节、结果分析...")
+            else:
+                status_text.text("🧠 正在依次进行主体、行为、情节、结果分析...")
+            completed_labels = []
+            
+            def on_analysis_complete(key, label, result):
+                completed_labels.append(label)
+                if key in stream_placeholders:
+                    stream_placeholders[key].markdown(result)
+                progress_bar.progress(0.3 + 0.5 * len(completed_labels) / len(ANALYSIS_AGENTS))
+                status_text.text(f"✅ {label}完成 ({len(completed_labels)}/{len(ANALYSIS_AGENTS)})")
+            
+            with span('analysis'):
+                analysis_results = run_analysis_agents(
+                    api_key,
+                    model_config,
+                    processed_input,
+                    relevant_knowledge,
+                    on_complete=on_analysis_complete,
+                    concurrent=parallel_analysis,
+                    on_token=on_analysis_token if stream_output else None,
+                    thread_initializer=attach_script_run_ctx
+                )
+            subject_analysis = analysis_results['subject_analysis']
+            behavior_analysis = analysis_results['behavior_analysis']
+            scenario_analysis = analysis_results['scenario_analysis']
+            result_analysis = analysis_results['result_analysis']
             
             status_text.text("🎯 正在生成最终决策...")
             decision_agent = DecisionAgent(api_key)
             decision_agent.client.model_config = model_config
-            final_decision = decision_agent.make_decision(
-                processed_input,
-                relevant_knowledge,
-                subject_analysis,
-                behavior_analysis,
-                scenario_analysis,
-                result_analysis
-            )
+            with span('decision'):
+                final_decision = decision_agent.make_decision(
+                    processed_input,
+                    relevant_knowledge,
+                    subject_analysis,
+                    behavior_analysis,
+                    scenario_analysis,
+                    result_analysis,
+                    on_token=make_stream_writer(decision_placeholder) if stream_output else None
+                )
             progress_bar.progress(1.0)
+            live_area.empty()
             
             status_text.text("✅ 分析完成！")
-            display_results(final_decision, subject_analysis, behavior_analysis, 
-                          scenario_analysis, result_analysis)
+            with span('render'):
+                display_results(final_decision, subject_analysis, behavior_analysis, 
+                              scenario_analysis, result_analysis)
             
+            trace = current_trace()
+            if trace is not None:
+                display_trace_summary(trace.summary())
+        
+        except LLMRateLimitError as e:
+            st.error(f"❌ 模型调用多次重试后仍被限流: {e.message}")
+            show_failed_agents(e)
+            st.info("💡 请稍后重试，或在OpenRouter控制台确认账户的速率配额")
+        except LLMError as e:
+            st.error(f"❌ 模型调用失败: {e.message}")
+            show_failed_agents(e)
+            st.info("💡 建议检查API Key是否正确，或稍后重试")
         except Exception as e:
             st.error(f"❌ 分析过程中出现错误: {str(e)}")
             st.info("💡 建议检查API Key是否正确，或稍后重试")
 
+def show_failed_agents(error):
+    # 有分析Agent失败时不生成最终决策，列出各Agent的失败原因
+    if not error.failures:
+        return
+    labels = {key: label for key, label, _ in ANALYSIS_AGENTS}
+    st.warning("以下分析未完成，已跳过最终决策:\n" + "\n".join(
+        f"- {labels.get(key, key)}: {message}" for key, message in error.failures.items()
+    ))
+
+def display_trace_summary(summary):
+    with st.expander("⏱️ 性能追踪"):
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("总耗时", f"{summary['total_seconds']:.1f}s")
+        col2.metric("LLM调用", f"{summary['llm_calls']}次", f"缓存 {summary['llm_cached_calls']}次", delta_color="off")
+        col3.metric("Token (提示/生成)", f"{summary['prompt_tokens']}/{summary['completion_tokens']}")
+        col4.metric("缓存命中/重试", f"{summary['cache_hits']}/{summary['retries']}")
+        st.table([
+            {'阶段': stage['stage'], '耗时(秒)': round(stage['seconds'], 3)}
+            for stage in summary['stages']
+        ])
+        if summary.get('prompt_reports'):
+            st.caption("提示词token用量")
+            st.table([
+                {'提示词': report['label'], '章节': name, 'token': section['tokens'], '预算': section['budget'],
+                 '截断/丢弃': f"{int(section.get('truncated', 0))}/{section.get('dropped', 0)}"}
+                for report in summary['prompt_reports']
+                for name, section in report['sections'].items()
+            ])
+
 def display_results(final_decision, subject_analysis, behavior_analysis, 
                    scenario_analysis, result_analysis):
     
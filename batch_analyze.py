@@ -0,0 +1,169 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from agents.input_agent import is_fallback_input
+from agents.knowledge_agent import get_shared_knowledge_agent
+from agents.pipeline import analyze_case_async
+from utils.async_client import close_shared_http_client
+from utils.corpus_reader import iter_json_records
+
+CASE_TEXT_FIELDS = ('case', 'description', '案件描述', 'text')
+CASE_ID_FIELDS = ('id', 'case_id', '案件编号')
+# 每个worker在队列中预读的案件数；读取进度最多领先分析进度 workers * CASE_QUEUE_PER_WORKER 个案件
+CASE_QUEUE_PER_WORKER = 2
+
+def _case_text(record):
+    if isinstance(record, str):
+        return record
+    for field in CASE_TEXT_FIELDS:
+        if record.get(field):
+            return str(record[field])
+    return None
+
+def _case_id(record, text):
+    if isinstance(record, dict):
+        for field in CASE_ID_FIELDS:
+            if record.get(field) not in (None, ''):
+                return str(record[field])
+    # 未提供编号时用内容哈希，保证断点续跑时编号稳定
+    return 'sha-' + hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
+
+def iter_cases(path):
+    # 逐条读取输入文件(JSONL或JSON数组)，不把全部案件读入内存
+    for number, record in enumerate(iter_json_records(path, '案件'), 1):
+        text = _case_text(record)
+        if not text:
+            print(f"警告: 第{number}条记录缺少案件描述字段({'/'.join(CASE_TEXT_FIELDS)})，已跳过")
+            continue
+        yield _case_id(record, text), text
+
+def load_checkpoint(path, retry_failed=True):
+    done = set()
+    if not os.path.exists(path):
+        return done
+
+    with open(path, 'rb+') as f:
+        data = f.read()
+        # 进程崩溃时最后一行可能只写了一半，截断到最后一个完整行
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            print(f"警告: 输出文件末尾存在不完整记录，已截断 {len(data) - end} 字节")
+            f.truncate(end)
+
+    for line in data[:end].decode('utf-8').splitlines():
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if record.get('status') == 'ok' or not retry_failed:
+            done.add(record.get('id'))
+    return done
+
+def _knowledge_refs(relevant_knowledge):
+    return [
+        {'type': item.get('type'), 'id': item.get('id'), 'relevance_score': item.get('relevance_score')}
+        for item in relevant_knowledge
+    ]
+
+async def _analyze_one(case_id, text, api_key, model_config, knowledge_agent, timeout):
+    started = time.perf_counter()
+    try:
+        result = await analyze_case_async(api_key, model_config, text, knowledge_agent, timeout=timeout)
+        result['relevant_knowledge'] = _knowledge_refs(result['relevant_knowledge'])
+        if is_fallback_input(result['processed_input']):
+            # 输入解析降级后的分析基于未结构化的原文，不算成功，续跑时重新分析
+            record = {'id': case_id, 'status': 'error', 'stage': 'input',
+                      'error': f"输入解析失败: {result['processed_input']['处理状态']}", 'result': result}
+        else:
+            record = {'id': case_id, 'status': 'ok', 'result': result}
+    except Exception as e:
+        record = {'id': case_id, 'status': 'error', 'error': f"{type(e).__name__}: {e}"}
+        if getattr(e, 'stage', None):
+            record['stage'] = e.stage
+        if getattr(e, 'failures', None):
+            record['failures'] = e.failures
+    record['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+    return record
+
+async def run_batch(cases, output_path, api_key, model_config, workers, timeout):
+    # cases可以是生成器: 有界队列限制预读数量，固定数量的worker从队列取案件
+    knowledge_agent = get_shared_knowledge_agent(api_key)
+    queue = asyncio.Queue(maxsize=workers * CASE_QUEUE_PER_WORKER)
+    counts = {'ok': 0, 'error': 0}
+
+    async def produce():
+        for case in cases:
+            await queue.put(case)
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def worker(out):
+        while True:
+            case = await queue.get()
+            if case is None:
+                return
+            record = await _analyze_one(*case, api_key, model_config, knowledge_agent, timeout)
+            # 每完成一个案件立即落盘，作为断点续跑的检查点
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+            out.flush()
+            os.fsync(out.fileno())
+
+            counts[record['status']] += 1
+            done_count = counts['ok'] + counts['error']
+            status = '✅' if record['status'] == 'ok' else f"❌ {record['error']}"
+            print(f"[{done_count}] {record['id']} {record['elapsed_seconds']:.1f}s {status}")
+
+    try:
+        with open(output_path, 'a', encoding='utf-8') as out:
+            tasks = [asyncio.create_task(produce())] + [asyncio.create_task(worker(out)) for _ in range(workers)]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                # 读取或写入出错时停止其余任务，避免生产者阻塞在已满的队列上
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        await close_shared_http_client()
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="批量分析JSONL中的案件描述，结果逐条写入JSONL，可断点续跑")
+    parser.add_argument('--input', required=True, help="输入JSONL，每行一个案件，案件描述字段为 case/description/案件描述/text 之一")
+    parser.add_argument('--output', required=True, help="输出JSONL；已存在时跳过其中已成功的案件")
+    parser.add_argument('--api-key', default=os.environ.get('OPENROUTER_API_KEY'), help="缺省读取环境变量 OPENROUTER_API_KEY")
+    parser.add_argument('--model', default='anthropic/claude-3.5-sonnet')
+    parser.add_argument('--temperature', type=float, default=0.1)
+    parser.add_argument('--max-tokens', type=int, default=4000)
+    parser.add_argument('--workers', type=int, default=4, help="同时分析的案件数")
+    parser.add_argument('--timeout', type=float, default=180, help="单个分析Agent的超时秒数")
+    parser.add_argument('--no-retry-failed', action='store_true', help="续跑时不重试输出文件中已失败的案件")
+    args = parser.parse_args()
+
+    if not args.api_key:
+        parser.error("请通过 --api-key 或环境变量 OPENROUTER_API_KEY 提供API Key")
+
+    if not os.path.exists(args.input):
+        parser.error(f"输入文件不存在: {args.input}")
+    done = load_checkpoint(args.output, retry_failed=not args.no_retry_failed)
+    if done:
+        print(f"输出文件中已有 {len(done)} 个已完成案件，将跳过")
+    pending = ((case_id, text) for case_id, text in iter_cases(args.input) if case_id not in done)
+
+    model_config = {
+        "model": args.model,
+        "temperature": args.temperature,
+        "max_tokens": args.max_tokens
+    }
+    counts = asyncio.run(run_batch(pending, args.output, args.api_key, model_config, max(1, args.workers), args.timeout))
+    print(f"完成: 成功 {counts['ok']} 个，失败 {counts['error']} 个，结果已写入 {args.output}")
+    return 1 if counts['error'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+import argparse
+import json
+import sys
+from agents.knowledge_agent import KnowledgeAgent
+
+DEFAULT_CONFIGS = [
+    {'index_type': 'flat'},
+    {'index_type': 'sq_fp16'},
+    {'index_type': 'sq8'},
+    {'index_type': 'pq'},
+    {'index_type': 'ivf_flat', 'nprobe': 1},
+    {'index_type': 'ivf_flat', 'nprobe': 4},
+    {'index_type': 'ivf_flat', 'nprobe': 16},
+    {'index_type': 'ivf_flat', 'nprobe': 64},
+    {'index_type': 'ivf_pq', 'nprobe': 16},
+    {'index_type': 'ivf_pq', 'nprobe': 64},
+    {'index_type': 'hnsw', 'ef_search': 16},
+    {'index_type': 'hnsw', 'ef_search': 64},
+    {'index_type': 'hnsw', 'ef_search': 256},
+]
+
+def load_queries(path):
+    if not path:
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="对比各类向量索引相对精确检索的召回率与延迟")
+    parser.add_argument('--queries', help="查询文本文件，每行一个；缺省时从知识库中抽样文档作为查询")
+    parser.add_argument('--configs', help="索引配置JSON文件（列表），缺省使用内置配置")
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--output', help="将报告写入JSON文件")
+    args = parser.parse_args()
+
+    configs = DEFAULT_CONFIGS
+    if args.configs:
+        with open(args.configs, 'r', encoding='utf-8') as f:
+            configs = json.load(f)
+
+    agent = KnowledgeAgent(None)
+    report = agent.evaluate_index_types(configs, load_queries(args.queries), args.top_k)
+
+    flat_bytes = next((row['index_bytes'] for row in report if row['effective_type'] == 'flat'), None)
+    print(f"{'索引类型':<12}{'实际类型':<12}{'参数':<28}{'召回率':>8}{'平均(ms)':>10}{'P95(ms)':>10}{'构建(s)':>10}{'索引(MB)':>10}{'节省':>8}")
+    for row in report:
+        params = json.dumps(row['params'], ensure_ascii=False)
+        saved = f"{1 - row['index_bytes'] / flat_bytes:>8.1%}" if flat_bytes else f"{'-':>8}"
+        print(f"{row['index_type']:<12}{row['effective_type']:<12}{params:<28}"
+              f"{row['recall']:>8.3f}{row['latency_ms_mean']:>10.3f}{row['latency_ms_p95']:>10.3f}{row['build_seconds']:>10.3f}"
+              f"{row['index_bytes'] / 1024 / 1024:>10.2f}{saved}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已写入 {args.output}")
+
+if __name__ == "__main__":
+    sys.exit(main())
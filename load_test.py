@@ -0,0 +1,221 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import shutil
+import sys
+import time
+import httpx
+import numpy as np
+import utils.async_client as async_client
+import utils.helpers as helpers
+from agents.input_agent import is_fallback_input
+from agents.pipeline import ANALYSIS_AGENTS, analyze_case_async
+from batch_analyze import iter_cases
+from mock_openrouter import add_mock_arguments, settings_from_args, start_mock_server
+from retrieval_benchmark import configure_encoder, generate_queries
+from utils.rate_limit import LLM_MAX_CONCURRENCY, LLM_REQUESTS_PER_MINUTE_PER_KEY, RequestScheduler, set_default_scheduler
+
+DEFAULT_WORKDIR = os.path.join('benchmark_data', 'load_test')
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def _percentiles(values):
+    if not values:
+        return {'count': 0, 'mean': 0.0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+    return {
+        'count': len(values),
+        'mean': float(np.mean(values)),
+        'p50': float(np.percentile(values, 50)),
+        'p95': float(np.percentile(values, 95)),
+        'p99': float(np.percentile(values, 99)),
+        'max': float(np.max(values))
+    }
+
+def prepare_workdir(workdir):
+    # 在独立目录中构建索引与缓存，不影响仓库data目录下的文件
+    data_dir = os.path.join(workdir, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    for name in ('laws.json', 'cases.json'):
+        shutil.copy2(os.path.join(REPO_DIR, 'data', name), os.path.join(data_dir, name))
+    return os.path.abspath(workdir)
+
+async def _mock_request(base_url, method, path):
+    try:
+        async with httpx.AsyncClient(timeout=5) as client:
+            response = await client.request(method, f"{base_url}/mock/{path}")
+            response.raise_for_status()
+            return response.json()
+    except (httpx.HTTPError, ValueError):
+        # 指向真实服务或其他实现时没有统计接口
+        return None
+
+async def _run_case(case_id, text, api_key, model_config, knowledge_agent, agent_timeout):
+    started = time.perf_counter()
+    record = {'id': case_id}
+    try:
+        result = await analyze_case_async(api_key, model_config, text, knowledge_agent, timeout=agent_timeout)
+        record['status'] = 'ok'
+        record['trace'] = result['trace']
+        record['agent_errors'] = []
+        record['input_fallback'] = is_fallback_input(result['processed_input'])
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = type(e).__name__
+        record['message'] = str(e)
+        # 分析阶段失败时异常上带有各Agent的失败信息
+        record['stage'] = getattr(e, 'stage', None)
+        record['agent_errors'] = list(getattr(e, 'failures', None) or [])
+    record['seconds'] = time.perf_counter() - started
+    return record
+
+async def run_level(cases, concurrency, api_key, model_config, knowledge_agent, agent_timeout, base_url):
+    await _mock_request(base_url, 'POST', 'reset')
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def worker(case_id, text):
+        async with semaphore:
+            return await _run_case(case_id, text, api_key, model_config, knowledge_agent, agent_timeout)
+
+    started = time.perf_counter()
+    try:
+        records = await asyncio.gather(*(worker(case_id, text) for case_id, text in cases))
+    finally:
+        await async_client.close_shared_http_client()
+    wall_seconds = time.perf_counter() - started
+    return records, wall_seconds, await _mock_request(base_url, 'GET', 'stats')
+
+def summarize_level(concurrency, records, wall_seconds, mock_stats, scheduler):
+    succeeded = [record for record in records if record['status'] == 'ok']
+    stages = {}
+    for record in succeeded:
+        for stage in record['trace']['stages']:
+            stages.setdefault(stage['stage'], []).append(stage['seconds'])
+
+    errors = {}
+    for record in records:
+        if record['status'] != 'ok':
+            errors[record['error']] = errors.get(record['error'], 0) + 1
+    analyzed = [record for record in records if record['status'] == 'ok' or record.get('stage') == 'analysis']
+    agent_errors = {}
+    for record in analyzed:
+        for key in record['agent_errors']:
+            agent_errors[key] = agent_errors.get(key, 0) + 1
+
+    def trace_total(field):
+        return sum(record['trace'][field] for record in succeeded)
+
+    return {
+        'concurrency': concurrency,
+        'cases': len(records),
+        'succeeded': len(succeeded),
+        'wall_seconds': wall_seconds,
+        'throughput_cases_per_second': len(records) / wall_seconds if wall_seconds > 0 else 0.0,
+        'case_seconds': _percentiles([record['seconds'] for record in succeeded]),
+        'stage_seconds': {stage: _percentiles(values) for stage, values in sorted(stages.items())},
+        'case_error_rate': (len(records) - len(succeeded)) / len(records) if records else 0.0,
+        'case_errors': errors,
+        'agent_error_rate': sum(agent_errors.values()) / (len(analyzed) * len(ANALYSIS_AGENTS)) if analyzed else 0.0,
+        'agent_errors': agent_errors,
+        'input_fallbacks': sum(1 for record in succeeded if record['input_fallback']),
+        'llm_calls': trace_total('llm_calls'),
+        'llm_cached_calls': trace_total('llm_cached_calls'),
+        'prompt_tokens': trace_total('prompt_tokens'),
+        'completion_tokens': trace_total('completion_tokens'),
+        'scheduler': scheduler.stats(),
+        'mock_server': mock_stats
+    }
+
+def print_level(summary):
+    case = summary['case_seconds']
+    print(f"\n并发 {summary['concurrency']}: {summary['succeeded']}/{summary['cases']} 成功，耗时 {summary['wall_seconds']:.1f}s，"
+          f"吞吐 {summary['throughput_cases_per_second']:.2f} 案件/秒，案件P50 {case['p50']:.2f}s / P95 {case['p95']:.2f}s / P99 {case['p99']:.2f}s")
+    print(f"  {'阶段':<28}{'P50(s)':>9}{'P95(s)':>9}{'P99(s)':>9}{'最大(s)':>9}")
+    for stage, values in summary['stage_seconds'].items():
+        print(f"  {stage:<28}{values['p50']:>9.3f}{values['p95']:>9.3f}{values['p99']:>9.3f}{values['max']:>9.3f}")
+    scheduler = summary['scheduler']
+    print(f"  案件失败率 {summary['case_error_rate']:.1%} {summary['case_errors'] or ''}  "
+          f"Agent失败率 {summary['agent_error_rate']:.1%} {summary['agent_errors'] or ''}  输入解析降级 {summary['input_fallbacks']}")
+    print(f"  LLM调用 {summary['llm_calls']} (缓存 {summary['llm_cached_calls']})  token {summary['prompt_tokens']}/{summary['completion_tokens']}  "
+          f"重试 {scheduler['retries']}  429 {scheduler['rate_limited']}  客户端限流等待 {scheduler['throttled_seconds']:.1f}s")
+    if summary['mock_server']:
+        mock = summary['mock_server']
+        print(f"  模拟服务: 请求 {mock['requests']}  429 {mock['rate_limited']}  超时 {mock['timeouts']}  "
+              f"5xx {mock['server_errors']}  最大在途 {mock['max_active']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="以模拟OpenRouter服务驱动完整分析流程，测量吞吐、各阶段尾延迟与错误率")
+    parser.add_argument('--concurrency', default='1,4,16', help="同时分析的案件数，逗号分隔时依次测试各档")
+    parser.add_argument('--cases', type=int, default=20, help="每档并发分析的案件数")
+    parser.add_argument('--input', help="案件JSONL(格式同 batch_analyze.py)；缺省生成合成案件")
+    parser.add_argument('--base-url', help="已启动的模拟服务地址，如 http://127.0.0.1:8100/api/v1；缺省在进程内启动")
+    parser.add_argument('--model', default='mock/model')
+    parser.add_argument('--temperature', type=float, default=0.1)
+    parser.add_argument('--max-tokens', type=int, default=4000)
+    parser.add_argument('--agent-timeout', type=float, default=180, help="单个分析Agent的超时秒数")
+    parser.add_argument('--client-timeout', type=float, default=60, help="HTTP读超时秒数")
+    parser.add_argument('--max-connections', type=int, default=async_client.ASYNC_MAX_CONNECTIONS, help="HTTP连接池上限")
+    parser.add_argument('--llm-concurrency', type=int, default=LLM_MAX_CONCURRENCY, help="同时进行的LLM请求上限，0表示不限")
+    parser.add_argument('--client-rpm', type=int, default=LLM_REQUESTS_PER_MINUTE_PER_KEY, help="客户端每Key每分钟请求上限，0表示不限")
+    parser.add_argument('--llm-cache', action='store_true', help="启用LLM响应缓存(缺省关闭，以测量无缓存时的容量)")
+    parser.add_argument('--encoder', default='hashing', help="检索编码器，取值同 retrieval_benchmark.py")
+    parser.add_argument('--encoder-backend', choices=('torch', 'onnx'), default='torch', help="编码器推理后端")
+    parser.add_argument('--workdir', default=DEFAULT_WORKDIR)
+    parser.add_argument('--output', default='load_test.json', help="结果JSON文件")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server, base_url = start_mock_server(settings_from_args(args))
+        print(f"已在进程内启动OpenRouter模拟服务: {base_url}")
+    base_url = base_url.rstrip('/')
+    helpers.OPENROUTER_BASE_URL = base_url
+    async_client.OPENROUTER_BASE_URL = base_url
+    async_client.ASYNC_TIMEOUT = httpx.Timeout(args.client_timeout, connect=10.0)
+    async_client.ASYNC_MAX_CONNECTIONS = args.max_connections
+    async_client.ASYNC_MAX_KEEPALIVE_CONNECTIONS = min(async_client.ASYNC_MAX_KEEPALIVE_CONNECTIONS, args.max_connections)
+    helpers.LLM_CACHE_ENABLED = args.llm_cache
+    if args.llm_cache:
+        helpers.LLM_CACHE_MAX_TEMPERATURE = async_client.LLM_CACHE_MAX_TEMPERATURE = max(helpers.LLM_CACHE_MAX_TEMPERATURE, args.temperature)
+
+    if args.input:
+        cases = list(itertools.islice(iter_cases(args.input), args.cases))
+    else:
+        cases = [(f"load-{number}", text) for number, text in enumerate(generate_queries(args.cases))]
+
+    output_path = os.path.abspath(args.output)
+    os.chdir(prepare_workdir(args.workdir))
+    knowledge_agent_module = configure_encoder(args.encoder, args.encoder_backend)
+    knowledge_agent = knowledge_agent_module.KnowledgeAgent('mock')
+
+    model_config = {"model": args.model, "temperature": args.temperature, "max_tokens": args.max_tokens}
+    report = {
+        'config': {key: value for key, value in vars(args).items()},
+        'levels': []
+    }
+    report['config']['base_url'] = base_url
+    try:
+        for concurrency in [int(level) for level in args.concurrency.split(',') if level.strip()]:
+            scheduler = set_default_scheduler(RequestScheduler(
+                requests_per_minute_per_key=args.client_rpm or None,
+                max_concurrency=args.llm_concurrency or None
+            ))
+            records, wall_seconds, mock_stats = asyncio.run(run_level(
+                cases, concurrency, 'mock-key', model_config, knowledge_agent, args.agent_timeout, base_url
+            ))
+            summary = summarize_level(concurrency, records, wall_seconds, mock_stats, scheduler)
+            report['levels'].append(summary)
+            print_level(summary)
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+    finally:
+        if server is not None:
+            server.should_exit = True
+
+    print(f"\n结果已写入 {output_path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
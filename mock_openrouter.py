@@ -0,0 +1,276 @@
+import argparse
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from utils.prompt_budget import count_tokens
+
+# 首字节延迟(秒)的均值与标准差，流式输出时相邻两个token的间隔
+MOCK_LATENCY = 0.5
+MOCK_LATENCY_JITTER = 0.2
+MOCK_TOKEN_INTERVAL = 0.01
+MOCK_COMPLETION_TOKENS = 400
+MOCK_CHUNK_TOKENS = 4
+# 故障注入: 429比例、超时比例(挂起不响应)、5xx比例
+MOCK_RATE_LIMIT_RATE = 0.0
+MOCK_TIMEOUT_RATE = 0.0
+MOCK_SERVER_ERROR_RATE = 0.0
+MOCK_HANG_SECONDS = 300
+MOCK_RETRY_AFTER = 1
+# 每个API Key每分钟请求上限，超出返回429(None表示不限制)
+MOCK_REQUESTS_PER_MINUTE = None
+# 流式输出中途以error事件结束的比例(OpenRouter已返回200后在data中报告错误)
+MOCK_STREAM_ERROR_RATE = 0.0
+# 首个事件前发送": OPENROUTER PROCESSING"注释行(心跳)；把每个事件拆成两段发送，检验客户端跨块拼接
+MOCK_STREAM_KEEPALIVE = True
+MOCK_STREAM_FRAGMENT = False
+
+FILLER_TEXT = ("根据案件事实与相关法律规定，行为人的行为符合该罪的构成要件，应当依法承担刑事责任。"
+               "综合考虑其犯罪情节、主观恶性、认罪态度及赔偿谅解等情况，可以在法定刑幅度内酌情从轻处罚。")
+
+class MockSettings:
+    def __init__(self, latency=MOCK_LATENCY, latency_jitter=MOCK_LATENCY_JITTER, token_interval=MOCK_TOKEN_INTERVAL,
+                 completion_tokens=MOCK_COMPLETION_TOKENS, chunk_tokens=MOCK_CHUNK_TOKENS,
+                 rate_limit_rate=MOCK_RATE_LIMIT_RATE, timeout_rate=MOCK_TIMEOUT_RATE,
+                 server_error_rate=MOCK_SERVER_ERROR_RATE, hang_seconds=MOCK_HANG_SECONDS,
+                 retry_after=MOCK_RETRY_AFTER, requests_per_minute=MOCK_REQUESTS_PER_MINUTE,
+                 stream_error_rate=MOCK_STREAM_ERROR_RATE, stream_keepalive=MOCK_STREAM_KEEPALIVE,
+                 stream_fragment=MOCK_STREAM_FRAGMENT, seed=None):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.token_interval = token_interval
+        self.completion_tokens = completion_tokens
+        self.chunk_tokens = max(1, chunk_tokens)
+        self.rate_limit_rate = rate_limit_rate
+        self.timeout_rate = timeout_rate
+        self.server_error_rate = server_error_rate
+        self.hang_seconds = hang_seconds
+        self.retry_after = retry_after
+        self.requests_per_minute = requests_per_minute
+        self.stream_error_rate = stream_error_rate
+        self.stream_keepalive = stream_keepalive
+        self.stream_fragment = stream_fragment
+        self.seed = seed
+
+class MockStats:
+    def __init__(self):
+        self.requests = 0
+        self.streams = 0
+        self.completed = 0
+        self.rate_limited = 0
+        self.timeouts = 0
+        self.server_errors = 0
+        self.stream_errors = 0
+        self.active = 0
+        self.max_active = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+def _extraction_response(prompt):
+    # 输入Agent要求输出JSON，返回结构完整的抽取结果
+    case_text = prompt.split('案件描述：', 1)[-1].split('\n', 1)[0]
+    return json.dumps({
+        "主体信息": {"姓名": case_text[3:5] or "某某", "年龄": "成年", "前科情况": "无前科", "其他身份特征": ""},
+        "行为描述": {"主要行为": case_text[:60], "行为时间": "未知", "行为地点": "未知", "行为方式": ""},
+        "结果情况": {"直接后果": case_text[60:100], "损失程度": "待评估", "社会影响": "一般"},
+        "其他情节": {"从轻情节": "", "从重情节": "", "特殊情况": ""}
+    }, ensure_ascii=False)
+
+def _completion_text(prompt, tokens):
+    if '请输出JSON格式' in prompt:
+        return _extraction_response(prompt)
+    repeats = tokens // len(FILLER_TEXT) + 1
+    return (FILLER_TEXT * repeats)[:tokens]
+
+def _error_response(status_code, message, retry_after=None):
+    headers = {'Retry-After': str(retry_after)} if retry_after is not None else None
+    return JSONResponse({'error': {'message': message, 'code': status_code}}, status_code=status_code, headers=headers)
+
+def create_app(settings=None):
+    settings = settings or MockSettings()
+    stats = MockStats()
+    rng = random.Random(settings.seed)
+    request_times = {}
+    app = FastAPI(title="OpenRouter模拟服务")
+    app.state.settings = settings
+    app.state.stats = stats
+
+    def over_rate_limit(api_key):
+        if not settings.requests_per_minute:
+            return False
+        now = time.monotonic()
+        window = [started for started in request_times.get(api_key, []) if now - started < 60]
+        request_times[api_key] = window
+        if len(window) >= settings.requests_per_minute:
+            return True
+        window.append(now)
+        return False
+
+    @app.get("/api/v1/mock/stats")
+    async def get_stats():
+        return stats.to_dict()
+
+    @app.post("/api/v1/mock/reset")
+    async def reset_stats():
+        stats.__init__()
+        request_times.clear()
+        return stats.to_dict()
+
+    @app.get("/api/v1/models")
+    async def models():
+        return {'data': [{'id': 'mock/model'}]}
+
+    @app.post("/api/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = json.loads((await request.body()).decode('utf-8'))
+        api_key = request.headers.get('authorization', '')
+        stats.requests += 1
+
+        if over_rate_limit(api_key) or rng.random() < settings.rate_limit_rate:
+            stats.rate_limited += 1
+            return _error_response(429, "Rate limit exceeded (mock)", settings.retry_after)
+        if rng.random() < settings.server_error_rate:
+            stats.server_errors += 1
+            return _error_response(503, "Service unavailable (mock)")
+
+        stats.active += 1
+        stats.max_active = max(stats.max_active, stats.active)
+        streaming = False
+        try:
+            if rng.random() < settings.timeout_rate:
+                # 挂起直到客户端超时断开
+                stats.timeouts += 1
+                await asyncio.sleep(settings.hang_seconds)
+                return _error_response(504, "Upstream timeout (mock)")
+            await asyncio.sleep(max(0.0, rng.gauss(settings.latency, settings.latency_jitter)))
+
+            prompt = ''.join(str(message.get('content', '')) for message in body.get('messages', []))
+            text = _completion_text(prompt, min(settings.completion_tokens, int(body.get('max_tokens') or settings.completion_tokens)))
+            usage = {'prompt_tokens': count_tokens(prompt), 'completion_tokens': len(text)}
+            usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+            stats.prompt_tokens += usage['prompt_tokens']
+            stats.completion_tokens += usage['completion_tokens']
+            model = body.get('model', 'mock/model')
+
+            if not body.get('stream'):
+                await asyncio.sleep(settings.token_interval * len(text))
+                stats.completed += 1
+                return JSONResponse({
+                    'id': 'mock', 'model': model,
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+                    'usage': usage
+                })
+
+            fail_at = len(text) // 2 if rng.random() < settings.stream_error_rate else None
+
+            def encode_event(payload):
+                data = f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8')
+                if not settings.stream_fragment:
+                    return [data]
+                # 在事件中间(可能落在多字节字符内)切开
+                middle = len(data) // 2
+                return [data[:middle], data[middle:]]
+
+            async def event_stream():
+                try:
+                    if settings.stream_keepalive:
+                        yield b": OPENROUTER PROCESSING\n\n"
+                    for offset in range(0, len(text), settings.chunk_tokens):
+                        if fail_at is not None and offset >= fail_at:
+                            stats.stream_errors += 1
+                            for part in encode_event({
+                                'id': 'mock', 'model': model, 'error': {'code': 502, 'message': "Upstream provider error (mock)"},
+                                'choices': [{'index': 0, 'delta': {'content': ''}, 'finish_reason': 'error'}]
+                            }):
+                                yield part
+                            return
+                        chunk = text[offset:offset + settings.chunk_tokens]
+                        for part in encode_event({'id': 'mock', 'model': model, 'choices': [{'index': 0, 'delta': {'content': chunk}}]}):
+                            yield part
+                            await asyncio.sleep(0)
+                        await asyncio.sleep(settings.token_interval * len(chunk))
+                    for part in encode_event({'id': 'mock', 'model': model, 'choices': [], 'usage': usage}):
+                        yield part
+                    yield b"data: [DONE]\n\n"
+                    stats.completed += 1
+                finally:
+                    stats.active -= 1
+
+            streaming = True
+            stats.streams += 1
+            return StreamingResponse(event_stream(), media_type="text/event-stream")
+        finally:
+            # 流式响应由生成器结束时计数
+            if not streaming:
+                stats.active -= 1
+
+    return app
+
+def _free_port(host):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+def start_mock_server(settings=None, host='127.0.0.1', port=None):
+    # 在后台线程中启动模拟服务，返回(server, base_url)；用 server.should_exit = True 停止
+    import uvicorn
+    port = port or _free_port(host)
+    server = uvicorn.Server(uvicorn.Config(create_app(settings), host=host, port=port, log_level='warning'))
+    thread = threading.Thread(target=server.run, name='mock-openrouter', daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if not thread.is_alive() or time.monotonic() > deadline:
+            raise RuntimeError("OpenRouter模拟服务启动失败")
+        time.sleep(0.01)
+    return server, f"http://{host}:{port}/api/v1"
+
+def add_mock_arguments(parser):
+    parser.add_argument('--latency', type=float, default=MOCK_LATENCY, help="首字节延迟均值(秒)")
+    parser.add_argument('--latency-jitter', type=float, default=MOCK_LATENCY_JITTER, help="首字节延迟标准差(秒)")
+    parser.add_argument('--token-interval', type=float, default=MOCK_TOKEN_INTERVAL, help="每个token的生成间隔(秒)")
+    parser.add_argument('--completion-tokens', type=int, default=MOCK_COMPLETION_TOKENS, help="每次生成的token数")
+    parser.add_argument('--rate-limit-rate', type=float, default=MOCK_RATE_LIMIT_RATE, help="随机返回429的比例")
+    parser.add_argument('--timeout-rate', type=float, default=MOCK_TIMEOUT_RATE, help="挂起不响应(模拟超时)的比例")
+    parser.add_argument('--server-error-rate', type=float, default=MOCK_SERVER_ERROR_RATE, help="返回503的比例")
+    parser.add_argument('--hang-seconds', type=float, default=MOCK_HANG_SECONDS, help="模拟超时时挂起的秒数")
+    parser.add_argument('--retry-after', type=float, default=MOCK_RETRY_AFTER, help="429响应中的Retry-After(秒)")
+    parser.add_argument('--requests-per-minute', type=int, default=MOCK_REQUESTS_PER_MINUTE, help="每个API Key每分钟请求上限")
+    parser.add_argument('--stream-error-rate', type=float, default=MOCK_STREAM_ERROR_RATE, help="流式输出中途返回error事件的比例")
+    parser.add_argument('--mock-seed', type=int, help="故障注入与延迟的随机种子")
+
+def settings_from_args(args):
+    return MockSettings(
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        token_interval=args.token_interval,
+        completion_tokens=args.completion_tokens,
+        rate_limit_rate=args.rate_limit_rate,
+        timeout_rate=args.timeout_rate,
+        server_error_rate=args.server_error_rate,
+        hang_seconds=args.hang_seconds,
+        retry_after=args.retry_after,
+        requests_per_minute=args.requests_per_minute,
+        stream_error_rate=args.stream_error_rate,
+        seed=args.mock_seed
+    )
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser(description="本地OpenRouter模拟服务，可配置延迟、流式输出、429与超时")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    print(f"设置 OPENROUTER_BASE_URL=http://{args.host}:{args.port}/api/v1 即可让系统使用模拟服务")
+    uvicorn.run(create_app(settings_from_args(args)), host=args.host, port=args.port, log_level='warning')
+
+if __name__ == "__main__":
+    main()
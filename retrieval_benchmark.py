@@ -0,0 +1,469 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import faiss
+from index_report import DEFAULT_CONFIGS
+from utils.hashing_encoder import HashingEncoder
+
+DEFAULT_SIZES = '1k,10k'
+DEFAULT_QUERIES = 200
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_WORKDIR = 'benchmark_data'
+# 法律条文占语料的比例，其余为案例
+LAW_RATIO = 0.1
+
+SURNAMES = "张王李赵刘陈杨黄周吴徐孙马朱胡郭何高林罗"
+CRIMES = [
+    ('故意杀人', '致一人死亡', ['死刑', '无期徒刑', '十年以上有期徒刑']),
+    ('故意伤害', '致人重伤二级', ['三年以上十年以下有期徒刑', '三年以下有期徒刑']),
+    ('盗窃', '窃取财物', ['三年以下有期徒刑', '三年以上十年以下有期徒刑']),
+    ('抢劫', '劫取财物', ['三年以上十年以下有期徒刑', '十年以上有期徒刑']),
+    ('诈骗', '骗取财物', ['三年以下有期徒刑', '十年以上有期徒刑']),
+    ('寻衅滋事', '造成恶劣社会影响', ['五年以下有期徒刑', '拘役']),
+    ('交通肇事', '致一人死亡', ['三年以下有期徒刑', '三年以上七年以下有期徒刑']),
+    ('危险驾驶', '醉酒驾驶机动车', ['拘役']),
+    ('非法拘禁', '限制他人人身自由', ['三年以下有期徒刑', '三年以上十年以下有期徒刑']),
+    ('职务侵占', '侵占单位财物', ['三年以下有期徒刑', '三年以上十年以下有期徒刑']),
+]
+MOTIVES = ['感情纠纷', '经济纠纷', '邻里矛盾', '琐事争执', '贪图钱财', '酒后冲动', '报复心理', '赌博欠债']
+PLACES = ['民宅', '商场', '停车场', '网吧', '工地', '宾馆', '公交车上', '夜市', '小区门口', '公司办公室']
+TOOLS = ['水果刀', '木棍', '铁锤', '砖块', '徒手', '汽车', '手机网络', '伪造的合同']
+MITIGATING = ['自首', '坦白', '积极赔偿', '取得谅解', '初犯', '退赃', '立功', '认罪认罚']
+AGGRAVATING = ['累犯', '持械', '多次作案', '拒不退赃', '手段残忍', '入户']
+
+def parse_size(text):
+    text = text.strip().lower()
+    multiplier = 1
+    if text.endswith('k'):
+        multiplier, text = 1000, text[:-1]
+    elif text.endswith('m'):
+        multiplier, text = 1000000, text[:-1]
+    return int(float(text) * multiplier)
+
+def _case_summary(rng, crime):
+    name, consequence, _ = crime
+    amount = rng.choice([2000, 8000, 30000, 150000, 600000])
+    return (f"被告人{rng.choice(SURNAMES)}某，{rng.choice(['男', '女'])}，{rng.randint(16, 65)}岁，"
+            f"{rng.choice(['无前科', '有前科', '系在校学生', '无业'])}。因{rng.choice(MOTIVES)}，"
+            f"在{rng.choice(PLACES)}使用{rng.choice(TOOLS)}实施{name}行为，{consequence}，涉案金额{amount}元。"
+            f"案发后{rng.choice(['主动投案', '逃离现场', '被当场抓获', '三日后被抓获'])}，"
+            f"{rng.choice(['积极赔偿被害人损失', '拒不赔偿', '部分退赃', '如实供述犯罪事实'])}。")
+
+def generate_corpus(size, seed=0):
+    rng = random.Random(seed)
+    law_count = max(1, int(size * LAW_RATIO))
+    laws = []
+    for number in range(1, law_count + 1):
+        name, consequence, penalties = CRIMES[number % len(CRIMES)]
+        laws.append({
+            '条文编号': f"刑法第{number}条",
+            '条文内容': f"{name}，{consequence}的，处{penalties[0]}；情节{rng.choice(['较轻', '严重', '特别严重'])}的，处{penalties[-1]}。",
+            '解释说明': f"{name}罪是指{rng.choice(MOTIVES)}等原因{consequence}的行为，在{rng.choice(PLACES)}等场所多发，"
+                        f"量刑时应考虑{rng.choice(MITIGATING)}与{rng.choice(AGGRAVATING)}等情节。",
+            '适用范围': name,
+            '量刑档次': penalties,
+            '关键词': [name, consequence]
+        })
+
+    cases = []
+    for number in range(1, size - law_count + 1):
+        crime = rng.choice(CRIMES)
+        cases.append({
+            '案件编号': f"BENCH{number:07d}",
+            '案件概述': _case_summary(rng, crime),
+            '判决结果': f"{crime[0]}罪，{rng.choice(crime[2])}",
+            '适用条文': f"刑法第{rng.randint(1, law_count)}条",
+            '量刑情节': {
+                '从轻情节': rng.sample(MITIGATING, rng.randint(0, 3)),
+                '从重情节': rng.sample(AGGRAVATING, rng.randint(0, 2)),
+                '减轻情节': []
+            },
+            '案件性质': crime[0],
+            '损害后果': crime[1],
+            '犯罪主体': rng.choice(['成年人，初犯', '成年人，累犯', '未成年人']),
+            '社会危害': rng.choice(['较小', '中等', '较大']),
+            '审理法院': "某区人民法院",
+            '判决日期': f"20{rng.randint(15, 24)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        })
+    return laws, cases
+
+def generate_queries(count, seed=0):
+    # 与语料使用不同的随机种子，查询不会与语料中的案例完全相同
+    rng = random.Random(seed + 1000003)
+    return [_case_summary(rng, rng.choice(CRIMES)) for _ in range(count)]
+
+def prepare_corpus(workdir, size, seed):
+    corpus_dir = os.path.join(workdir, f"corpus_{size}")
+    data_dir = os.path.join(corpus_dir, 'data')
+    manifest_path = os.path.join(corpus_dir, 'corpus.json')
+    manifest = {'size': size, 'seed': seed, 'law_ratio': LAW_RATIO}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            if json.load(f) == manifest:
+                return corpus_dir, 0.0
+
+    started = time.perf_counter()
+    os.makedirs(data_dir, exist_ok=True)
+    laws, cases = generate_corpus(size, seed)
+    for name, records in (('laws.json', laws), ('cases.json', cases)):
+        with open(os.path.join(data_dir, name), 'w', encoding='utf-8') as f:
+            json.dump(records, f, ensure_ascii=False)
+    # 语料变化后旧的嵌入缓存与索引都作废
+    for name in os.listdir(data_dir):
+        if name not in ('laws.json', 'cases.json'):
+            os.remove(os.path.join(data_dir, name))
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    return corpus_dir, time.perf_counter() - started
+
+def configure_encoder(encoder, backend='torch'):
+    import agents.knowledge_agent as knowledge_agent
+    os.environ.setdefault('HF_HUB_OFFLINE', '1')
+    os.environ.setdefault('TRANSFORMERS_OFFLINE', '1')
+    knowledge_agent.ENCODER_BACKEND = 'torch' if encoder == 'hashing' else backend
+    # ONNX导出结果放在仓库data目录，各语料目录与多次运行共用
+    knowledge_agent.ONNX_EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), knowledge_agent.ONNX_EXPORT_DIR)
+    if encoder == 'hashing':
+        # 预先放入编码器缓存，KnowledgeAgent不会再加载SentenceTransformer
+        knowledge_agent.LOCAL_MODEL_PATH = None
+        knowledge_agent._encoder_cache['sentence-transformers/all-MiniLM-L6-v2'] = HashingEncoder()
+    elif encoder != 'default':
+        knowledge_agent.LOCAL_MODEL_PATH = os.path.abspath(encoder)
+    return knowledge_agent
+
+def _memory_usage_mb():
+    # (当前RSS, 峰值RSS)，单位MB
+    try:
+        with open('/proc/self/status', 'r') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+        return int(fields['VmRSS'].split()[0]) / 1024, int(fields['VmHWM'].split()[0]) / 1024
+    except (OSError, KeyError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak = peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+    return None, peak
+
+def _file_size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+def _percentiles(values):
+    if not values:
+        return {'mean': 0.0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+    return {
+        'mean': float(np.mean(values)),
+        'p50': float(np.percentile(values, 50)),
+        'p95': float(np.percentile(values, 95)),
+        'p99': float(np.percentile(values, 99))
+    }
+
+def _exact_neighbours(agent, query_embeddings, top_k):
+    cache_path = os.path.join('data', f"exact_top{top_k}_q{query_embeddings.shape[0]}.npy")
+    if os.path.exists(cache_path):
+        return np.load(cache_path)
+    documents = agent._collect_documents()
+    doc_vectors = agent._encode_texts([text for _, text, _ in documents])
+    exact_index = faiss.IndexIDMap(faiss.IndexFlatIP(agent.dimension))
+    exact_index.add_with_ids(doc_vectors, np.array([doc_id for doc_id, _, _ in documents], dtype='int64'))
+    _, exact_ids = exact_index.search(query_embeddings, min(top_k, exact_index.ntotal))
+    np.save(cache_path, exact_ids)
+    return exact_ids
+
+def _clear_query_caches(agent):
+    agent.query_embedding_cache.clear()
+    agent.query_result_cache.clear()
+
+def run_index_benchmark(task):
+    # 在独立子进程中运行，RSS只反映该索引类型
+    os.chdir(task['corpus_dir'])
+    output = None if task['verbose'] else io.StringIO()
+    with contextlib.redirect_stdout(output) if output is not None else contextlib.nullcontext():
+        knowledge_agent = configure_encoder(task['encoder'], task['encoder_backend'])
+        knowledge_agent.CACHE_QUERY_RESULTS = False
+        knowledge_agent.ENCODE_WORKERS = task['encode_workers']
+        knowledge_agent.ENCODE_BATCH_SIZE = task['encode_batch_size']
+        from utils.index_factory import detect_index_type, search_index
+
+        if task['cold']:
+            for name in os.listdir('data'):
+                if name not in ('laws.json', 'cases.json'):
+                    os.remove(os.path.join('data', name))
+        else:
+            for name in os.listdir('data'):
+                if name.startswith(('knowledge_index.', 'knowledge_metadata.')):
+                    os.remove(os.path.join('data', name))
+
+        rss_before, _ = _memory_usage_mb()
+        started = time.perf_counter()
+        agent = knowledge_agent.KnowledgeAgent(None, task['index_type'], task['build_params'])
+        build_seconds = time.perf_counter() - started
+        rss_after_build, _ = _memory_usage_mb()
+
+        result = {
+            'size': task['size'],
+            'index_type': task['index_type'],
+            'effective_type': detect_index_type(agent.index),
+            'build_params': task['build_params'],
+            'cold': task['cold'],
+            'documents': agent.index.ntotal,
+            'dimension': agent.dimension,
+            'build_seconds': build_seconds,
+            'index_bytes': _file_size(agent.index_path),
+            'metadata_bytes': _file_size(agent.metadata_path),
+            'embedding_cache_bytes': _file_size(knowledge_agent.EMBEDDING_CACHE_PATH),
+            'rss_mb_before_build': rss_before,
+            'rss_mb_after_build': rss_after_build,
+            'encode': agent.last_encode_stats,
+            'searches': []
+        }
+        if task['cold']:
+            return result
+
+        queries = task['queries']
+        top_k = task['top_k']
+        batch_size = task['batch_size']
+        query_embeddings = agent._encode_queries(queries)
+        exact_ids = _exact_neighbours(agent, query_embeddings, top_k)
+        k = exact_ids.shape[1]
+
+        for search in task['searches']:
+            nprobe = search.get('nprobe')
+            ef_search = search.get('ef_search')
+
+            single_latencies = []
+            for query in queries:
+                _clear_query_caches(agent)
+                query_started = time.perf_counter()
+                agent.retrieve_knowledge(query, top_k, nprobe=nprobe, ef_search=ef_search, hybrid=task['hybrid'])
+                single_latencies.append((time.perf_counter() - query_started) * 1000)
+
+            batch_latencies = []
+            batch_started = time.perf_counter()
+            for offset in range(0, len(queries), batch_size):
+                _clear_query_caches(agent)
+                query_started = time.perf_counter()
+                agent.retrieve_knowledge_batch(queries[offset:offset + batch_size], top_k, batch_size,
+                                               nprobe=nprobe, ef_search=ef_search, hybrid=task['hybrid'])
+                batch_latencies.append((time.perf_counter() - query_started) * 1000)
+            batch_seconds = time.perf_counter() - batch_started
+
+            _, ids = search_index(agent.index, query_embeddings, k, nprobe, ef_search)
+            hits = sum(len(set(row.tolist()) & set(exact_row.tolist())) for row, exact_row in zip(ids, exact_ids))
+
+            result['searches'].append({
+                'search_params': search,
+                'top_k': k,
+                'recall': hits / (k * len(queries)) if queries else 0.0,
+                'single_latency_ms': _percentiles(single_latencies),
+                'batch_size': batch_size,
+                'batch_latency_ms': _percentiles(batch_latencies),
+                'batch_qps': len(queries) / batch_seconds if batch_seconds > 0 else 0.0
+            })
+
+        result['rss_mb_after_queries'], result['peak_rss_mb'] = _memory_usage_mb()
+        return result
+
+def group_configs(configs):
+    # 同一索引类型与构建参数只构建一次，nprobe/ef_search只影响检索
+    groups = []
+    for config in configs:
+        config = dict(config)
+        index_type = config.pop('index_type', 'flat')
+        search = {key: config.pop(key) for key in ('nprobe', 'ef_search') if key in config}
+        for group in groups:
+            if group['index_type'] == index_type and group['build_params'] == config:
+                group['searches'].append(search)
+                break
+        else:
+            groups.append({'index_type': index_type, 'build_params': config, 'searches': [search]})
+    return groups
+
+def _run_in_subprocess(task):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(run_index_benchmark, task).result()
+
+def _git_revision():
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    try:
+        revision = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=repo_dir, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=repo_dir, capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return revision, dirty
+
+def _search_key(row, search):
+    return (row['size'], row['index_type'], json.dumps(row['build_params'], sort_keys=True), json.dumps(search['search_params'], sort_keys=True))
+
+def compare_reports(baseline, current):
+    baseline_rows = {}
+    for row in baseline['results']:
+        for search in row['searches']:
+            baseline_rows[_search_key(row, search)] = (row, search)
+
+    print(f"\n与基线 {baseline['meta'].get('git_revision') or '?'} 对比:")
+    print(f"{'规模':>9}  {'索引类型':<10}{'参数':<22}{'召回率变化':>10}{'P95变化':>10}{'构建变化':>10}")
+    for row in current['results']:
+        for search in row['searches']:
+            matched = baseline_rows.get(_search_key(row, search))
+            if matched is None:
+                continue
+            base_row, base_search = matched
+            recall_delta = search['recall'] - base_search['recall']
+            p95_ratio = search['single_latency_ms']['p95'] / base_search['single_latency_ms']['p95'] - 1 if base_search['single_latency_ms']['p95'] else 0.0
+            build_ratio = row['build_seconds'] / base_row['build_seconds'] - 1 if base_row['build_seconds'] else 0.0
+            params = json.dumps(search['search_params'], ensure_ascii=False)
+            print(f"{row['size']:>9}  {row['index_type']:<10}{params:<22}{recall_delta:>+10.3f}{p95_ratio:>+10.1%}{build_ratio:>+10.1%}")
+
+def quantization_tradeoffs(rows):
+    # 以同规模flat索引为基准，计算各索引的内存节省与召回损失
+    tradeoffs = []
+    for row in rows:
+        baseline = next((base for base in rows if base['size'] == row['size'] and base['index_type'] == 'flat'), None)
+        if baseline is None or row is baseline or not baseline['index_bytes']:
+            continue
+        base_recall = max(search['recall'] for search in baseline['searches']) if baseline['searches'] else 1.0
+        for search in row['searches']:
+            tradeoffs.append({
+                'size': row['size'],
+                'index_type': row['index_type'],
+                'effective_type': row['effective_type'],
+                'build_params': row['build_params'],
+                'search_params': search['search_params'],
+                'index_bytes': row['index_bytes'],
+                'flat_index_bytes': baseline['index_bytes'],
+                'memory_saved': 1 - row['index_bytes'] / baseline['index_bytes'],
+                'recall_lost': base_recall - search['recall']
+            })
+    return tradeoffs
+
+def print_tradeoffs(tradeoffs):
+    print("\n相对flat索引的内存节省与召回损失:")
+    print(f"{'规模':>9}  {'索引类型':<10}{'参数':<22}{'索引(MB)':>10}{'内存节省':>10}{'召回损失':>10}")
+    for item in tradeoffs:
+        params = json.dumps(item['search_params'], ensure_ascii=False)
+        print(f"{item['size']:>9}  {item['index_type']:<10}{params:<22}{item['index_bytes'] / 1024 / 1024:>10.2f}"
+              f"{item['memory_saved']:>10.1%}{item['recall_lost']:>10.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="在合成法律语料上测试各类索引的构建耗时、磁盘占用、内存、检索延迟与召回率")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help="语料规模，逗号分隔，支持k/m后缀，如 1k,10k,100k,1m")
+    parser.add_argument('--configs', help="索引配置JSON文件（列表），格式同 index_report.py，缺省使用内置配置")
+    parser.add_argument('--queries', type=int, default=DEFAULT_QUERIES, help="每个规模的查询条数")
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="批量检索时每批查询数")
+    parser.add_argument('--encoder', default='hashing',
+                        help="hashing(离线哈希编码器，默认)、default(本地已缓存的默认模型)或本地SentenceTransformer模型目录")
+    parser.add_argument('--encoder-backend', choices=('torch', 'onnx'), default='torch',
+                        help="非hashing编码器的推理后端，onnx需要onnxruntime")
+    parser.add_argument('--encode-workers', type=int, default=1, help="冷启动构建时的编码进程数，0表示CPU核数")
+    parser.add_argument('--encode-batch-size', type=int, default=32, help="文档编码的每批文本数")
+    parser.add_argument('--hybrid', action='store_true', help="检索延迟包含BM25混合检索；召回率始终按向量检索计算")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default=DEFAULT_WORKDIR, help="合成语料与索引的存放目录，相同规模与种子时复用语料")
+    parser.add_argument('--output', default='retrieval_benchmark.json', help="结果JSON文件")
+    parser.add_argument('--compare', help="基线结果JSON文件，输出与基线的差异")
+    parser.add_argument('--verbose', action='store_true', help="显示索引构建过程的输出")
+    args = parser.parse_args()
+
+    configs = DEFAULT_CONFIGS
+    if args.configs:
+        with open(args.configs, 'r', encoding='utf-8') as f:
+            configs = json.load(f)
+    groups = group_configs(configs)
+    sizes = [parse_size(size) for size in args.sizes.split(',') if size.strip()]
+    queries = generate_queries(args.queries, args.seed)
+
+    revision, dirty = _git_revision()
+    report = {
+        'meta': {
+            'git_revision': revision,
+            'git_dirty': dirty,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'faiss': getattr(faiss, '__version__', None),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'encoder': args.encoder,
+            'encoder_backend': args.encoder_backend,
+            'encode_workers': args.encode_workers,
+            'encode_batch_size': args.encode_batch_size,
+            'hybrid': args.hybrid,
+            'seed': args.seed,
+            'queries': args.queries,
+            'top_k': args.top_k,
+            'batch_size': args.batch_size
+        },
+        'corpora': [],
+        'results': [],
+        'tradeoffs': []
+    }
+
+    print(f"{'规模':>9}  {'索引类型':<10}{'实际类型':<10}{'参数':<22}{'构建(s)':>9}{'磁盘(MB)':>10}{'RSS(MB)':>9}"
+          f"{'召回率':>8}{'P50(ms)':>9}{'P95(ms)':>9}{'P99(ms)':>9}{'批量QPS':>10}")
+    for size in sizes:
+        corpus_dir, generate_seconds = prepare_corpus(args.workdir, size, args.seed)
+        base_task = {
+            'size': size,
+            'corpus_dir': os.path.abspath(corpus_dir),
+            'encoder': args.encoder,
+            'encoder_backend': args.encoder_backend,
+            'encode_workers': args.encode_workers or None,
+            'encode_batch_size': args.encode_batch_size,
+            'queries': queries,
+            'top_k': args.top_k,
+            'batch_size': args.batch_size,
+            'hybrid': args.hybrid,
+            'verbose': args.verbose
+        }
+        # 先做一次冷启动构建(含全部文档编码)，之后各索引类型复用嵌入缓存，构建耗时只含索引本身
+        cold = _run_in_subprocess(dict(base_task, index_type='flat', build_params={}, searches=[], cold=True))
+        report['corpora'].append({
+            'size': size,
+            'documents': cold['documents'],
+            'generate_seconds': generate_seconds,
+            'cold_build_seconds': cold['build_seconds'],
+            'encode': cold['encode'],
+            'embedding_cache_bytes': cold['embedding_cache_bytes']
+        })
+        encode = cold['encode'] or {'seconds': 0.0, 'documents': 0, 'workers': 1}
+        print(f"{size:>9}  语料 {cold['documents']} 个文档，冷启动构建(含编码) {cold['build_seconds']:.2f}s，"
+              f"编码 {encode['documents'] / encode['seconds'] if encode['seconds'] > 0 else 0.0:.1f} 文档/秒({encode['workers']} 进程)")
+
+        for group in groups:
+            row = _run_in_subprocess(dict(base_task, cold=False, **group))
+            report['results'].append(row)
+            disk_mb = (row['index_bytes'] + row['metadata_bytes']) / 1024 / 1024
+            rss = row['rss_mb_after_build'] or 0.0
+            for search in row['searches']:
+                params = json.dumps(search['search_params'], ensure_ascii=False)
+                latency = search['single_latency_ms']
+                print(f"{size:>9}  {row['index_type']:<10}{row['effective_type']:<10}{params:<22}{row['build_seconds']:>9.2f}"
+                      f"{disk_mb:>10.2f}{rss:>9.1f}{search['recall']:>8.3f}{latency['p50']:>9.3f}{latency['p95']:>9.3f}"
+                      f"{latency['p99']:>9.3f}{search['batch_qps']:>10.1f}")
+
+        report['tradeoffs'] = quantization_tradeoffs(report['results'])
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print_tradeoffs(report['tradeoffs'])
+    print(f"结果已写入 {args.output}")
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare_reports(json.load(f), report)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+import json
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import agents.knowledge_agent as knowledge_agent
+from utils.hashing_encoder import HashingEncoder
+
+LAWS = [
+    {"条文编号": "刑法第232条", "条文内容": "故意杀人的，处死刑、无期徒刑或者十年以上有期徒刑。", "解释说明": "故意非法剥夺他人生命。"},
+    {"条文编号": "刑法第234条", "条文内容": "故意伤害他人身体的，处三年以下有期徒刑、拘役或者管制。", "解释说明": "故意伤害罪。"},
+    {"条文编号": "刑法第264条", "条文内容": "盗窃公私财物，数额较大的，处三年以下有期徒刑、拘役或者管制。", "解释说明": "盗窃罪。"},
+    {"条文编号": "刑法第67条", "条文内容": "犯罪以后自动投案，如实供述自己的罪行的，是自首。", "解释说明": "自首可以从轻或者减轻处罚。"},
+]
+
+CASES = [
+    {"案件编号": "CASE001", "案件概述": "被告人李某持刀刺伤女友，造成重伤二级，案发后主动报警。", "判决结果": "故意伤害罪，有期徒刑三年", "适用条文": "刑法第234条"},
+    {"案件编号": "CASE002", "案件概述": "被告人张某深夜入户盗窃现金三万元。", "判决结果": "盗窃罪，有期徒刑二年", "适用条文": "刑法第264条"},
+    {"案件编号": "CASE003", "案件概述": "被告人王某因琐事将邻居杀害后投案自首。", "判决结果": "故意杀人罪，有期徒刑十五年", "适用条文": "刑法第232条"},
+]
+
+@pytest.fixture
+def corpus_dir(tmp_path, monkeypatch):
+    # 在临时目录中用离线哈希编码器构建知识库，不读写仓库data目录
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data')
+    for path, records in ((knowledge_agent.LAWS_PATH, LAWS), (knowledge_agent.CASES_PATH, CASES)):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, ensure_ascii=False, indent=2)
+    monkeypatch.setattr(knowledge_agent, 'LOCAL_MODEL_PATH', None)
+    monkeypatch.setattr(knowledge_agent, 'ENCODER_BACKEND', 'torch')
+    monkeypatch.setitem(knowledge_agent._encoder_cache, 'sentence-transformers/all-MiniLM-L6-v2', HashingEncoder())
+    return tmp_path
+
+@pytest.fixture
+def make_agent(corpus_dir):
+    def make(**kwargs):
+        return knowledge_agent.KnowledgeAgent(None, **kwargs)
+    return make
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import pytest
+import batch_analyze
+from utils.llm_errors import LLMAuthError
+
+def write_lines(path, records, tail=''):
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        f.write(tail)
+
+def read_lines(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+def test_iter_cases_uses_id_fields_and_stable_hashes(tmp_path):
+    path = tmp_path / 'cases.jsonl'
+    path.write_text('{"id": 7, "case": "张某盗窃"}\n不是JSON\n{"text": "李某伤人"}\n{"id": "x"}\n', encoding='utf-8')
+
+    cases = list(batch_analyze.iter_cases(str(path)))
+    assert cases[0] == ('7', '张某盗窃')
+    assert cases[1][0].startswith('sha-') and cases[1][1] == '李某伤人'
+    assert len(cases) == 2
+    assert list(batch_analyze.iter_cases(str(path))) == cases
+
+    array_path = tmp_path / 'cases.json'
+    array_path.write_text('[{"id": 7, "case": "张某盗窃"}, {"text": "李某伤人"}]', encoding='utf-8')
+    assert list(batch_analyze.iter_cases(str(array_path))) == cases
+
+def test_checkpoint_truncates_torn_last_line(tmp_path):
+    path = tmp_path / 'out.jsonl'
+    write_lines(path, [{'id': 'a', 'status': 'ok'}], tail='{"id": "b", "sta')
+
+    assert batch_analyze.load_checkpoint(str(path)) == {'a'}
+    assert path.read_text(encoding='utf-8').endswith('"ok"}\n')
+
+def test_checkpoint_retries_failed_cases_unless_disabled(tmp_path):
+    path = tmp_path / 'out.jsonl'
+    write_lines(path, [{'id': 'a', 'status': 'ok'}, {'id': 'b', 'status': 'error'}])
+
+    assert batch_analyze.load_checkpoint(str(path)) == {'a'}
+    assert batch_analyze.load_checkpoint(str(path), retry_failed=False) == {'a', 'b'}
+    assert batch_analyze.load_checkpoint(str(tmp_path / 'missing.jsonl')) == set()
+
+@pytest.fixture
+def fake_pipeline(monkeypatch):
+    # 按案件文本决定分析结果: 含"降级"时输入解析降级，含"失败"时分析阶段抛出错误
+    async def analyze_case_async(api_key, model_config, text, knowledge_agent, timeout=None):
+        if '失败' in text:
+            error = LLMAuthError('API Key无效', 401)
+            error.stage = 'analysis'
+            error.failures = {'subject_analysis': 'API Key无效'}
+            raise error
+        processed_input = {'原始输入': text, '处理状态': 'JSON解析失败，使用原始输入'} if '降级' in text else {'案件描述': text}
+        return {'processed_input': processed_input, 'relevant_knowledge': [{'type': 'law', 'id': 'L1', 'relevance_score': 0.9, 'content': '...'}],
+                'final_decision': '决策'}
+    monkeypatch.setattr(batch_analyze, 'analyze_case_async', analyze_case_async)
+    monkeypatch.setattr(batch_analyze, 'get_shared_knowledge_agent', lambda api_key: None)
+
+def test_run_batch_records_status_per_case(tmp_path, fake_pipeline):
+    path = str(tmp_path / 'out.jsonl')
+    cases = [('ok', '张某盗窃'), ('fallback', '降级案件'), ('failed', '失败案件')]
+
+    counts = asyncio.run(batch_analyze.run_batch(cases, path, 'key', {}, 2, 1))
+    assert counts == {'ok': 1, 'error': 2}
+
+    records = {record['id']: record for record in read_lines(path)}
+    assert records['ok']['status'] == 'ok'
+    assert records['ok']['result']['relevant_knowledge'] == [{'type': 'law', 'id': 'L1', 'relevance_score': 0.9}]
+    assert records['fallback']['status'] == 'error'
+    assert records['fallback']['stage'] == 'input'
+    assert records['failed']['status'] == 'error'
+    assert records['failed']['stage'] == 'analysis'
+    assert records['failed']['failures'] == {'subject_analysis': 'API Key无效'}
+
+def test_resume_only_reruns_unfinished_cases(tmp_path, fake_pipeline):
+    path = str(tmp_path / 'out.jsonl')
+    cases = [('ok', '张某盗窃'), ('fallback', '降级案件')]
+    asyncio.run(batch_analyze.run_batch(cases, path, 'key', {}, 2, 1))
+
+    done = batch_analyze.load_checkpoint(path)
+    pending = [(case_id, text) for case_id, text in cases if case_id not in done]
+    assert pending == [('fallback', '降级案件')]
+
+def test_run_batch_reads_cases_lazily_with_fixed_workers(tmp_path, monkeypatch):
+    path = str(tmp_path / 'out.jsonl')
+    workers = 3
+    state = {'read': 0, 'finished': 0, 'active': 0, 'max_active': 0, 'max_ahead': 0}
+
+    def cases():
+        for number in range(50):
+            state['read'] += 1
+            state['max_ahead'] = max(state['max_ahead'], state['read'] - state['finished'])
+            yield f'case-{number}', '张某盗窃'
+
+    async def analyze_case_async(api_key, model_config, text, knowledge_agent, timeout=None):
+        state['active'] += 1
+        state['max_active'] = max(state['max_active'], state['active'])
+        await asyncio.sleep(0.001)
+        state['active'] -= 1
+        state['finished'] += 1
+        return {'processed_input': {'案件描述': text}, 'relevant_knowledge': [], 'final_decision': '决策'}
+    monkeypatch.setattr(batch_analyze, 'analyze_case_async', analyze_case_async)
+    monkeypatch.setattr(batch_analyze, 'get_shared_knowledge_agent', lambda api_key: None)
+
+    counts = asyncio.run(batch_analyze.run_batch(cases(), path, 'key', {}, workers, 1))
+    assert counts == {'ok': 50, 'error': 0}
+    assert len(read_lines(path)) == 50
+    assert state['max_active'] == workers
+    # 预读量只受队列容量与正在分析的案件数限制
+    assert state['max_ahead'] <= workers * batch_analyze.CASE_QUEUE_PER_WORKER + workers + 1
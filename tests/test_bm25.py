@@ -0,0 +1,140 @@
+import json
+import math
+import pytest
+import agents.knowledge_agent as knowledge_agent
+from utils.bm25 import BM25Index, reciprocal_rank_fusion, tokenize_legal_text
+from utils.helpers import get_law_article_number, normalize_law_article_number
+from utils.metadata_store import MetadataStore
+
+def build_bm25(tmp_path, documents):
+    index = BM25Index(MetadataStore(str(tmp_path / 'metadata.sqlite')))
+    index.add_many(documents)
+    return index
+
+@pytest.mark.parametrize('text, expected', [
+    ('第一百零二条', '第102条'),
+    ('第两百条', '第200条'),
+    ('第一〇二条', '第102条'),
+    ('第二百六十四条', '第264条'),
+    ('第264条', '第264条'),
+])
+def test_article_numbers_are_extracted_and_normalized(text, expected):
+    assert get_law_article_number(f"依照刑法{text}之规定") == [text]
+    assert normalize_law_article_number(text) == expected
+    assert expected in tokenize_legal_text(f"依照刑法{text}之规定")
+
+def test_article_query_with_zero_hits_article_lookup(make_agent):
+    agent = make_agent()
+    agent.update_law_content('刑法第67条', {'条文编号': '刑法第一百零二条'})
+    
+    items = agent.retrieve_knowledge('第一百零二条', top_k=1)
+    assert items[0]['id'] == '刑法第一百零二条'
+    assert items[0]['match_type'] == 'article'
+
+def test_bm25_ranks_matching_document_first(tmp_path):
+    index = build_bm25(tmp_path, [
+        (1, '被告人入户盗窃现金三万元'),
+        (2, '被告人持刀故意伤害他人'),
+        (3, '醉酒驾驶机动车'),
+    ])
+    
+    results = index.search('盗窃现金', top_k=3)
+    assert results[0][0] == 1
+    assert all(doc_id != 3 for doc_id, _ in results)
+
+def test_bm25_remove_and_readd_update_statistics(tmp_path):
+    index = build_bm25(tmp_path, [(1, '盗窃现金'), (2, '故意伤害')])
+    index.remove(1)
+    assert len(index) == 1
+    assert index.search('盗窃') == []
+    assert index.total_length == len(tokenize_legal_text('故意伤害'))
+    
+    index.add(2, '抢劫财物')
+    assert len(index) == 1
+    assert index.total_length == len(tokenize_legal_text('抢劫财物'))
+    assert index.search('故意伤害') == []
+    assert index.search('抢劫')[0][0] == 2
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [2, 4]], k=60)
+    
+    assert [doc_id for doc_id, _ in fused] == [2, 1, 4, 3]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused[1][1] == pytest.approx(1 / 61)
+
+def test_hybrid_retrieval_reports_fusion_scores(make_agent):
+    agent = make_agent()
+    items = agent.retrieve_knowledge('入户盗窃现金', top_k=2, hybrid=True)
+    
+    assert items[0]['id'] == 'CASE002'
+    assert items[0]['fusion_score'] > 0
+    assert items[0]['bm25_score'] > 0
+
+def test_bm25_scores_match_reference_formula(tmp_path):
+    documents = [(1, '被告人入户盗窃现金三万元'), (2, '被告人盗窃电动车一辆'), (3, '醉酒驾驶机动车')]
+    index = build_bm25(tmp_path, documents)
+    
+    token_counts = {doc_id: tokenize_legal_text(text) for doc_id, text in documents}
+    average_length = sum(len(tokens) for tokens in token_counts.values()) / len(documents)
+    expected = {}
+    for term in set(tokenize_legal_text('盗窃现金')):
+        matching = [doc_id for doc_id, tokens in token_counts.items() if term in tokens]
+        idf = math.log(1 + (len(documents) - len(matching) + 0.5) / (len(matching) + 0.5))
+        for doc_id in matching:
+            tf = token_counts[doc_id].count(term)
+            norm = 1 - index.b + index.b * len(token_counts[doc_id]) / average_length
+            expected[doc_id] = expected.get(doc_id, 0.0) + idf * tf * (index.k1 + 1) / (tf + index.k1 * norm)
+    
+    results = index.search('盗窃现金', top_k=3)
+    assert [doc_id for doc_id, _ in results] == sorted(expected, key=expected.get, reverse=True)
+    assert dict(results) == pytest.approx(expected)
+
+def test_lexical_index_is_loaded_without_retokenizing(make_agent, monkeypatch):
+    make_agent()
+    # 索引已存在时启动不应再遍历语料或分词
+    def unexpected(*args, **kwargs):
+        raise AssertionError('启动时重新分词了语料')
+    monkeypatch.setattr(knowledge_agent.KnowledgeAgent, '_iter_documents', unexpected)
+    monkeypatch.setattr(knowledge_agent.BM25Index, 'add_many', unexpected)
+    
+    agent = make_agent()
+    assert len(agent.bm25_index) == agent.index.ntotal
+    assert agent.retrieve_knowledge('入户盗窃现金', top_k=1, hybrid=True)[0]['id'] == 'CASE002'
+    assert agent.retrieve_knowledge('第264条', top_k=1)[0]['match_type'] == 'article'
+
+def test_lexical_index_is_rebuilt_from_metadata_when_version_changes(make_agent, monkeypatch):
+    agent = make_agent()
+    postings = len(agent.bm25_index)
+    monkeypatch.setattr(knowledge_agent, 'LEXICAL_INDEX_VERSION', knowledge_agent.LEXICAL_INDEX_VERSION + 1)
+    monkeypatch.setattr(knowledge_agent.KnowledgeAgent, 'rebuild_index', lambda self: pytest.fail('不应重建向量索引'))
+    
+    restarted = make_agent()
+    assert len(restarted.bm25_index) == postings
+    with open(restarted.manifest_path, 'r', encoding='utf-8') as f:
+        assert json.load(f)['lexical_index']['version'] == knowledge_agent.LEXICAL_INDEX_VERSION
+    assert restarted.retrieve_knowledge('入户盗窃现金', top_k=1, hybrid=True)[0]['id'] == 'CASE002'
+
+def test_delta_replay_updates_lexical_index(make_agent):
+    agent = make_agent()
+    agent.update_law_content('刑法第67条', {'条文编号': '刑法第一百零二条'})
+    
+    restarted = make_agent()
+    assert restarted._delta_count > 0
+    assert restarted.retrieve_knowledge('第一百零二条', top_k=1)[0]['id'] == '刑法第一百零二条'
+    assert len(restarted.bm25_index) == restarted.index.ntotal
+
+def test_compaction_merges_blocks_and_drops_deleted_postings(tmp_path):
+    store = MetadataStore(str(tmp_path / 'metadata.sqlite'))
+    index = BM25Index(store)
+    index.add_many([(1, '盗窃现金'), (2, '故意伤害'), (3, '盗窃电动车')])
+    index.add(2, '抢劫财物')
+    index.remove(3)
+    before = index.search('盗窃 抢劫 伤害')
+    
+    assert store.compact_terms() == 2
+    assert store.compact_terms() == 0
+    assert index.search('盗窃 抢劫 伤害') == pytest.approx(before)
+    assert sorted(doc_id for doc_id, _ in before) == [1, 2]
+    with store._lock:
+        assert store._conn.execute("SELECT COUNT(DISTINCT block) FROM bm25_blocks").fetchone()[0] == 1
+        assert store._conn.execute("SELECT COUNT(*) FROM bm25_deleted").fetchone()[0] == 0
@@ -0,0 +1,120 @@
+import json
+import threading
+import pytest
+from agents.knowledge_agent import make_doc_id
+from utils.corpus_log import CorpusLog
+
+def passthrough(ops):
+    return [dict(op) for op in ops], [op['value'] for op in ops]
+
+def make_log(path, applied=None, prepare=passthrough, window=0.0):
+    return CorpusLog(str(path), prepare, (applied if applied is not None else []).extend, window=window)
+
+def test_concurrent_submits_are_group_committed(tmp_path):
+    applied = []
+    log = make_log(tmp_path / 'corpus.wal', applied, window=0.05)
+    results = []
+    threads = [threading.Thread(target=lambda value=value: results.append(log.submit({'op': 'upsert', 'value': value})))
+               for value in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == list(range(8))
+    assert log.committed_records == 8
+    assert log.commits < 8
+    assert [record['seq'] for record in applied] == list(range(1, 9))
+    records, last_seq = log.read()
+    assert last_seq == 8
+    assert sorted(record['value'] for record in records) == list(range(8))
+
+def test_prepare_errors_are_raised_to_submitter(tmp_path):
+    def failing(ops):
+        raise ValueError('无效修改')
+    log = make_log(tmp_path / 'corpus.wal', prepare=failing)
+
+    with pytest.raises(ValueError):
+        log.submit({'op': 'upsert', 'value': 1})
+    assert log.read() == ([], 0)
+
+def test_torn_tail_is_truncated_on_recovery(tmp_path):
+    path = tmp_path / 'corpus.wal'
+    make_log(path).append([{'op': 'upsert', 'value': 1}, {'op': 'upsert', 'value': 2}])
+    valid_size = path.stat().st_size
+    with open(path, 'ab') as f:
+        f.write(b'0000abcd {"op": "upsert", "val')
+
+    log = make_log(path)
+    assert path.stat().st_size == valid_size
+    assert log.last_seq == 2
+    assert log.pending_records == 2
+    log.append([{'op': 'upsert', 'value': 3}])
+    assert [record['seq'] for record in log.read()[0]] == [1, 2, 3]
+
+def test_checksum_mismatch_ends_the_log(tmp_path):
+    path = tmp_path / 'corpus.wal'
+    make_log(path).append([{'op': 'upsert', 'value': 1}, {'op': 'upsert', 'value': 2}])
+    lines = path.read_bytes().splitlines(keepends=True)
+    path.write_bytes(lines[0] + lines[1].replace(b'"value": 2', b'"value": 9'))
+
+    records, last_seq = make_log(path).read()
+    assert [record['value'] for record in records] == [1]
+    assert last_seq == 1
+
+def test_compaction_keeps_sequence_numbers(tmp_path):
+    path = tmp_path / 'corpus.wal'
+    log = make_log(path)
+    log.append([{'op': 'upsert', 'value': 1}, {'op': 'upsert', 'value': 2}])
+    snapshots = []
+
+    assert log.compact(snapshots.append) == 2
+    assert [record['value'] for record in snapshots[0]] == [1, 2]
+    assert log.read() == ([], 2)
+    assert log.pending_records == 0
+
+    log.append([{'op': 'upsert', 'value': 3}])
+    restarted = make_log(path)
+    records, last_seq = restarted.read()
+    assert [(record['seq'], record['value']) for record in records] == [(3, 3)]
+    assert last_seq == restarted.last_seq == 3
+
+def test_logged_but_unapplied_mutation_is_recovered_on_restart(make_agent):
+    agent = make_agent()
+    law = dict(agent._current_record(make_doc_id('law', '刑法第67条')))
+    law['解释说明'] = '自首的可以从轻或者减轻处罚。'
+    # 模拟日志落盘后、写入索引前进程退出
+    agent.corpus_log.append([{'op': 'upsert', 'kind': 'law', 'doc_id': make_doc_id('law', '刑法第67条'), 'record': law}])
+
+    restarted = make_agent()
+    assert restarted.metadata.get(make_doc_id('law', '刑法第67条'))['content'] == law
+    assert restarted._applied_seq == restarted.corpus_log.last_seq
+
+def test_article_lookup_follows_renames_and_deletes(make_agent, monkeypatch):
+    agent = make_agent()
+    # 修改只应增量调整受影响的法条，不重新遍历法条库
+    def unexpected_scan(*args, **kwargs):
+        raise AssertionError('修改时遍历了整个法条库')
+    monkeypatch.setattr(agent, '_iter_laws', unexpected_scan)
+    monkeypatch.setattr(agent, '_iter_documents', unexpected_scan)
+    assert agent.update_law_content('刑法第67条', {'条文编号': '刑法第68条'})
+    assert agent.delete_law('刑法第264条')
+    
+    assert agent.metadata.article_doc_ids('第68条') == [make_doc_id('law', '刑法第68条')]
+    assert agent.metadata.article_doc_ids('第67条') == []
+    assert agent.metadata.article_doc_ids('第264条') == []
+    assert agent.metadata.article_doc_ids('第232条') == [make_doc_id('law', '刑法第232条')]
+    assert [item['id'] for item in agent.retrieve_knowledge('刑法第68条', top_k=1)] == ['刑法第68条']
+
+def test_compact_corpus_writes_snapshot(make_agent):
+    agent = make_agent()
+    agent.delete_case('CASE003')
+    agent.update_law_content('刑法第67条', {'解释说明': '自首的可以从轻或者减轻处罚。'})
+    agent.compact_corpus()
+
+    assert agent.corpus_log.read() == ([], agent.corpus_log.last_seq)
+    with open('data/cases.json', 'r', encoding='utf-8') as f:
+        assert 'CASE003' not in [case['案件编号'] for case in json.load(f)]
+    restarted = make_agent()
+    assert make_doc_id('case', 'CASE003') not in restarted.metadata
+    assert restarted.metadata.get(make_doc_id('law', '刑法第67条'))['content']['解释说明'] == '自首的可以从轻或者减轻处罚。'
@@ -0,0 +1,64 @@
+import json
+import time
+import numpy as np
+import agents.knowledge_agent as knowledge_agent
+from utils.embedding_cache import EmbeddingCache
+from utils.hashing_encoder import HashingEncoder
+from utils.onnx_encoder import encoder_identity
+
+def test_round_trip_and_hit_counts(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / 'cache.sqlite'), 'model-a')
+    vectors = np.arange(6, dtype='float32').reshape(2, 3)
+    cache.put_many(['盗窃', '抢劫'], vectors)
+    
+    found = cache.get_many(['抢劫', '诈骗', '盗窃'])
+    assert sorted(found) == [0, 2]
+    np.testing.assert_array_equal(found[0], vectors[1])
+    np.testing.assert_array_equal(found[2], vectors[0])
+    assert cache.stats() == {'hits': 2, 'misses': 1, 'hit_rate': 2 / 3, 'entries': 2}
+
+def test_entries_are_scoped_to_model(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    EmbeddingCache(path, 'model-a').put_many(['盗窃'], np.ones((1, 3), dtype='float32'))
+    
+    assert EmbeddingCache(path, 'model-b').get_many(['盗窃']) == {}
+    assert list(EmbeddingCache(path, 'model-a').get_many(['盗窃'])) == [0]
+
+def test_evict_unused_since_keeps_recently_used_entries(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / 'cache.sqlite'), 'model-a')
+    cache.put_many(['旧文本', '仍在使用'], np.ones((2, 3), dtype='float32'))
+    time.sleep(0.01)
+    started = time.time()
+    cache.get_many(['仍在使用'])
+    
+    assert cache.evict_unused_since(started) == 1
+    assert list(cache.get_many(['旧文本', '仍在使用'])) == [1]
+
+def test_rebuild_reuses_cached_embeddings(make_agent):
+    agent = make_agent()
+    before = agent.embedding_cache.stats()
+    agent.rebuild_index()
+    after = agent.embedding_cache.stats()
+    
+    assert after['misses'] == before['misses']
+    assert after['hits'] - before['hits'] == agent.index.ntotal
+
+class QuantizedHashingEncoder(HashingEncoder):
+    manifest = {'quantized': True, 'model_sha256': 'ab' * 32}
+
+def test_encoder_identity_separates_backends():
+    fp32 = HashingEncoder()
+    fp32.manifest = {'quantized': False, 'model_sha256': 'cd' * 32}
+    identities = {encoder_identity('model-a', encoder) for encoder in (HashingEncoder(), fp32, QuantizedHashingEncoder())}
+    assert len(identities) == 3
+
+def test_switching_encoder_backend_rebuilds_without_cache_hits(make_agent, monkeypatch):
+    agent = make_agent()
+    monkeypatch.setitem(knowledge_agent._encoder_cache, agent.model_name, QuantizedHashingEncoder())
+    switched = make_agent()
+    
+    assert switched.encoder_id != agent.encoder_id
+    assert switched.embedding_cache.stats()['hits'] == 0
+    assert switched.embedding_cache.stats()['entries'] == switched.index.ntotal
+    with open(switched.manifest_path, 'r', encoding='utf-8') as f:
+        assert json.load(f)['model'] == switched.encoder_id
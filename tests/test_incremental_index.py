@@ -0,0 +1,96 @@
+import multiprocessing
+import os
+import agents.knowledge_agent as knowledge_agent
+from agents.knowledge_agent import make_doc_id
+
+NEW_CASE = {"案件编号": "CASE100", "案件概述": "被告人赵某醉酒驾驶机动车撞伤行人。", "判决结果": "危险驾驶罪，拘役四个月", "适用条文": "刑法第133条"}
+
+def _top_ids(agent, query, top_k=3):
+    return [item['id'] for item in agent.retrieve_knowledge(query, top_k=top_k)]
+
+def test_add_case_is_searchable_without_rebuild(make_agent):
+    agent = make_agent()
+    count = agent.index.ntotal
+    agent.add_new_case(NEW_CASE)
+    
+    assert agent.index.ntotal == count + 1
+    assert os.path.getsize(agent.delta_path) > 0
+    assert 'CASE100' in _top_ids(agent, NEW_CASE['案件概述'])
+
+def test_delta_log_is_replayed_on_restart(make_agent):
+    agent = make_agent()
+    agent.add_new_case(NEW_CASE)
+    agent.delete_case('CASE002')
+    agent.update_law_content('刑法第67条', {'解释说明': '自首的可以从轻处罚，犯罪较轻的可以免除处罚。'})
+    expected = agent.index.ntotal
+    
+    restarted = make_agent()
+    assert restarted.index.ntotal == expected
+    assert restarted._delta_count > 0
+    assert restarted.metadata.get(make_doc_id('case', 'CASE100'))['content'] == NEW_CASE
+    assert make_doc_id('case', 'CASE002') not in restarted.metadata
+    assert restarted.metadata.get(make_doc_id('law', '刑法第67条'))['content']['解释说明'].startswith('自首的可以从轻处罚')
+
+def test_torn_delta_tail_is_ignored(make_agent):
+    agent = make_agent()
+    agent.add_new_case(NEW_CASE)
+    expected = agent.index.ntotal
+    with open(agent.delta_path, 'a', encoding='utf-8') as f:
+        f.write('{"op": "upsert", "doc_id": 1')
+    
+    restarted = make_agent()
+    assert restarted.index.ntotal == expected
+    assert make_doc_id('case', 'CASE100') in restarted.metadata
+
+def test_compact_index_folds_delta_into_base_index(make_agent):
+    agent = make_agent()
+    agent.add_new_case(NEW_CASE)
+    agent.delete_case('CASE001')
+    agent.compact_index()
+    
+    assert not os.path.exists(agent.delta_path)
+    restarted = make_agent()
+    assert restarted._delta_count == 0
+    assert make_doc_id('case', 'CASE100') in restarted.metadata
+    assert make_doc_id('case', 'CASE001') not in restarted.metadata
+    assert restarted.index.ntotal == agent.index.ntotal
+
+def test_delta_compacts_automatically_at_threshold(make_agent, monkeypatch):
+    monkeypatch.setattr(knowledge_agent, 'DELTA_COMPACTION_THRESHOLD', 2)
+    agent = make_agent()
+    agent.add_new_case(NEW_CASE)
+    agent.add_new_case(dict(NEW_CASE, 案件编号='CASE101'))
+    
+    assert agent._delta_count == 0
+    assert not os.path.exists(agent.delta_path)
+
+def _add_cases_in_process(prefix, count, start):
+    # 子进程各自打开知识库并逐条新增案例，阈值较小时两边的增量日志合并会交错进行
+    agent = knowledge_agent.KnowledgeAgent(None)
+    start.wait()
+    for i in range(count):
+        assert agent.add_new_case({"案件编号": f"{prefix}{i:03d}", "案件概述": f"被告人{prefix}{i}盗窃电动车一辆。",
+                                   "判决结果": "盗窃罪，拘役三个月", "适用条文": "刑法第264条"})
+
+def test_two_processes_append_and_compact_delta_without_losing_changes(make_agent, monkeypatch):
+    monkeypatch.setattr(knowledge_agent, 'DELTA_COMPACTION_THRESHOLD', 7)
+    base = make_agent()
+    context = multiprocessing.get_context('fork')
+    start = context.Event()
+    workers = [context.Process(target=_add_cases_in_process, args=(prefix, 30, start)) for prefix in ('A', 'B')]
+    for worker in workers:
+        worker.start()
+    start.set()
+    for worker in workers:
+        worker.join(120)
+    assert [worker.exitcode for worker in workers] == [0, 0]
+    
+    # 不从知识库日志补写，只检查主索引与增量日志本身是否完整
+    monkeypatch.setattr(knowledge_agent.KnowledgeAgent, '_recover_corpus_log', lambda self: None)
+    agent = make_agent()
+    expected = [make_doc_id('case', f"{prefix}{i:03d}") for prefix in ('A', 'B') for i in range(30)]
+    # 主索引与元数据不一致时会全量重建，元数据库换成新文件
+    assert agent.metadata_path == base.metadata_path
+    assert agent.index.ntotal == base.index.ntotal + 60
+    assert all(doc_id in agent.metadata for doc_id in expected)
+    assert len(agent.bm25_index) == agent.index.ntotal
@@ -0,0 +1,79 @@
+import os
+import faiss
+import numpy as np
+import pytest
+from agents.knowledge_agent import make_doc_id
+from utils.index_factory import create_index, detect_index_type, mmap_io_flags
+from utils.metadata_store import MetadataStore
+
+def _anonymous_rss_bytes():
+    with open('/proc/self/status', 'r') as f:
+        for line in f:
+            if line.startswith('RssAnon:'):
+                return int(line.split()[1]) * 1024
+    return None
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/status'), reason="需要Linux的/proc统计匿名内存")
+@pytest.mark.parametrize('index_type', ['flat', 'sq8'])
+def test_mapped_index_codes_are_not_copied_into_memory(tmp_path, index_type):
+    vectors = np.random.default_rng(0).random((40000, 384), dtype='float32')
+    index = create_index(index_type, vectors.shape[1], vectors[:2000])
+    index.add_with_ids(vectors, np.arange(len(vectors), dtype='int64'))
+    path = str(tmp_path / 'index.faiss')
+    faiss.write_index(index, path)
+    del index
+    
+    before = _anonymous_rss_bytes()
+    mapped = faiss.read_index(path, mmap_io_flags(index_type))
+    _, ids = mapped.search(vectors[:5], 1)
+    copied = _anonymous_rss_bytes() - before
+    
+    assert ids[:, 0].tolist() == [0, 1, 2, 3, 4]
+    # 向量编码留在页缓存中，进程私有内存只增加索引结构本身
+    assert copied < os.path.getsize(path) // 4
+
+def test_too_few_training_points_fall_back_to_flat_with_warning(caplog):
+    vectors = np.random.default_rng(0).random((10, 384), dtype='float32')
+    with caplog.at_level('WARNING', logger='lawagent.index'):
+        index = create_index('ivf_flat', vectors.shape[1], vectors)
+    
+    assert detect_index_type(index) == 'flat'
+    assert '退化为精确索引' in caplog.text
+
+def test_agent_loads_index_memory_mapped(make_agent):
+    make_agent()
+    agent = make_agent()
+    
+    assert agent._index_mmapped
+    assert agent.retrieve_knowledge('入户盗窃现金', top_k=1)[0]['id'] == 'CASE002'
+
+def test_rebuild_publishes_metadata_under_new_file(make_agent):
+    agent = make_agent()
+    old_path = agent.metadata_path
+    # 模拟另一个进程仍以WAL模式打开着旧元数据库
+    reader = MetadataStore(old_path)
+    assert make_doc_id('case', 'CASE001') in reader
+    
+    agent.add_new_case({"案件编号": "CASE100", "案件概述": "醉酒驾驶机动车。"})
+    agent.rebuild_index()
+    
+    assert agent.metadata_path != old_path
+    assert agent._read_manifest()['metadata_file'] == os.path.basename(agent.metadata_path)
+    assert make_doc_id('case', 'CASE001') in reader
+    assert make_doc_id('case', 'CASE100') in agent.metadata
+    reader.close()
+    
+    restarted = make_agent()
+    assert restarted.metadata_path == agent.metadata_path
+    assert len(restarted.metadata) == restarted.index.ntotal
+
+def test_stale_metadata_generations_are_removed(make_agent):
+    agent = make_agent()
+    first = agent.metadata_path
+    agent.rebuild_index()
+    second = agent.metadata_path
+    agent.rebuild_index()
+    
+    remaining = {name for name in os.listdir('data') if name.startswith('knowledge_metadata')}
+    assert os.path.basename(first) not in remaining
+    assert {os.path.basename(second), os.path.basename(agent.metadata_path)} <= remaining
@@ -0,0 +1,168 @@
+import asyncio
+import time
+from types import SimpleNamespace
+import pytest
+import agents.pipeline as pipeline
+from agents.input_agent import InputAgent, is_fallback_input
+from utils.llm_errors import LLMAuthError, LLMRateLimitError, LLMTimeoutError
+
+def fake_agent(behaviour):
+    # behaviour为异常时抛出，为数字时按秒阻塞，否则作为分析结果返回
+    class FakeAgent:
+        def __init__(self, api_key):
+            self.client = SimpleNamespace()
+
+        def analyze(self, case_data, knowledge_base, on_token=None):
+            if isinstance(behaviour, Exception):
+                raise behaviour
+            if isinstance(behaviour, (int, float)):
+                time.sleep(behaviour)
+            return f"{behaviour}"
+
+        async def analyze_async(self, case_data, knowledge_base, on_token=None):
+            if isinstance(behaviour, Exception):
+                raise behaviour
+            if isinstance(behaviour, (int, float)):
+                await asyncio.sleep(behaviour)
+            return f"{behaviour}"
+    return FakeAgent
+
+@pytest.fixture
+def agents(monkeypatch):
+    def install(**behaviours):
+        monkeypatch.setattr(pipeline, 'ANALYSIS_AGENTS', [
+            (key, label, fake_agent(behaviours.get(key, '正常')))
+            for key, label, _ in pipeline.ANALYSIS_AGENTS
+        ])
+    return install
+
+def run_sync(**kwargs):
+    return pipeline.run_analysis_agents('key', {}, {}, {}, **kwargs)
+
+def run_async(**kwargs):
+    return asyncio.run(pipeline.run_analysis_agents_async('key', {}, {}, {}, **kwargs))
+
+@pytest.mark.parametrize('run', [run_sync, run_async])
+def test_all_agents_succeed(agents, run):
+    agents()
+    results = run()
+    assert set(results) == {key for key, _, _ in pipeline.ANALYSIS_AGENTS}
+
+@pytest.mark.parametrize('run', [run_sync, run_async])
+def test_non_retryable_error_is_raised_with_failures(agents, run):
+    agents(subject_analysis=LLMRateLimitError('429'), behavior_analysis=LLMAuthError('API Key无效', 401))
+    completed = []
+
+    with pytest.raises(LLMAuthError) as excinfo:
+        run(on_complete=lambda key, label, result: completed.append(key))
+
+    assert excinfo.value.stage == 'analysis'
+    assert excinfo.value.failures == {'subject_analysis': '429', 'behavior_analysis': 'API Key无效'}
+    assert len(completed) == len(pipeline.ANALYSIS_AGENTS)
+
+@pytest.mark.parametrize('run', [run_sync, run_async])
+def test_timeout_is_raised_as_llm_timeout(agents, run):
+    agents(result_analysis=5)
+    started = time.monotonic()
+
+    with pytest.raises(LLMTimeoutError) as excinfo:
+        run(timeout=0.2)
+
+    assert time.monotonic() - started < 2
+    assert list(excinfo.value.failures) == ['result_analysis']
+
+def test_sequential_run_stops_at_first_failure(agents):
+    agents(behavior_analysis=LLMAuthError('API Key无效', 401))
+    completed = []
+
+    with pytest.raises(LLMAuthError):
+        run_sync(concurrent=False, on_complete=lambda key, label, result: completed.append(key))
+
+    assert completed == ['subject_analysis', 'behavior_analysis']
+
+class FakeInputAgent:
+    error = None
+
+    def __init__(self, api_key):
+        self.client = SimpleNamespace()
+
+    async def process_input_async(self, raw_input):
+        if self.error is not None:
+            raise self.error
+        return {'案件描述': raw_input}
+
+class FakeDecisionAgent:
+    calls = 0
+
+    def __init__(self, api_key):
+        self.client = SimpleNamespace()
+
+    async def make_decision_async(self, *args, on_token=None):
+        FakeDecisionAgent.calls += 1
+        return '决策'
+
+@pytest.fixture
+def case_pipeline(monkeypatch):
+    monkeypatch.setattr(pipeline, 'InputAgent', FakeInputAgent)
+    monkeypatch.setattr(pipeline, 'DecisionAgent', FakeDecisionAgent)
+    monkeypatch.setattr(FakeInputAgent, 'error', None)
+    monkeypatch.setattr(FakeDecisionAgent, 'calls', 0)
+    knowledge_agent = SimpleNamespace(retrieve_knowledge=lambda processed_input: {})
+
+    def analyze():
+        return asyncio.run(pipeline.analyze_case_async('key', {'model': 'test'}, '案件', knowledge_agent))
+    return analyze
+
+def test_decision_is_skipped_when_analysis_fails(agents, case_pipeline):
+    agents(scenario_analysis=LLMRateLimitError('429'))
+
+    with pytest.raises(LLMRateLimitError):
+        case_pipeline()
+    assert FakeDecisionAgent.calls == 0
+
+def test_decision_runs_when_analysis_succeeds(agents, case_pipeline):
+    agents()
+    result = case_pipeline()
+    assert result['final_decision'] == '决策'
+    assert FakeDecisionAgent.calls == 1
+
+def test_input_error_is_raised_with_stage(agents, case_pipeline, monkeypatch):
+    agents()
+    monkeypatch.setattr(FakeInputAgent, 'error', LLMAuthError('API Key无效', 401))
+
+    with pytest.raises(LLMAuthError) as excinfo:
+        case_pipeline()
+    assert excinfo.value.stage == 'input'
+    assert FakeDecisionAgent.calls == 0
+
+def test_input_agent_raises_llm_errors_and_falls_back_on_others():
+    agent = InputAgent('key')
+
+    async def auth_error(*args, **kwargs):
+        raise LLMAuthError('API Key无效', 401)
+    agent.async_client.chat_completion = auth_error
+    with pytest.raises(LLMAuthError):
+        asyncio.run(agent.process_input_async('张某盗窃现金'))
+
+    def broken(*args, **kwargs):
+        raise RuntimeError('连接中断')
+    agent.client.chat_completion = broken
+    assert is_fallback_input(agent.process_input('张某盗窃现金'))
+
+def test_input_agent_caches_default_temperature_but_not_unparseable_responses(tmp_path):
+    from utils.llm_cache import LLMResponseCache
+    agent = InputAgent('key')
+    agent.client.response_cache = LLMResponseCache(str(tmp_path / 'llm_cache.sqlite'))
+    responses = ['抱歉，无法按JSON格式输出', '{"主体信息": {"姓名": "张某"}}']
+    calls = []
+
+    def request(prompt, model, temperature, max_tokens):
+        calls.append(temperature)
+        return responses[len(calls) - 1], {}
+    agent.client._request_completion = request
+
+    assert is_fallback_input(agent.process_input('张某盗窃现金'))
+    assert agent.process_input('张某盗窃现金') == {'主体信息': {'姓名': '张某'}}
+    assert agent.process_input('张某盗窃现金') == {'主体信息': {'姓名': '张某'}}
+    # 默认温度0.1的请求可缓存；降级的响应未写入缓存，只有可解析的响应被复用
+    assert calls == [0.1, 0.1]
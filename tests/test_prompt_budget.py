@@ -0,0 +1,20 @@
+import utils.prompt_budget as prompt_budget
+from utils.prompt_budget import build_budgeted_analysis_prompt, log_prompt_report
+from utils.tracing import start_trace
+
+def build_prompt(case_text, laws, cases):
+    return f"案件:{case_text}\n法条:{laws}\n案例:{cases}"
+
+def test_prompt_report_is_recorded_on_trace(monkeypatch):
+    monkeypatch.setattr(prompt_budget, 'PROMPT_REPORT_LOGGING', False)
+    law_items = [('刑法第264条 盗窃公私财物，数额较大的，处三年以下有期徒刑。' * 50, 0.9), ('刑法第67条 自首。', 0.2)]
+    
+    with start_trace('case') as trace:
+        _, report = build_budgeted_analysis_prompt(build_prompt, {'案件描述': '张某入户盗窃'}, law_items, [], total_tokens=300)
+        log_prompt_report('主体分析', report)
+    
+    recorded = trace.summary()['prompt_reports']
+    assert [item['label'] for item in recorded] == ['主体分析']
+    assert set(recorded[0]['sections']) == {'案件信息', '相关法律条文', '相关案例'}
+    assert recorded[0]['total_tokens'] <= 300
+    assert recorded[0]['sections']['相关法律条文']['kept'] < len(law_items) or recorded[0]['sections']['相关法律条文']['truncated']
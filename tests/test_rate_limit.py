@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+import utils.rate_limit as rate_limit
+from utils.llm_errors import LLMAuthError, LLMRateLimitError, LLMServerError
+from utils.rate_limit import RequestScheduler, TokenBucket
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    # 记录退避等待而不真正休眠
+    sleeps = []
+
+    async def async_sleep(seconds):
+        sleeps.append(seconds)
+    monkeypatch.setattr(rate_limit.time, 'sleep', sleeps.append)
+    monkeypatch.setattr(rate_limit.asyncio, 'sleep', async_sleep)
+    return sleeps
+
+def failing_request(errors, result='ok'):
+    errors = list(errors)
+    calls = []
+
+    def request():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return result
+    request.calls = calls
+    return request
+
+def make_scheduler(**kwargs):
+    return RequestScheduler(requests_per_minute_per_key=None, model_requests_per_minute={}, **kwargs)
+
+def test_token_bucket_allows_burst_then_spaces_requests():
+    bucket = TokenBucket(60, burst=2)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(1.0, abs=0.05)
+    assert bucket.reserve() == pytest.approx(2.0, abs=0.05)
+
+def test_retryable_errors_are_retried_with_backoff(no_sleep):
+    scheduler = make_scheduler(max_retries=3, backoff_base=1.0, backoff_max=30.0)
+    request = failing_request([LLMServerError('502', 502), LLMServerError('503', 503)])
+
+    assert scheduler.call('key', 'model', request) == 'ok'
+    assert len(request.calls) == 3
+    assert len(no_sleep) == 2
+    assert all(0 <= delay <= 2 ** attempt for attempt, delay in enumerate(no_sleep))
+    assert scheduler.stats()['retries'] == 2
+
+def test_non_retryable_error_is_raised_immediately(no_sleep):
+    scheduler = make_scheduler()
+    request = failing_request([LLMAuthError('API Key无效', 401)])
+
+    with pytest.raises(LLMAuthError):
+        scheduler.call('key', 'model', request)
+    assert len(request.calls) == 1
+    assert no_sleep == []
+
+def test_retries_are_exhausted(no_sleep):
+    scheduler = make_scheduler(max_retries=2)
+    request = failing_request([LLMServerError('502', 502)] * 5)
+
+    with pytest.raises(LLMServerError):
+        scheduler.call('key', 'model', request)
+    assert len(request.calls) == 3
+
+def test_retry_after_is_a_lower_bound_and_pauses_the_key(no_sleep):
+    scheduler = make_scheduler(backoff_base=0.01)
+    request = failing_request([LLMRateLimitError('429', 429, retry_after=5.0)])
+
+    assert scheduler.call('key', 'model', request) == 'ok'
+    assert no_sleep[0] == 5.0
+    # 重试前该Key的后续请求同样需要等待Retry-After
+    assert scheduler._reserve('key', 'model') > 4
+    assert scheduler._reserve('other-key', 'model') == 0.0
+    assert scheduler.stats()['rate_limited'] == 1
+
+def test_async_call_retries(no_sleep):
+    scheduler = make_scheduler(max_retries=2)
+    errors = [LLMRateLimitError('429', 429)]
+
+    async def request():
+        if errors:
+            raise errors.pop()
+        return 'ok'
+
+    assert asyncio.run(scheduler.call_async('key', 'model', request)) == 'ok'
+    assert scheduler.stats()['retries'] == 1
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import httpx
+import pytest
+from mock_openrouter import MockSettings, start_mock_server
+from utils.async_client import AsyncOpenRouterClient, collect_stream_async
+from utils.helpers import OpenRouterClient, SSEDecoder, collect_stream, iter_sse_data
+from utils.llm_errors import LLMServerError
+from utils.rate_limit import RequestScheduler
+
+def event(payload):
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8')
+
+def delta(content):
+    return event({'choices': [{'index': 0, 'delta': {'content': content}}]})
+
+STREAM = (b": OPENROUTER PROCESSING\n\n" + delta('被告人') + b": keep-alive\n" + delta('张某盗窃')
+          + event({'choices': [], 'usage': {'prompt_tokens': 5, 'completion_tokens': 7}}) + b"data: [DONE]\n\n")
+
+def decode_chunks(chunks):
+    decoder = SSEDecoder()
+    events = [data for chunk in chunks for data in decoder.decode(chunk)]
+    data = decoder.flush()
+    return events + ([data] if data is not None else [])
+
+def test_events_split_at_every_byte_offset():
+    expected = decode_chunks([STREAM])
+    assert len(expected) == 4 and expected[-1] == '[DONE]'
+    # 切分点可能落在行中、事件之间或多字节中文字符内部
+    for offset in range(1, len(STREAM)):
+        assert decode_chunks([STREAM[:offset], STREAM[offset:]]) == expected
+    assert decode_chunks([STREAM[i:i + 1] for i in range(len(STREAM))]) == expected
+
+def test_crlf_split_across_chunks_and_bare_cr():
+    assert decode_chunks([b"data: a\r", b"\n\r", b"\ndata: b\r\r"]) == ['a', 'b']
+
+def test_multi_line_data_fields_are_joined_with_newlines():
+    stream = b'data: {"choices":\ndata:[{"delta":\ndata: {"content": "\xe7\x9b\x97"}}]}\n\n'
+    [data] = decode_chunks([stream[:20], stream[20:]])
+    assert data == '{"choices":\n[{"delta":\n{"content": "盗"}}]}'
+    assert json.loads(data)['choices'][0]['delta']['content'] == '盗'
+
+def test_comments_keepalives_and_other_fields_are_ignored():
+    stream = b": OPENROUTER PROCESSING\n\n:\n\nevent: message\nid: 1\nretry: 100\ndata: x\n: inside\n\n"
+    assert decode_chunks([stream]) == ['x']
+
+def test_last_event_without_blank_line_is_flushed():
+    assert list(iter_sse_data([b"data: a\n\n", b"data: b"])) == ['a', 'b']
+
+class FakeStreamResponse:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=None):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+def stream_client(chunks):
+    client = OpenRouterClient('key', scheduler=RequestScheduler(requests_per_minute_per_key=None, model_requests_per_minute={}))
+    response = FakeStreamResponse(chunks)
+    client.session.post = lambda *args, **kwargs: response
+    return client, response
+
+def test_stream_stops_at_done_and_records_usage():
+    chunks = [STREAM[:7], STREAM[7:50], STREAM[50:], delta('不应输出')]
+    client, response = stream_client(chunks)
+    usage = {}
+
+    assert ''.join(client._request_completion_stream('prompt', 'model', 0.1, 100, usage)) == '被告人张某盗窃'
+    assert (usage['prompt_tokens'], usage['completion_tokens']) == (5, 7)
+    assert response.closed
+
+def test_mid_stream_error_payload_is_raised_after_partial_output():
+    error = event({'error': {'code': 502, 'message': 'Provider returned error'},
+                   'choices': [{'index': 0, 'delta': {'content': ''}, 'finish_reason': 'error'}]})
+    client, _ = stream_client([delta('被告人'), error[:10], error[10:]])
+    received = []
+
+    with pytest.raises(LLMServerError):
+        collect_stream(client.chat_completion_stream('prompt', 'model', use_cache=False), received.append)
+    assert received == ['被告人']
+
+@pytest.fixture(scope='module')
+def mock_server():
+    settings = MockSettings(latency=0.0, latency_jitter=0.0, token_interval=0.0, completion_tokens=40,
+                            stream_fragment=True, seed=0)
+    server, base_url = start_mock_server(settings)
+    yield settings, base_url
+    server.should_exit = True
+
+@pytest.fixture
+def settings(mock_server, monkeypatch):
+    settings, _ = mock_server
+    monkeypatch.setattr(settings, 'stream_error_rate', 0.0)
+    return settings
+
+def make_scheduler():
+    return RequestScheduler(requests_per_minute_per_key=None, model_requests_per_minute={}, max_retries=0)
+
+def expected_text(mock_server):
+    # 非流式请求返回同样的文本，作为流式拼接结果的基准
+    _, base_url = mock_server
+    client = OpenRouterClient('key', base_url=base_url, scheduler=make_scheduler())
+    return client.chat_completion('案件分析', 'mock/model', max_tokens=40, use_cache=False)
+
+def test_stream_from_mock_server_reassembles_fragmented_events(mock_server, settings):
+    _, base_url = mock_server
+    client = OpenRouterClient('key', base_url=base_url, scheduler=make_scheduler())
+    received = []
+
+    text = collect_stream(client.chat_completion_stream('案件分析', 'mock/model', max_tokens=40, use_cache=False), received.append)
+    assert text == expected_text(mock_server)
+    assert len(received) > 1
+
+def test_async_stream_from_mock_server_reassembles_fragmented_events(mock_server, settings):
+    _, base_url = mock_server
+
+    async def run():
+        async with httpx.AsyncClient() as http_client:
+            client = AsyncOpenRouterClient('key', base_url=base_url, http_client=http_client, scheduler=make_scheduler())
+            return await collect_stream_async(client.chat_completion_stream('案件分析', 'mock/model', max_tokens=40, use_cache=False))
+    assert asyncio.run(run()) == expected_text(mock_server)
+
+def test_mock_server_mid_stream_error_is_raised(mock_server, settings):
+    _, base_url = mock_server
+    settings.stream_error_rate = 1.0
+    client = OpenRouterClient('key', base_url=base_url, scheduler=make_scheduler())
+    received = []
+
+    with pytest.raises(LLMServerError):
+        collect_stream(client.chat_completion_stream('案件分析', 'mock/model', max_tokens=40, use_cache=False), received.append)
+    assert received and len(''.join(received)) < 40
+
+def test_async_mock_server_mid_stream_error_is_raised(mock_server, settings):
+    _, base_url = mock_server
+    settings.stream_error_rate = 1.0
+
+    async def run():
+        async with httpx.AsyncClient() as http_client:
+            client = AsyncOpenRouterClient('key', base_url=base_url, http_client=http_client, scheduler=make_scheduler())
+            return await collect_stream_async(client.chat_completion_stream('案件分析', 'mock/model', max_tokens=40, use_cache=False))
+    with pytest.raises(LLMServerError):
+        asyncio.run(run())
@@ -0,0 +1,235 @@
+import asyncio
+import json
+import threading
+import time
+import weakref
+import httpx
+from utils.helpers import (
+    OPENROUTER_BASE_URL, LLM_CACHE_MAX_TEMPERATURE, build_chat_payload, parse_completion_response,
+    parse_stream_event, parse_usage, SSEDecoder, get_default_llm_cache
+)
+from utils.llm_errors import (
+    LLMError, LLMTimeoutError, LLMConnectionError, LLMResponseError, LLMEncodingError,
+    error_from_status, parse_retry_after
+)
+from utils.rate_limit import get_default_scheduler
+from utils.tracing import record_llm_call, record_cache
+
+# 进程级连接池配置(每个事件循环一个httpx.AsyncClient，所有Agent共享)
+ASYNC_MAX_CONNECTIONS = 20
+ASYNC_MAX_KEEPALIVE_CONNECTIONS = 10
+ASYNC_KEEPALIVE_EXPIRY = 30
+ASYNC_HTTP2 = True
+ASYNC_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+DEFAULT_HEADERS = {
+    "HTTP-Referer": "http://localhost:8501",
+    "X-Title": "Law RAG System",
+    "Content-Type": "application/json; charset=utf-8",
+    "Accept-Charset": "utf-8"
+}
+
+_shared_http_clients = weakref.WeakKeyDictionary()
+_shared_http_clients_lock = threading.Lock()
+
+def _http2_available():
+    try:
+        import h2
+    except ImportError:
+        return False
+    return True
+
+def get_shared_http_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    with _shared_http_clients_lock:
+        client = _shared_http_clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                http2=ASYNC_HTTP2 and _http2_available(),
+                limits=httpx.Limits(
+                    max_connections=ASYNC_MAX_CONNECTIONS,
+                    max_keepalive_connections=ASYNC_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=ASYNC_KEEPALIVE_EXPIRY
+                ),
+                timeout=ASYNC_TIMEOUT,
+                headers=DEFAULT_HEADERS
+            )
+            _shared_http_clients[loop] = client
+        return client
+
+async def close_shared_http_client():
+    loop = asyncio.get_running_loop()
+    with _shared_http_clients_lock:
+        client = _shared_http_clients.pop(loop, None)
+    if client is not None:
+        await client.aclose()
+
+async def aiter_sse_data(chunks):
+    decoder = SSEDecoder()
+    async for chunk in chunks:
+        for data in decoder.decode(chunk):
+            yield data
+    data = decoder.flush()
+    if data is not None:
+        yield data
+
+async def collect_stream_async(chunks, on_token=None) -> str:
+    collected = []
+    async for chunk in chunks:
+        collected.append(chunk)
+        if on_token:
+            on_token(chunk)
+    return ''.join(collected)
+
+class AsyncOpenRouterClient:
+    def __init__(self, api_key: str, response_cache=None, base_url: str = None, http_client: httpx.AsyncClient = None, scheduler=None):
+        self.api_key = api_key
+        self.response_cache = response_cache if response_cache is not None else get_default_llm_cache()
+        self.cache_max_temperature = LLM_CACHE_MAX_TEMPERATURE
+        self.scheduler = scheduler if scheduler is not None else get_default_scheduler()
+        self.base_url = (base_url or OPENROUTER_BASE_URL).rstrip('/')
+        self.http_client = http_client
+    
+    def _client(self) -> httpx.AsyncClient:
+        return self.http_client if self.http_client is not None else get_shared_http_client()
+    
+    def _headers(self, accept: str):
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Accept": accept
+        }
+    
+    def _cache_for(self, temperature: float, use_cache: bool):
+        if use_cache is None:
+            use_cache = temperature <= self.cache_max_temperature
+        return self.response_cache if use_cache else None
+    
+    async def chat_completion(self, prompt: str, model: str = "anthropic/claude-3.5-sonnet", temperature: float = 0.1, max_tokens: int = 4000, use_cache: bool = None, cache_check=None) -> str:
+        cache = self._cache_for(temperature, use_cache)
+        
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key(model, temperature, max_tokens, prompt)
+            cached = cache.get(cache_key)
+            if cached is not None and cache_check is not None and not cache_check(cached):
+                cached = None
+            record_cache('llm_response', cached is not None)
+            if cached is not None:
+                record_llm_call(model, 0.0, cached=True)
+                return cached
+        
+        started = time.perf_counter()
+        try:
+            response, usage = await self.scheduler.call_async(
+                self.api_key, model,
+                lambda: self._request_completion(prompt, model, temperature, max_tokens)
+            )
+        except LLMError as e:
+            record_llm_call(model, time.perf_counter() - started, error=type(e).__name__)
+            raise
+        record_llm_call(model, time.perf_counter() - started, usage)
+        
+        if cache is not None and (cache_check is None or cache_check(response)):
+            cache.put(cache_key, model, response)
+        return response
+    
+    async def chat_completion_stream(self, prompt: str, model: str = "anthropic/claude-3.5-sonnet", temperature: float = 0.1, max_tokens: int = 4000, use_cache: bool = None, cache_check=None):
+        cache = self._cache_for(temperature, use_cache)
+        
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key(model, temperature, max_tokens, prompt)
+            cached = cache.get(cache_key)
+            if cached is not None and cache_check is not None and not cache_check(cached):
+                cached = None
+            record_cache('llm_response', cached is not None)
+            if cached is not None:
+                record_llm_call(model, 0.0, cached=True, stream=True)
+                yield cached
+                return
+        
+        chunks = []
+        usage = {}
+        attempt = 0
+        started = time.perf_counter()
+        while True:
+            try:
+                async with self.scheduler.async_slot(self.api_key, model):
+                    async for chunk in self._request_completion_stream(prompt, model, temperature, max_tokens, usage):
+                        chunks.append(chunk)
+                        yield chunk
+                break
+            except LLMError as e:
+                if chunks or not self.scheduler.should_retry(e, attempt):
+                    record_llm_call(model, time.perf_counter() - started, stream=True, error=type(e).__name__)
+                    raise
+                await asyncio.sleep(self.scheduler.backoff_delay(self.api_key, e, attempt))
+                attempt += 1
+        record_llm_call(model, time.perf_counter() - started, usage, stream=True)
+        
+        response = ''.join(chunks)
+        if cache is not None and chunks and (cache_check is None or cache_check(response)):
+            cache.put(cache_key, model, response)
+    
+    async def _request_completion(self, prompt: str, model: str, temperature: float, max_tokens: int) -> str:
+        url = f"{self.base_url}/chat/completions"
+        try:
+            response = await self._client().post(
+                url,
+                content=build_chat_payload(prompt, model, temperature, max_tokens),
+                headers=self._headers("application/json; charset=utf-8")
+            )
+            response.raise_for_status()
+            data = json.loads(response.content.decode('utf-8'))
+            return parse_completion_response(data), parse_usage(data)
+        except Exception as e:
+            raise self._translate_error(e) from e
+    
+    async def _request_completion_stream(self, prompt: str, model: str, temperature: float, max_tokens: int, usage: dict = None):
+        url = f"{self.base_url}/chat/completions"
+        try:
+            async with self._client().stream(
+                "POST",
+                url,
+                content=build_chat_payload(prompt, model, temperature, max_tokens, stream=True),
+                headers=self._headers("text/event-stream")
+            ) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    raise error_from_status(
+                        response.status_code,
+                        response.text,
+                        parse_retry_after(response.headers.get('Retry-After'))
+                    )
+                
+                async for data in aiter_sse_data(response.aiter_bytes()):
+                    if data == '[DONE]':
+                        return
+                    content, event_usage = parse_stream_event(data)
+                    if event_usage and usage is not None:
+                        usage.update(event_usage)
+                    if content:
+                        yield str(content)
+        except Exception as e:
+            raise self._translate_error(e) from e
+    
+    def _translate_error(self, e: Exception) -> LLMError:
+        if isinstance(e, LLMError):
+            return e
+        if isinstance(e, httpx.HTTPStatusError):
+            return error_from_status(
+                e.response.status_code,
+                e.response.text,
+                parse_retry_after(e.response.headers.get('Retry-After'))
+            )
+        if isinstance(e, httpx.TimeoutException):
+            return LLMTimeoutError("API请求错误: 请求超时")
+        if isinstance(e, httpx.TransportError):
+            return LLMConnectionError("API请求错误: 网络连接失败")
+        if isinstance(e, json.JSONDecodeError):
+            return LLMResponseError(f"API响应格式错误: JSON解析失败 - {str(e)}")
+        if isinstance(e, UnicodeEncodeError):
+            return LLMEncodingError(f"编码错误: {str(e)} - 请检查输入文本的字符编码")
+        if isinstance(e, UnicodeDecodeError):
+            return LLMEncodingError(f"解码错误: {str(e)} - 服务器响应编码问题")
+        return LLMError(f"未知错误: {str(e)}")
@@ -0,0 +1,88 @@
+import math
+import re
+from collections import Counter, defaultdict
+import numpy as np
+from utils.helpers import extract_keywords_from_text, get_law_article_number, normalize_law_article_number
+
+AMOUNT_PATTERN = re.compile(r'\d+(?:\.\d+)?[万千百亿]?元')
+CJK_RUN_PATTERN = re.compile(r'[\u4e00-\u9fff]+')
+ASCII_WORD_PATTERN = re.compile(r'[A-Za-z0-9_]+')
+
+# 分词或条文号规范化规则变化时递增，已持久化的词法索引随之重建
+LEXICAL_INDEX_VERSION = 1
+
+def tokenize_legal_text(text):
+    text = str(text)
+    tokens = [normalize_law_article_number(article) for article in get_law_article_number(text)]
+    tokens.extend(AMOUNT_PATTERN.findall(text))
+    
+    for keyword in extract_keywords_from_text(text):
+        tokens.extend(word.lower() for word in ASCII_WORD_PATTERN.findall(keyword))
+    
+    for run in CJK_RUN_PATTERN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+class BM25Index:
+    # 倒排表、文档长度与总词数保存在元数据库(MetadataStore)中，检索时只读取查询词项的倒排块
+    def __init__(self, store, k1=1.5, b=0.75):
+        self.store = store
+        self.k1 = k1
+        self.b = b
+    
+    def __len__(self):
+        return self.store.term_stats()[0]
+    
+    @property
+    def total_length(self):
+        return self.store.term_stats()[1]
+    
+    def add_many(self, documents):
+        items = [(doc_id, Counter(tokenize_legal_text(text))) for doc_id, text in documents]
+        if items:
+            self.store.upsert_terms(items)
+    
+    def add(self, doc_id, text):
+        self.add_many([(doc_id, text)])
+    
+    def remove_many(self, doc_ids):
+        doc_ids = list(doc_ids)
+        if doc_ids:
+            self.store.delete_terms(doc_ids)
+    
+    def remove(self, doc_id):
+        self.remove_many([doc_id])
+    
+    def search(self, query_text, top_k=10):
+        query_terms = set(tokenize_legal_text(query_text))
+        num_docs, total_length = self.store.term_stats()
+        if num_docs == 0 or not query_terms:
+            return []
+        average_length = total_length / num_docs
+        
+        matched_ids = []
+        matched_scores = []
+        for doc_ids, term_frequencies, doc_lengths in self.store.term_postings(query_terms).values():
+            if not len(doc_ids):
+                continue
+            idf = math.log(1 + (num_docs - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            length_norm = 1 - self.b + self.b * doc_lengths / average_length
+            matched_ids.append(doc_ids)
+            matched_scores.append(idf * term_frequencies * (self.k1 + 1) / (term_frequencies + self.k1 * length_norm))
+        if not matched_ids:
+            return []
+        
+        doc_ids, positions = np.unique(np.concatenate(matched_ids), return_inverse=True)
+        scores = np.bincount(positions, weights=np.concatenate(matched_scores))
+        ranked = np.argsort(-scores, kind='stable')[:top_k]
+        return [(int(doc_ids[i]), float(scores[i])) for i in ranked]
+
+def reciprocal_rank_fusion(rankings, k=60):
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            fused[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
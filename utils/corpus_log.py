@@ -0,0 +1,212 @@
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# 写线程在首条修改到达后再等待该时长，期间到达的修改合并为一次写入与fsync
+GROUP_COMMIT_WINDOW = 0.002
+GROUP_COMMIT_MAX_BATCH = 256
+
+def _encode_line(record):
+    payload = json.dumps(record, ensure_ascii=False, sort_keys=True)
+    return f"{zlib.crc32(payload.encode('utf-8')):08x} {payload}\n".encode('utf-8')
+
+def _decode_line(line):
+    # 行不完整或校验和不符时返回None
+    if not line.endswith(b'\n'):
+        return None
+    try:
+        checksum, _, payload = line[:-1].decode('utf-8').partition(' ')
+        if int(checksum, 16) != zlib.crc32(payload.encode('utf-8')):
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+class _PendingMutation:
+    def __init__(self, op):
+        self.op = op
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class CorpusLog:
+    # 法条/案例修改的追加式日志: 单个写线程按批写入并fsync(组提交)，每条记录带递增序号与CRC校验
+    # prepare(ops) -> (records, results) 在写线程中把修改请求转换为日志记录；apply(records) 在记录落盘后生效
+    def __init__(self, path, prepare, apply, window=GROUP_COMMIT_WINDOW, max_batch=GROUP_COMMIT_MAX_BATCH):
+        self.path = path
+        self.window = window
+        self.max_batch = max_batch
+        self._prepare = prepare
+        self._apply = apply
+        self._queue = queue.Queue()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._file_lock = threading.RLock()
+        self._lock_depth = 0
+        self._file_identity = None
+        self.last_seq = 0
+        self.pending_records = 0
+        self.commits = 0
+        self.committed_records = 0
+        self.last_compaction = time.time()
+        with self.locked():
+            self._recover()
+
+    @contextmanager
+    def locked(self):
+        # 进程内用线程锁，多进程(多个Streamlit/HTTP服务实例)之间用文件锁；增量索引日志的追加与合并也使用这把锁
+        # 同一线程可重入: flock按打开的文件加锁，嵌套时再次加锁会阻塞自身
+        with self._file_lock:
+            self._lock_depth += 1
+            try:
+                if fcntl is None or self._lock_depth > 1:
+                    yield
+                    return
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(f"{self.path}.lock", 'a') as lock_file:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                    try:
+                        yield
+                    finally:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            finally:
+                self._lock_depth -= 1
+    
+    def _stat_identity(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_ino, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    def _scan(self):
+        # 返回检查点之后的有效记录、最新序号与有效内容的字节数
+        records = []
+        last_seq = 0
+        valid_size = 0
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return records, last_seq, valid_size
+        with f:
+            for line in f:
+                record = _decode_line(line)
+                if record is None:
+                    break
+                valid_size += len(line)
+                last_seq = record['seq']
+                if record['op'] == 'checkpoint':
+                    records = []
+                else:
+                    records.append(record)
+        return records, last_seq, valid_size
+
+    def _recover(self):
+        records, self.last_seq, valid_size = self._scan()
+        if os.path.exists(self.path) and os.path.getsize(self.path) > valid_size:
+            # 写入过程中崩溃留下的残缺记录从未被确认，直接截断
+            print(f"警告: {self.path} 末尾存在不完整记录，已截断")
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid_size)
+                f.flush()
+                os.fsync(f.fileno())
+        self.pending_records = len(records)
+        self._file_identity = self._stat_identity()
+
+    def read(self):
+        with self.locked():
+            records, last_seq, _ = self._scan()
+        return records, last_seq
+
+    def submit(self, op):
+        # 阻塞直到所在批次写入磁盘并生效，返回prepare给出的结果
+        pending = _PendingMutation(op)
+        with self._writer_lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._run, name='corpus-log-writer', daemon=True)
+                self._writer.start()
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _commit(self, batch):
+        try:
+            records, results = self._prepare([pending.op for pending in batch])
+            if records:
+                self.append(records)
+                self._apply(records)
+        except Exception as e:
+            for pending in batch:
+                pending.error = e
+                pending.done.set()
+            return
+        for pending, result in zip(batch, results):
+            pending.result = result
+            pending.done.set()
+
+    def append(self, records):
+        with self.locked():
+            if self._stat_identity() != self._file_identity:
+                # 其他进程追加或合并过日志，序号从文件中的最新值继续
+                existing, self.last_seq, _ = self._scan()
+                self.pending_records = len(existing)
+            data = []
+            for record in records:
+                self.last_seq += 1
+                record['seq'] = self.last_seq
+                data.append(_encode_line(record))
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'ab') as f:
+                f.write(b''.join(data))
+                f.flush()
+                os.fsync(f.fileno())
+            self._file_identity = self._stat_identity()
+            self.pending_records += len(records)
+            self.commits += 1
+            self.committed_records += len(records)
+
+    def compact(self, write_snapshot):
+        # write_snapshot(records)把日志并入快照文件；之后日志只保留记录最新序号的检查点
+        # 两步之间崩溃时日志会在新快照上重放一遍，记录都是整条覆盖或删除，重放结果不变
+        with self.locked():
+            records, last_seq, _ = self._scan()
+            if records:
+                write_snapshot(records)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(_encode_line({'op': 'checkpoint', 'seq': last_seq}))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self.last_seq = last_seq
+            self.pending_records = 0
+            self.last_compaction = time.time()
+            self._file_identity = self._stat_identity()
+            return len(records)
@@ -0,0 +1,125 @@
+import json
+import os
+import textwrap
+
+READ_BLOCK_SIZE = 1 << 20
+
+_decoder = json.JSONDecoder()
+
+def _skip_whitespace(buffer, position):
+    while position < len(buffer) and buffer[position] in ' \t\r\n':
+        position += 1
+    return position
+
+def _iter_json_array(f, path):
+    # 增量解析JSON数组: 缓冲区只保留尚未解析完的部分，内存与单条记录大小相当
+    buffer = f.read(READ_BLOCK_SIZE)
+    position = _skip_whitespace(buffer, 0) + 1
+    eof = False
+    need_separator = False
+    count = 0
+    while True:
+        position = _skip_whitespace(buffer, position)
+        if position >= len(buffer):
+            if eof:
+                raise ValueError(f"第{count}条记录后文件意外结束")
+            buffer = f.read(READ_BLOCK_SIZE)
+            position = 0
+            eof = not buffer
+            continue
+        char = buffer[position]
+        if char == ']':
+            return
+        if need_separator:
+            if char != ',':
+                raise ValueError(f"第{count}条记录后缺少分隔符")
+            position += 1
+            need_separator = False
+            continue
+        try:
+            record, end = _decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # 记录跨越了读取块，读入更多内容后重新解析
+            block = f.read(READ_BLOCK_SIZE)
+            eof = not block
+            buffer = buffer[position:] + block
+            position = 0
+            continue
+        count += 1
+        need_separator = True
+        yield record
+        position = end
+        if position > READ_BLOCK_SIZE:
+            buffer = buffer[position:]
+            position = 0
+
+def _iter_json_lines(f, path, warn):
+    for line_number, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            if warn:
+                print(f"警告: {path} 第{line_number}行格式错误，已跳过")
+
+def _first_char(f):
+    while True:
+        char = f.read(1)
+        if not char or not char.isspace():
+            return char
+
+def iter_json_records(path, label, warn=True):
+    # 逐条读取JSON数组或JSONL(每行一个对象)文件，按首个非空白字符自动识别格式
+    try:
+        f = open(path, 'r', encoding='utf-8')
+    except FileNotFoundError:
+        if warn:
+            print(f"警告: {path} 文件不存在，将使用空{label}数据")
+        return
+    with f:
+        first = _first_char(f)
+        if not first:
+            return
+        f.seek(0)
+        if first != '[':
+            yield from _iter_json_lines(f, path, warn)
+            return
+        try:
+            yield from _iter_json_array(f, path)
+        except ValueError as e:
+            if warn:
+                print(f"警告: {path} 文件格式错误，之后的{label}数据被忽略: {e}")
+
+def is_json_lines(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            first = _first_char(f)
+    except FileNotFoundError:
+        return path.endswith('.jsonl')
+    return first not in ('', '[')
+
+def write_json_records(path, records, json_lines=None):
+    # 逐条写入临时文件并fsync后替换原文件；默认沿用原文件的格式，JSON数组与json.dump(indent=2)的输出一致
+    if json_lines is None:
+        json_lines = is_json_lines(path)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        if json_lines:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        else:
+            separator = '[\n'
+            for record in records:
+                f.write(separator + textwrap.indent(json.dumps(record, ensure_ascii=False, indent=2), '  '))
+                separator = ',\n'
+            f.write('[]' if separator == '[\n' else '\n]')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -0,0 +1,99 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+def text_hash(text):
+    return hashlib.sha256(str(text).encode('utf-8')).hexdigest()
+
+class EmbeddingCache:
+    def __init__(self, path, model_name):
+        self.path = path
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                dimension INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self._conn.commit()
+    
+    def get_many(self, texts):
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+        with self._lock:
+            unique_hashes = list(set(hashes))
+            for start in range(0, len(unique_hashes), 500):
+                chunk = unique_hashes[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, dimension, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [self.model_name] + chunk
+                ).fetchall()
+                for row_hash, dimension, vector in rows:
+                    found[row_hash] = np.frombuffer(vector, dtype='float32').reshape(dimension)
+            
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, self.model_name, row_hash) for row_hash in found]
+                )
+                self._conn.commit()
+            
+            results = {}
+            for position, row_hash in enumerate(hashes):
+                if row_hash in found:
+                    results[position] = found[row_hash]
+            self.hits += len(results)
+            self.misses += len(texts) - len(results)
+        return results
+    
+    def put_many(self, texts, vectors):
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            vector = np.asarray(vector, dtype='float32')
+            rows.append((self.model_name, text_hash(text), int(vector.shape[0]), vector.tobytes(), now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, dimension, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+    
+    def evict_unused_since(self, timestamp):
+        # 命中与写入都会刷新last_used；重建前记下时间，重建后未被用到的条目即已失效
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM embeddings WHERE model = ? AND last_used < ?", (self.model_name, timestamp)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+    
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute(
+                "SELECT COUNT(*) FROM embeddings WHERE model = ?", (self.model_name,)
+            ).fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': entries
+        }
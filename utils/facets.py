@@ -0,0 +1,96 @@
+import threading
+from collections import deque
+
+# 各分析Agent关注的主题及其关键词；索引构建时为每个文档预先计算命中的主题
+FACET_KEYWORDS = {
+    'subject': ['主体', '年龄', '累犯', '初犯', '未成年', '精神', '责任能力'],
+    'behavior': ['行为', '故意', '过失', '手段', '方法', '犯罪构成', '客观要件'],
+    'scenario': ['情节', '从轻', '从重', '减轻', '加重', '特别严重', '严重', '轻微'],
+    'result': ['结果', '后果', '损失', '伤害', '死亡', '财产', '精神', '社会危害'],
+}
+
+class AhoCorasick:
+    def __init__(self, patterns):
+        # patterns: [(模式串, 命中时返回的值)]
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [set()]
+        for pattern, value in patterns:
+            if pattern:
+                self._insert(pattern, value)
+        self._build_fail_links()
+
+    def _insert(self, pattern, value):
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(set())
+            node = next_node
+        self._output[node].add(value)
+
+    def _build_fail_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] |= self._output[self._fail[child]]
+
+    def find(self, text, limit=None):
+        # 返回文本中命中的所有值；已命中limit个不同值时提前结束
+        found = set()
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found |= output[node]
+                if limit is not None and len(found) >= limit:
+                    break
+        return found
+
+class FacetTagger:
+    def __init__(self, facet_keywords=None):
+        facet_keywords = facet_keywords or FACET_KEYWORDS
+        self.facets = tuple(facet_keywords)
+        self._matcher = AhoCorasick(
+            (keyword, facet) for facet, keywords in facet_keywords.items() for keyword in keywords
+        )
+
+    def tag(self, text):
+        found = self._matcher.find(str(text), limit=len(self.facets))
+        return [facet for facet in self.facets if facet in found]
+
+_default_tagger = None
+_default_tagger_lock = threading.Lock()
+
+def get_facet_tagger():
+    global _default_tagger
+    with _default_tagger_lock:
+        if _default_tagger is None:
+            _default_tagger = FacetTagger()
+        return _default_tagger
+
+def tag_entry(entry):
+    tagged = dict(entry)
+    tagged['facets'] = get_facet_tagger().tag(str(entry['content']))
+    return tagged
+
+def has_facet(item, facet):
+    facets = item.get('facets')
+    if facets is None:
+        # 旧版元数据没有预计算标签，首次访问时补算并记在条目上
+        facets = get_facet_tagger().tag(str(item.get('content', '')))
+        item['facets'] = facets
+    return facet in facets
@@ -0,0 +1,23 @@
+import numpy as np
+
+HASHING_DIMENSION = 384
+
+class HashingEncoder:
+    # 离线基准与测试使用的确定性编码器: 字符与相邻字符对的带符号哈希特征，接口与SentenceTransformer一致
+    def __init__(self, dimension=HASHING_DIMENSION):
+        self.dimension = dimension
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, **kwargs):
+        embeddings = np.zeros((len(texts), self.dimension), dtype='float32')
+        for row, text in enumerate(texts):
+            codes = np.frombuffer(str(text).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+            if codes.size == 0:
+                continue
+            features = np.concatenate([codes, codes[:-1] * np.uint64(65599) + codes[1:]])
+            hashed = (features * np.uint64(2654435761)) & np.uint64(0xffffffff)
+            signs = np.where((hashed >> np.uint64(16)) & np.uint64(1), 1.0, -1.0)
+            embeddings[row] = np.bincount((hashed % np.uint64(self.dimension)).astype(np.int64), weights=signs, minlength=self.dimension)
+        return embeddings
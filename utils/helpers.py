@@ -1,17 +1,133 @@
 import requests
 import json
 import os
+import threading
+import time
+from contextlib import contextmanager
 from typing import Dict, List, Any
 import urllib3
 from urllib.parse import quote
+from utils.llm_errors import (
+    LLMError, LLMTimeoutError, LLMConnectionError, LLMResponseError, LLMEncodingError,
+    error_from_status, parse_retry_after
+)
+from utils.rate_limit import get_default_scheduler
+from utils.tracing import record_llm_call, record_cache
 
 # 禁用SSL警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# LLM响应缓存: 仅温度不高于阈值的请求默认缓存；阈值与界面和HTTP接口的默认温度(0.1)一致，调高温度后不再缓存
+# 调用方可传入cache_check(响应文本)，返回False的响应(如无法解析的输出)不写入也不读取缓存
+LLM_CACHE_ENABLED = True
+LLM_CACHE_PATH = 'data/llm_cache.sqlite'
+LLM_CACHE_MAX_TEMPERATURE = 0.1
+LLM_CACHE_MAX_ENTRIES = 10000
+LLM_CACHE_TTL = 7 * 24 * 3600
+
+# 可通过环境变量指向本地模拟服务(见 mock_openrouter.py)
+OPENROUTER_BASE_URL = os.environ.get('OPENROUTER_BASE_URL', "https://openrouter.ai/api/v1")
+# 流式请求: (连接超时, 相邻两个数据块之间的读超时)
+STREAM_TIMEOUT = (10, 60)
+
+_default_llm_cache = None
+_default_llm_cache_lock = threading.Lock()
+
+def build_chat_payload(prompt, model: str, temperature: float, max_tokens: int, stream: bool = False) -> bytes:
+    # 确保prompt是UTF-8字符串
+    if isinstance(prompt, bytes):
+        prompt = prompt.decode('utf-8', errors='replace')
+    
+    # 确保所有字符串都是正确编码的
+    prompt = str(prompt)
+    
+    payload = {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": max_tokens,
+        "temperature": temperature
+    }
+    if stream:
+        payload["stream"] = True
+        # 要求在最后一个数据块中返回token用量
+        payload["stream_options"] = {"include_usage": True}
+    
+    # 使用ensure_ascii=False并显式编码为UTF-8字节
+    return json.dumps(payload, ensure_ascii=False).encode('utf-8')
+
+def parse_completion_response(data) -> str:
+    if 'choices' in data and len(data['choices']) > 0:
+        return str(data['choices'][0]['message']['content'])
+    raise LLMResponseError("API响应格式错误: 未找到choices字段")
+
+def parse_usage(data):
+    usage = data.get('usage') if isinstance(data, dict) else None
+    if not isinstance(usage, dict):
+        return None
+    return {
+        'prompt_tokens': usage.get('prompt_tokens'),
+        'completion_tokens': usage.get('completion_tokens'),
+        'total_tokens': usage.get('total_tokens')
+    }
+
+def parse_stream_event(data: str):
+    # 返回(增量文本, token用量)，用量只出现在最后一个数据块中
+    event = json.loads(data)
+    if 'error' in event:
+        error = event['error']
+        message = error.get('message', error) if isinstance(error, dict) else error
+        code = error.get('code') if isinstance(error, dict) else None
+        if isinstance(code, int):
+            raise error_from_status(code, message)
+        raise LLMResponseError(f"API请求错误: {message}")
+    usage = parse_usage(event)
+    choices = event.get('choices') or []
+    if not choices:
+        return None, usage
+    return (choices[0].get('delta') or {}).get('content'), usage
+
+def translate_error(e: Exception) -> LLMError:
+    if isinstance(e, LLMError):
+        return e
+    if isinstance(e, requests.exceptions.HTTPError):
+        return error_from_status(
+            e.response.status_code,
+            e.response.text,
+            parse_retry_after(e.response.headers.get('Retry-After'))
+        )
+    if isinstance(e, requests.exceptions.Timeout):
+        return LLMTimeoutError("API请求错误: 请求超时")
+    if isinstance(e, requests.exceptions.ConnectionError):
+        return LLMConnectionError("API请求错误: 网络连接失败")
+    if isinstance(e, json.JSONDecodeError):
+        return LLMResponseError(f"API响应格式错误: JSON解析失败 - {str(e)}")
+    if isinstance(e, UnicodeEncodeError):
+        return LLMEncodingError(f"编码错误: {str(e)} - 请检查输入文本的字符编码")
+    if isinstance(e, UnicodeDecodeError):
+        return LLMEncodingError(f"解码错误: {str(e)} - 服务器响应编码问题")
+    return LLMError(f"未知错误: {str(e)}")
+
+def get_default_llm_cache():
+    global _default_llm_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _default_llm_cache_lock:
+        if _default_llm_cache is None:
+            from utils.llm_cache import LLMResponseCache
+            try:
+                _default_llm_cache = LLMResponseCache(LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL)
+            except Exception as e:
+                print(f"警告: LLM响应缓存不可用: {e}")
+                return None
+        return _default_llm_cache
+
 class OpenRouterClient:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, response_cache=None, base_url: str = None, scheduler=None):
         self.api_key = api_key
-        self.base_url = "https://openrouter.ai/api/v1"
+        self.response_cache = response_cache if response_cache is not None else get_default_llm_cache()
+        self.cache_max_temperature = LLM_CACHE_MAX_TEMPERATURE
+        self.scheduler = scheduler if scheduler is not None else get_default_scheduler()
+        self.base_url = (base_url or OPENROUTER_BASE_URL).rstrip('/')
         self.session = requests.Session()
         self.session.headers.update({
             "Authorization": f"Bearer {api_key}",
@@ -26,31 +142,117 @@ class OpenRouterClient:
     
     def test_connection(self) -> str:
         """测试API连接 - 使用简化的方法"""
-        return self.chat_completion("Hello, please respond in Chinese: 你好", "meta-llama/llama-3.1-8b-instruct:free")
+        try:
+            return self.chat_completion("Hello, please respond in Chinese: 你好", "meta-llama/llama-3.1-8b-instruct:free")
+        except LLMError as e:
+            return e.message
     
-    def chat_completion(self, prompt: str, model: str = "anthropic/claude-3.5-sonnet", temperature: float = 0.1, max_tokens: int = 4000) -> str:
-        url = f"{self.base_url}/chat/completions"
+    def _cache_for(self, temperature: float, use_cache: bool):
+        if use_cache is None:
+            use_cache = temperature <= self.cache_max_temperature
+        return self.response_cache if use_cache else None
+    
+    def chat_completion(self, prompt: str, model: str = "anthropic/claude-3.5-sonnet", temperature: float = 0.1, max_tokens: int = 4000, use_cache: bool = None, cache_check=None) -> str:
+        cache = self._cache_for(temperature, use_cache)
         
-        # 确保prompt是UTF-8字符串
-        if isinstance(prompt, bytes):
-            prompt = prompt.decode('utf-8', errors='replace')
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key(model, temperature, max_tokens, prompt)
+            cached = cache.get(cache_key)
+            if cached is not None and cache_check is not None and not cache_check(cached):
+                cached = None
+            record_cache('llm_response', cached is not None)
+            if cached is not None:
+                record_llm_call(model, 0.0, cached=True)
+                return cached
         
-        # 确保所有字符串都是正确编码的
-        prompt = str(prompt)
+        started = time.perf_counter()
+        try:
+            response, usage = self.scheduler.call(
+                self.api_key, model,
+                lambda: self._request_completion(prompt, model, temperature, max_tokens)
+            )
+        except LLMError as e:
+            record_llm_call(model, time.perf_counter() - started, error=type(e).__name__)
+            raise
+        record_llm_call(model, time.perf_counter() - started, usage)
+        
+        if cache is not None and (cache_check is None or cache_check(response)):
+            cache.put(cache_key, model, response)
+        return response
+    
+    def chat_completion_stream(self, prompt: str, model: str = "anthropic/claude-3.5-sonnet", temperature: float = 0.1, max_tokens: int = 4000, use_cache: bool = None, cache_check=None):
+        cache = self._cache_for(temperature, use_cache)
         
-        payload = {
-            "model": model,
-            "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": max_tokens,
-            "temperature": temperature
-        }
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key(model, temperature, max_tokens, prompt)
+            cached = cache.get(cache_key)
+            if cached is not None and cache_check is not None and not cache_check(cached):
+                cached = None
+            record_cache('llm_response', cached is not None)
+            if cached is not None:
+                record_llm_call(model, 0.0, cached=True, stream=True)
+                yield cached
+                return
         
+        chunks = []
+        usage = {}
+        attempt = 0
+        started = time.perf_counter()
+        while True:
+            try:
+                with self.scheduler.slot(self.api_key, model):
+                    for chunk in self._request_completion_stream(prompt, model, temperature, max_tokens, usage):
+                        chunks.append(chunk)
+                        yield chunk
+                break
+            except LLMError as e:
+                # 已输出部分内容后不再重试，避免重复输出
+                if chunks or not self.scheduler.should_retry(e, attempt):
+                    record_llm_call(model, time.perf_counter() - started, stream=True, error=type(e).__name__)
+                    raise
+                time.sleep(self.scheduler.backoff_delay(self.api_key, e, attempt))
+                attempt += 1
+        record_llm_call(model, time.perf_counter() - started, usage, stream=True)
+        
+        response = ''.join(chunks)
+        if cache is not None and chunks and (cache_check is None or cache_check(response)):
+            cache.put(cache_key, model, response)
+    
+    def _request_completion_stream(self, prompt, model: str, temperature: float, max_tokens: int, usage: dict = None):
+        url = f"{self.base_url}/chat/completions"
+        response = None
         try:
-            # 使用ensure_ascii=False和指定编码来处理JSON
-            json_data = json.dumps(payload, ensure_ascii=False)
+            json_bytes = build_chat_payload(prompt, model, temperature, max_tokens, stream=True)
+            response = self.session.post(
+                url,
+                data=json_bytes,
+                headers={"Accept": "text/event-stream"},
+                timeout=STREAM_TIMEOUT,
+                stream=True
+            )
+            response.raise_for_status()
             
-            # 显式编码为UTF-8字节
-            json_bytes = json_data.encode('utf-8')
+            for data in iter_sse_data(response.iter_content(chunk_size=None)):
+                if data == '[DONE]':
+                    break
+                content, event_usage = parse_stream_event(data)
+                if event_usage and usage is not None:
+                    usage.update(event_usage)
+                if content:
+                    yield str(content)
+        except Exception as e:
+            raise translate_error(e) from e
+        finally:
+            if response is not None:
+                response.close()
+    
+    def _request_completion(self, prompt: str, model: str, temperature: float, max_tokens: int) -> str:
+        url = f"{self.base_url}/chat/completions"
+        
+        try:
+            json_bytes = build_chat_payload(prompt, model, temperature, max_tokens)
             
             # 使用data参数发送字节数据
             response = self.session.post(
@@ -64,34 +266,121 @@ class OpenRouterClient:
             # 确保响应使用UTF-8解码
             response.encoding = 'utf-8' #  requests会自动根据header猜测，但显式设置更保险
             data = response.json()
-            
-            if 'choices' in data and len(data['choices']) > 0:
-                content = data['choices'][0]['message']['content']
-                return str(content)
-            else:
-                return "API响应格式错误: 未找到choices字段"
-                
-        except requests.exceptions.HTTPError as e:
-            error_message = f"API请求错误: HTTP {e.response.status_code}, 响应: {e.response.text}"
-            if e.response.status_code == 401:
-                error_message = "API请求错误: API Key无效或已过期"
-            elif e.response.status_code == 402:
-                error_message = "API请求错误: 账户余额不足"
-            elif e.response.status_code == 429:
-                error_message = "API请求错误: 请求过于频繁，请稍后重试"
-            return error_message
-        except requests.exceptions.Timeout:
-            return "API请求错误: 请求超时"
-        except requests.exceptions.ConnectionError:
-            return "API请求错误: 网络连接失败"
-        except json.JSONDecodeError as e:
-            return f"API响应格式错误: JSON解析失败 - {str(e)}"
-        except UnicodeEncodeError as e:
-            return f"编码错误: {str(e)} - 请检查输入文本的字符编码"
-        except UnicodeDecodeError as e:
-            return f"解码错误: {str(e)} - 服务器响应编码问题"
+            return parse_completion_response(data), parse_usage(data)
         except Exception as e:
-            return f"未知错误: {str(e)}"
+            raise translate_error(e) from e
+
+class SSEDecoder:
+    # 解析text/event-stream: decode()接收任意切分的字节块，feed()接收已切好的单行
+    def __init__(self):
+        self._buffer = b''
+        self._data_lines = []
+    
+    def decode(self, chunk):
+        # 返回本块中已完整的事件数据；不完整的行(包括被切开的多字节字符)留到下一块
+        buffer = self._buffer + chunk
+        # 末尾的\r可能是跨块的\r\n的前半部分
+        trailing_cr = buffer.endswith(b'\r')
+        if trailing_cr:
+            buffer = buffer[:-1]
+        lines = buffer.replace(b'\r\n', b'\n').replace(b'\r', b'\n').split(b'\n')
+        self._buffer = lines.pop() + (b'\r' if trailing_cr else b'')
+        events = []
+        for line in lines:
+            data = self.feed(line)
+            if data is not None:
+                events.append(data)
+        return events
+    
+    def feed(self, line):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.rstrip('\r')
+        if not line:
+            # 空行表示一个事件结束
+            return self._dispatch()
+        if line.startswith(':'):
+            # 注释行(如OpenRouter的处理中心跳)
+            return None
+        field, _, value = line.partition(':')
+        if field == 'data':
+            self._data_lines.append(value[1:] if value.startswith(' ') else value)
+        return None
+    
+    def flush(self):
+        # 流结束时处理最后一行与未以空行结束的事件
+        if self._buffer:
+            line, self._buffer = self._buffer, b''
+            data = self.feed(line)
+            if data is not None:
+                return data
+        return self._dispatch()
+    
+    def _dispatch(self):
+        if not self._data_lines:
+            return None
+        data = '\n'.join(self._data_lines)
+        self._data_lines = []
+        return data
+
+def iter_sse_data(chunks):
+    # chunks: 响应体的字节块，块边界可以落在行或事件的中间
+    decoder = SSEDecoder()
+    for chunk in chunks:
+        yield from decoder.decode(chunk)
+    data = decoder.flush()
+    if data is not None:
+        yield data
+
+def collect_stream(chunks, on_token=None) -> str:
+    collected = []
+    try:
+        for chunk in chunks:
+            collected.append(chunk)
+            if on_token:
+                on_token(chunk)
+    finally:
+        # 回调抛出异常(如分析超时后被取消)时立即关闭流，释放连接
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+    return ''.join(collected)
+
+class ReadWriteLock:
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+    
+    @contextmanager
+    def read_lock(self):
+        with self._condition:
+            while self._writer or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._condition.notify_all()
+    
+    @contextmanager
+    def write_lock(self):
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer = False
+                self._condition.notify_all()
 
 def ensure_directory_exists(directory_path: str):
     if not os.path.exists(directory_path):
@@ -175,7 +464,7 @@ def clean_analysis_text(text: str) -> str:
     # 确保文本是UTF-8编码
     if isinstance(text, bytes):
         text = text.decode('utf-8', errors='replace')
-        
+    
     lines = str(text).split('\n')
     cleaned_lines = []
     
@@ -186,6 +475,9 @@ def clean_analysis_text(text: str) -> str:
     
     return '\n'.join(cleaned_lines)
 
+# 条文序号中可能出现的数字字符(含"第一百零二条"中的零、"第两百条"中的两)，提取与规范化共用
+ARTICLE_NUMERAL_CHARS = r'一二三四五六七八九十百千万零〇两\d'
+
 def get_law_article_number(text: str) -> List[str]:
     import re
     
@@ -193,7 +485,43 @@ def get_law_article_number(text: str) -> List[str]:
     if isinstance(text, bytes):
         text = text.decode('utf-8', errors='replace')
     
-    pattern = r'第[一二三四五六七八九十百千万\d]+条'
+    pattern = rf'第[{ARTICLE_NUMERAL_CHARS}]+条'
     matches = re.findall(pattern, str(text))
     
-    return list(set(matches)) 
\ No newline at end of file
+    return list(set(matches)) 
+
+def chinese_numeral_to_int(text: str):
+    text = str(text)
+    if text.isdigit():
+        return int(text)
+    
+    digits = {'零': 0, '〇': 0, '一': 1, '二': 2, '两': 2, '三': 3, '四': 4, '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
+    units = {'十': 10, '百': 100, '千': 1000, '万': 10000}
+    if text and all(char in digits for char in text):
+        # 逐位书写的序号，如"一〇二"
+        return int(''.join(str(digits[char]) for char in text))
+    
+    total, section, number = 0, 0, 0
+    for char in text:
+        if char in digits:
+            number = digits[char]
+        elif char in units:
+            unit = units[char]
+            if unit == 10000:
+                total += (section + number) * unit
+                section = 0
+            else:
+                section += (number or 1) * unit
+            number = 0
+        else:
+            return None
+    return total + section + number
+
+def normalize_law_article_number(article: str) -> str:
+    import re
+    
+    match = re.fullmatch(rf'第([{ARTICLE_NUMERAL_CHARS}]+)条', str(article))
+    if not match:
+        return str(article)
+    number = chinese_numeral_to_int(match.group(1))
+    return f"第{number}条" if number is not None else str(article)
\ No newline at end of file
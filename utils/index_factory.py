@@ -0,0 +1,221 @@
+import logging
+import math
+import time
+import numpy as np
+import faiss
+
+logger = logging.getLogger('lawagent.index')
+
+INDEX_TYPES = ('flat', 'sq_fp16', 'sq8', 'pq', 'ivf_flat', 'ivf_pq', 'hnsw')
+
+# 标量量化: 每维以float16(2字节)或int8(1字节)存储，相对float32分别节省1/2与3/4内存
+SCALAR_QUANTIZER_TYPES = {
+    'sq_fp16': faiss.ScalarQuantizer.QT_fp16,
+    'sq8': faiss.ScalarQuantizer.QT_8bit
+}
+
+DEFAULT_INDEX_PARAMS = {
+    'nlist': None,
+    'pq_m': 48,
+    'pq_nbits': 8,
+    'hnsw_m': 32,
+    'ef_construction': 200,
+    'nprobe': 16,
+    'ef_search': 64
+}
+
+# IVF/PQ训练样本少于该数量时退化为精确索引
+MIN_TRAINING_POINTS = 1000
+# 各索引类型所需的最少训练样本；SQ8只需统计每维取值范围
+TYPE_MIN_TRAINING_POINTS = {
+    'sq8': 1,
+    'pq': MIN_TRAINING_POINTS,
+    'ivf_flat': MIN_TRAINING_POINTS,
+    'ivf_pq': MIN_TRAINING_POINTS
+}
+
+# 各索引类型受影响的构建参数，写入清单文件；nprobe/ef_search只影响检索
+TYPE_BUILD_PARAMS = {
+    'pq': ('pq_m', 'pq_nbits'),
+    'ivf_flat': ('nlist',),
+    'ivf_pq': ('nlist', 'pq_m', 'pq_nbits'),
+    'hnsw': ('hnsw_m', 'ef_construction')
+}
+
+def resolve_index_params(index_params=None):
+    params = dict(DEFAULT_INDEX_PARAMS)
+    if index_params:
+        params.update({key: value for key, value in index_params.items() if value is not None})
+    return params
+
+def _choose_nlist(num_vectors, requested=None):
+    if requested:
+        return max(1, min(int(requested), num_vectors))
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+
+def _choose_pq_m(dimension, requested):
+    for m in range(min(requested, dimension), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+def create_index(index_type, dimension, training_vectors=None, index_params=None):
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"不支持的索引类型: {index_type}，可选: {', '.join(INDEX_TYPES)}")
+
+    params = resolve_index_params(index_params)
+    num_training = 0 if training_vectors is None else training_vectors.shape[0]
+
+    min_training = TYPE_MIN_TRAINING_POINTS.get(index_type, 0)
+    if num_training < min_training:
+        logger.warning(f"训练样本 {num_training} 个少于 {min_training} 个，{index_type} 索引退化为精确索引")
+        index_type = 'flat'
+
+    if index_type == 'flat':
+        return faiss.IndexIDMap(faiss.IndexFlatIP(dimension))
+
+    if index_type in SCALAR_QUANTIZER_TYPES:
+        sq_index = faiss.IndexScalarQuantizer(dimension, SCALAR_QUANTIZER_TYPES[index_type], faiss.METRIC_INNER_PRODUCT)
+        if not sq_index.is_trained:
+            sq_index.train(training_vectors)
+        return faiss.IndexIDMap(sq_index)
+
+    if index_type == 'pq':
+        pq_index = faiss.IndexPQ(dimension, _choose_pq_m(dimension, params['pq_m']), params['pq_nbits'], faiss.METRIC_INNER_PRODUCT)
+        pq_index.train(training_vectors)
+        return faiss.IndexIDMap(pq_index)
+
+    if index_type == 'hnsw':
+        hnsw_index = faiss.IndexHNSWFlat(dimension, params['hnsw_m'], faiss.METRIC_INNER_PRODUCT)
+        hnsw_index.hnsw.efConstruction = params['ef_construction']
+        hnsw_index.hnsw.efSearch = params['ef_search']
+        return faiss.IndexIDMap(hnsw_index)
+
+    nlist = _choose_nlist(num_training, params['nlist'])
+    quantizer = faiss.IndexFlatIP(dimension)
+    if index_type == 'ivf_flat':
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+    else:
+        pq_m = _choose_pq_m(dimension, params['pq_m'])
+        index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m, params['pq_nbits'], faiss.METRIC_INNER_PRODUCT)
+    index.train(training_vectors)
+    index.nprobe = min(params['nprobe'], nlist)
+    # IVF的倒排表直接存储外部id并支持add_with_ids/remove_ids，因此不像其他类型那样包装IndexIDMap
+    return index
+
+def detect_index_type(index):
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexHNSW):
+        return 'hnsw'
+    if isinstance(index, faiss.IndexIVFPQ):
+        return 'ivf_pq'
+    if isinstance(index, faiss.IndexIVFFlat):
+        return 'ivf_flat'
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        for index_type, qtype in SCALAR_QUANTIZER_TYPES.items():
+            if index.sq.qtype == qtype:
+                return index_type
+        return 'unknown'
+    if isinstance(index, faiss.IndexPQ):
+        return 'pq'
+    if isinstance(index, faiss.IndexFlat):
+        return 'flat'
+    return 'unknown'
+
+def index_matches_type(index, index_type):
+    actual_type = detect_index_type(index)
+    if actual_type == index_type:
+        return True
+    return actual_type == 'flat' and index.ntotal < TYPE_MIN_TRAINING_POINTS.get(index_type, 0)
+
+def _build_params(index_type, index_params):
+    params = resolve_index_params(index_params)
+    return {key: params[key] for key in TYPE_BUILD_PARAMS.get(index_type, ())}
+
+def build_manifest(index, index_type, index_params=None, **extra):
+    # 随索引文件一起保存的清单，记录索引类型与构建参数，加载时据此判断能否直接复用
+    manifest = {
+        'index_type': index_type,
+        'effective_type': detect_index_type(index),
+        'dimension': index.d,
+        'build_params': _build_params(index_type, index_params),
+        'faiss_version': getattr(faiss, '__version__', None)
+    }
+    manifest.update(extra)
+    return manifest
+
+def manifest_matches(manifest, index_type, index_params=None, **extra):
+    if manifest.get('index_type') != index_type:
+        return False
+    if manifest.get('build_params') != _build_params(index_type, index_params):
+        return False
+    return all(manifest.get(key) == value for key, value in extra.items())
+
+def mmap_io_flags(index_type):
+    # IO_FLAG_MMAP只映射IVF的倒排表；flat/SQ/PQ/HNSW的向量编码(IndexFlatCodes)需要MMAP_IFC才不会被复制进内存
+    if index_type in ('ivf_flat', 'ivf_pq'):
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    return getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+def index_size_bytes(index):
+    return int(faiss.serialize_index(index).nbytes)
+
+def supports_remove(index):
+    return detect_index_type(index) != 'hnsw'
+
+def build_search_parameters(index, nprobe=None, ef_search=None):
+    index_type = detect_index_type(index)
+    if index_type in ('ivf_flat', 'ivf_pq') and nprobe:
+        return faiss.SearchParametersIVF(nprobe=int(nprobe))
+    if index_type == 'hnsw' and ef_search:
+        return faiss.SearchParametersHNSW(efSearch=int(ef_search))
+    return None
+
+def search_index(index, query_vectors, k, nprobe=None, ef_search=None):
+    params = build_search_parameters(index, nprobe, ef_search)
+    if params is None:
+        return index.search(query_vectors, k)
+    return index.search(query_vectors, k, params=params)
+
+def recall_latency_report(doc_vectors, query_vectors, configs, top_k=10):
+    doc_ids = np.arange(doc_vectors.shape[0], dtype='int64')
+    k = min(top_k, doc_vectors.shape[0])
+
+    exact_index = create_index('flat', doc_vectors.shape[1])
+    exact_index.add_with_ids(doc_vectors, doc_ids)
+    _, exact_ids = exact_index.search(query_vectors, k)
+
+    report = []
+    for config in configs:
+        config = dict(config)
+        index_type = config.pop('index_type', 'flat')
+        nprobe = config.get('nprobe')
+        ef_search = config.get('ef_search')
+
+        build_started = time.perf_counter()
+        index = create_index(index_type, doc_vectors.shape[1], doc_vectors, config)
+        index.add_with_ids(doc_vectors, doc_ids)
+        build_seconds = time.perf_counter() - build_started
+
+        latencies = []
+        hits = 0
+        for position in range(query_vectors.shape[0]):
+            started = time.perf_counter()
+            _, ids = search_index(index, query_vectors[position:position + 1], k, nprobe, ef_search)
+            latencies.append((time.perf_counter() - started) * 1000)
+            hits += len(set(ids[0].tolist()) & set(exact_ids[position].tolist()))
+
+        report.append({
+            'index_type': index_type,
+            'effective_type': detect_index_type(index),
+            'params': config,
+            'build_seconds': build_seconds,
+            'index_bytes': index_size_bytes(index),
+            'top_k': k,
+            'recall': hits / (k * query_vectors.shape[0]) if query_vectors.shape[0] else 0.0,
+            'latency_ms_mean': float(np.mean(latencies)) if latencies else 0.0,
+            'latency_ms_p95': float(np.percentile(latencies, 95)) if latencies else 0.0
+        })
+    return report
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+class LLMResponseCache:
+    def __init__(self, path, max_entries=10000, ttl=7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._writes_since_eviction = 0
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                cache_key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+    
+    @staticmethod
+    def make_key(model, temperature, max_tokens, prompt):
+        prompt_hash = hashlib.sha256(str(prompt).encode('utf-8')).hexdigest()
+        raw_key = json.dumps([model, round(float(temperature), 4), int(max_tokens), prompt_hash])
+        return hashlib.sha256(raw_key.encode('utf-8')).hexdigest()
+    
+    def get(self, cache_key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE cache_key = ?", (now, cache_key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+    
+    def put(self, cache_key, model, response):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (cache_key, model, response, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (cache_key, model, response, now, now)
+            )
+            self._conn.commit()
+            self._writes_since_eviction += 1
+            if self._writes_since_eviction >= 100:
+                self._evict()
+    
+    def evict(self):
+        with self._lock:
+            return self._evict()
+    
+    def _evict(self):
+        self._writes_since_eviction = 0
+        removed = 0
+        if self.ttl is not None:
+            removed += self._conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,)
+            ).rowcount
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if self.max_entries is not None and count > self.max_entries:
+            removed += self._conn.execute(
+                "DELETE FROM responses WHERE cache_key IN (SELECT cache_key FROM responses ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,)
+            ).rowcount
+        self._conn.commit()
+        return removed
+    
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+    
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': entries
+        }
@@ -0,0 +1,62 @@
+import time
+from email.utils import parsedate_to_datetime
+
+class LLMError(Exception):
+    retryable = False
+    # 由流水线填写: 出错的阶段(input/analysis)与各分析Agent的失败信息 {key: 说明}
+    stage = None
+    failures = None
+    
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class LLMAuthError(LLMError):
+    pass
+
+class LLMQuotaError(LLMError):
+    pass
+
+class LLMRateLimitError(LLMError):
+    retryable = True
+
+class LLMServerError(LLMError):
+    retryable = True
+
+class LLMTimeoutError(LLMError):
+    retryable = True
+
+class LLMConnectionError(LLMError):
+    retryable = True
+
+class LLMResponseError(LLMError):
+    pass
+
+class LLMEncodingError(LLMError):
+    pass
+
+def parse_retry_after(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+def error_from_status(status_code, text='', retry_after=None):
+    if status_code in (401, 403):
+        return LLMAuthError("API请求错误: API Key无效或已过期", status_code)
+    if status_code == 402:
+        return LLMQuotaError("API请求错误: 账户余额不足", status_code)
+    if status_code == 429:
+        return LLMRateLimitError("API请求错误: 请求过于频繁，请稍后重试", status_code, retry_after)
+    if status_code == 408 or status_code >= 500:
+        return LLMServerError(f"API请求错误: HTTP {status_code}, 响应: {text}", status_code, retry_after)
+    return LLMError(f"API请求错误: HTTP {status_code}, 响应: {text}", status_code)
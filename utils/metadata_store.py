@@ -0,0 +1,338 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+import numpy as np
+
+class MetadataStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_id INTEGER PRIMARY KEY,
+                type TEXT NOT NULL,
+                doc_key TEXT NOT NULL,
+                content TEXT NOT NULL,
+                facets TEXT
+            )
+        """)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(documents)")}
+        if 'facets' not in columns:
+            # 旧版元数据库没有主题标签列，补充后旧记录的标签为NULL
+            self._conn.execute("ALTER TABLE documents ADD COLUMN facets TEXT")
+        # BM25倒排表与条文号索引随元数据一起持久化，启动时无需重新分词。
+        # 每次写入的一批文档组成一个倒排块，每个词项在块内一行，文档ID/词频/文档长度以数组BLOB保存；
+        # 文档被修改或删除时只在bm25_deleted中标记旧块里的记录，检索时过滤
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS bm25_blocks (
+                term TEXT NOT NULL,
+                block INTEGER NOT NULL,
+                doc_ids BLOB NOT NULL,
+                tfs BLOB NOT NULL,
+                lengths BLOB NOT NULL,
+                PRIMARY KEY (term, block)
+            ) WITHOUT ROWID
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS bm25_blocks_block ON bm25_blocks (block)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS bm25_docs (doc_id INTEGER PRIMARY KEY, block INTEGER NOT NULL, length INTEGER NOT NULL)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS bm25_deleted (
+                block INTEGER NOT NULL,
+                doc_id INTEGER NOT NULL,
+                PRIMARY KEY (block, doc_id)
+            ) WITHOUT ROWID
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS bm25_stats (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                documents INTEGER NOT NULL,
+                total_length INTEGER NOT NULL,
+                next_block INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("INSERT OR IGNORE INTO bm25_stats (id, documents, total_length, next_block) VALUES (0, 0, 0, 0)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS articles (
+                article TEXT NOT NULL,
+                doc_id INTEGER NOT NULL,
+                PRIMARY KEY (article, doc_id)
+            ) WITHOUT ROWID
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS articles_doc ON articles (doc_id)")
+        self._conn.commit()
+    
+    @classmethod
+    def create_build(cls, path):
+        # 在临时文件中逐批写入新元数据，finish_build后由调用方替换正式文件
+        tmp_path = f"{path}.tmp"
+        for stale_path in (tmp_path, f"{tmp_path}-wal", f"{tmp_path}-shm"):
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+        return cls(tmp_path)
+    
+    def finish_build(self):
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        self.close()
+        return self.path
+    
+    @classmethod
+    def build(cls, path, items):
+        store = cls.create_build(path)
+        store.upsert_many(items)
+        return store.finish_build()
+    
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+    
+    def _row_to_entry(self, row):
+        doc_type, doc_key, content, facets = row
+        entry = {
+            'type': doc_type,
+            'id': doc_key,
+            'content': json.loads(content)
+        }
+        if facets is not None:
+            entry['facets'] = facets.split(',') if facets else []
+        return entry
+    
+    def get(self, doc_id, default=None):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT type, doc_key, content, facets FROM documents WHERE doc_id = ?", (int(doc_id),)
+            ).fetchone()
+        return self._row_to_entry(row) if row else default
+    
+    def get_many(self, doc_ids):
+        doc_ids = [int(doc_id) for doc_id in doc_ids]
+        entries = {}
+        with self._lock:
+            for start in range(0, len(doc_ids), 500):
+                chunk = doc_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT doc_id, type, doc_key, content, facets FROM documents WHERE doc_id IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                for row in rows:
+                    entries[row[0]] = self._row_to_entry(row[1:])
+        return entries
+    
+    def __contains__(self, doc_id):
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM documents WHERE doc_id = ?", (int(doc_id),)).fetchone()
+        return row is not None
+    
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+    
+    def upsert_many(self, items):
+        rows = [
+            (int(doc_id), entry['type'], str(entry.get('id', '')), json.dumps(entry['content'], ensure_ascii=False),
+             ','.join(entry['facets']) if entry.get('facets') is not None else None)
+            for doc_id, entry in items
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO documents (doc_id, type, doc_key, content, facets) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+    
+    def delete_many(self, doc_ids):
+        with self._lock:
+            self._conn.executemany("DELETE FROM documents WHERE doc_id = ?", [(int(doc_id),) for doc_id in doc_ids])
+            self._conn.commit()
+    
+    def iter_entries(self, batch_size=1000):
+        # 按doc_id分批读取全部文档，用于从元数据重建词法索引
+        query = "SELECT doc_id, type, doc_key, content, facets FROM documents {} ORDER BY doc_id LIMIT ?"
+        params = ()
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    query.format("WHERE doc_id > ?" if params else ""), params + (batch_size,)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row[0], self._row_to_entry(row[1:])
+            params = (rows[-1][0],)
+    
+    def _remove_terms(self, doc_ids):
+        # 调用方需持有锁并提交事务；把文档在旧倒排块中的记录标记为删除，返回删除的文档数与词项总数
+        removed_docs = 0
+        removed_length = 0
+        for start in range(0, len(doc_ids), 500):
+            chunk = doc_ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self._conn.execute(
+                f"SELECT doc_id, block, length FROM bm25_docs WHERE doc_id IN ({placeholders})", chunk
+            ).fetchall()
+            if not rows:
+                continue
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO bm25_deleted (block, doc_id) VALUES (?, ?)", [(block, doc_id) for doc_id, block, _ in rows]
+            )
+            self._conn.execute(f"DELETE FROM bm25_docs WHERE doc_id IN ({placeholders})", chunk)
+            removed_docs += len(rows)
+            removed_length += sum(length for _, _, length in rows)
+        return removed_docs, removed_length
+    
+    def _allocate_block(self):
+        # 调用方需持有锁；先递增块号以取得数据库写锁，多进程写入同一元数据库时块号不会重复
+        self._conn.execute("UPDATE bm25_stats SET next_block = next_block + 1 WHERE id = 0")
+        return self._conn.execute("SELECT next_block - 1 FROM bm25_stats WHERE id = 0").fetchone()[0]
+    
+    def _insert_block(self, block, postings):
+        # postings: {词项: (文档ID数组, 词频数组, 文档长度数组)}
+        self._conn.executemany(
+            "INSERT INTO bm25_blocks (term, block, doc_ids, tfs, lengths) VALUES (?, ?, ?, ?, ?)",
+            [(term, block, doc_ids.astype('int64').tobytes(), tfs.astype('int32').tobytes(), lengths.astype('int32').tobytes())
+             for term, (doc_ids, tfs, lengths) in sorted(postings.items()) if len(doc_ids)]
+        )
+    
+    def upsert_terms(self, items):
+        # items: [(doc_id, {词项: 词频})]，整批写入一个新的倒排块；已有的文档先标记删除，重放增量日志时结果不变
+        items = list({int(doc_id): term_counts for doc_id, term_counts in items}.items())
+        lengths = {doc_id: sum(term_counts.values()) for doc_id, term_counts in items}
+        postings = defaultdict(list)
+        for doc_id, term_counts in items:
+            for term, count in term_counts.items():
+                postings[term].append((doc_id, count, lengths[doc_id]))
+        postings = {term: tuple(np.array(values) for values in zip(*term_postings)) for term, term_postings in postings.items()}
+        with self._lock:
+            block = self._allocate_block()
+            removed_docs, removed_length = self._remove_terms(list(lengths))
+            self._conn.executemany(
+                "INSERT INTO bm25_docs (doc_id, block, length) VALUES (?, ?, ?)",
+                [(doc_id, block, length) for doc_id, length in lengths.items()]
+            )
+            self._insert_block(block, postings)
+            self._conn.execute(
+                "UPDATE bm25_stats SET documents = documents + ?, total_length = total_length + ? WHERE id = 0",
+                (len(lengths) - removed_docs, sum(lengths.values()) - removed_length)
+            )
+            self._conn.commit()
+    
+    def delete_terms(self, doc_ids):
+        with self._lock:
+            removed_docs, removed_length = self._remove_terms([int(doc_id) for doc_id in doc_ids])
+            self._conn.execute(
+                "UPDATE bm25_stats SET documents = documents - ?, total_length = total_length - ? WHERE id = 0",
+                (removed_docs, removed_length)
+            )
+            self._conn.commit()
+    
+    def clear_terms(self):
+        with self._lock:
+            for table in ('bm25_blocks', 'bm25_docs', 'bm25_deleted'):
+                self._conn.execute(f"DELETE FROM {table}")
+            self._conn.execute("UPDATE bm25_stats SET documents = 0, total_length = 0, next_block = 0 WHERE id = 0")
+            self._conn.commit()
+    
+    def term_stats(self):
+        # (文档数, 词项总数)
+        with self._lock:
+            return self._conn.execute("SELECT documents, total_length FROM bm25_stats WHERE id = 0").fetchone()
+    
+    def term_postings(self, terms):
+        # 返回{词项: (文档ID数组, 词频数组, 文档长度数组)}，已过滤被标记删除的记录
+        terms = list(terms)
+        if not terms:
+            return {}
+        with self._lock:
+            # 倒排块与删除标记在同一个读事务中读取，避免其他进程在两次查询之间合并倒排块
+            self._conn.execute("BEGIN")
+            try:
+                rows = self._conn.execute(
+                    f"SELECT term, block, doc_ids, tfs, lengths FROM bm25_blocks WHERE term IN ({','.join('?' * len(terms))})", terms
+                ).fetchall()
+                deleted = self._deleted_in_blocks(sorted({row[1] for row in rows}))
+            finally:
+                self._conn.commit()
+        return self._merge_postings(rows, deleted)
+    
+    def _deleted_in_blocks(self, blocks):
+        deleted = defaultdict(list)
+        for start in range(0, len(blocks), 500):
+            chunk = blocks[start:start + 500]
+            for block, doc_id in self._conn.execute(
+                f"SELECT block, doc_id FROM bm25_deleted WHERE block IN ({','.join('?' * len(chunk))})", chunk
+            ):
+                deleted[block].append(doc_id)
+        return deleted
+    
+    def _merge_postings(self, rows, deleted):
+        # 解码倒排块并过滤被标记删除的记录，同一词项的多个块拼接为一组数组
+        parts = defaultdict(list)
+        for term, block, doc_ids, tfs, lengths in rows:
+            doc_ids = np.frombuffer(doc_ids, dtype='int64')
+            tfs = np.frombuffer(tfs, dtype='int32')
+            lengths = np.frombuffer(lengths, dtype='int32')
+            if block in deleted:
+                live = ~np.isin(doc_ids, deleted[block])
+                doc_ids, tfs, lengths = doc_ids[live], tfs[live], lengths[live]
+            parts[term].append((doc_ids, tfs, lengths))
+        return {
+            term: tuple(np.concatenate(arrays) for arrays in zip(*term_parts))
+            for term, term_parts in parts.items()
+        }
+    
+    def compact_terms(self, min_block_docs=1000):
+        # 把增量修改产生的小倒排块和带删除标记的块合并为一个新块，返回合并的块数
+        with self._lock:
+            block = self._allocate_block()
+            blocks = [row[0] for row in self._conn.execute("""
+                SELECT block FROM bm25_docs GROUP BY block HAVING COUNT(*) < ?
+                UNION SELECT block FROM bm25_deleted
+            """, (min_block_docs,))]
+            deleted = self._deleted_in_blocks(blocks)
+            if len(blocks) < 2 and not deleted:
+                self._conn.rollback()
+                return 0
+            rows = []
+            for start in range(0, len(blocks), 500):
+                chunk = blocks[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows.extend(self._conn.execute(
+                    f"SELECT term, block, doc_ids, tfs, lengths FROM bm25_blocks WHERE block IN ({placeholders})", chunk
+                ).fetchall())
+                self._conn.execute(f"DELETE FROM bm25_blocks WHERE block IN ({placeholders})", chunk)
+                self._conn.execute(f"DELETE FROM bm25_deleted WHERE block IN ({placeholders})", chunk)
+                self._conn.execute(f"UPDATE bm25_docs SET block = ? WHERE block IN ({placeholders})", [block] + chunk)
+            self._insert_block(block, self._merge_postings(rows, deleted))
+            self._conn.commit()
+        return len(blocks)
+    
+    def replace_articles(self, items, doc_ids=()):
+        # 先删除doc_ids的条文号，再写入items: [(规范化条文号, doc_id)]
+        with self._lock:
+            self._conn.executemany("DELETE FROM articles WHERE doc_id = ?", [(int(doc_id),) for doc_id in doc_ids])
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO articles (article, doc_id) VALUES (?, ?)",
+                [(article, int(doc_id)) for article, doc_id in items]
+            )
+            self._conn.commit()
+    
+    def clear_articles(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM articles")
+            self._conn.commit()
+    
+    def article_doc_ids(self, article):
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT doc_id FROM articles WHERE article = ? ORDER BY doc_id", (article,)
+            ).fetchall()]
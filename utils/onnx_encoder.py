@@ -0,0 +1,235 @@
+import hashlib
+import json
+import os
+import re
+import numpy as np
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+ONNX_OPSET_VERSION = 14
+ONNX_MANIFEST_NAME = 'encoder_manifest.json'
+ONNX_INPUT_NAMES = ('input_ids', 'attention_mask', 'token_type_ids')
+
+# 导出后与PyTorch编码结果对比的样例文本，覆盖法条、案情与短查询
+VALIDATION_TEXTS = [
+    "第二百六十四条 盗窃公私财物，数额较大的，或者多次盗窃、入户盗窃、携带凶器盗窃、扒窃的，处三年以下有期徒刑、拘役或者管制，并处或者单处罚金。",
+    "第二百三十四条 故意伤害他人身体的，处三年以下有期徒刑、拘役或者管制。",
+    "第六十七条 犯罪以后自动投案，如实供述自己的罪行的，是自首。对于自首的犯罪分子，可以从轻或者减轻处罚。",
+    "被告人张某于2023年5月深夜翻墙进入被害人家中，窃取现金人民币三万元及金项链一条，案发后主动退赔并取得谅解。",
+    "被告人李某酒后与他人发生口角，持木棍击打被害人头部，致其轻伤二级，归案后如实供述。",
+    "被告人王某以投资理财为名，虚构高额回报，骗取多名被害人钱款共计八十余万元。",
+    "未成年人初犯，情节轻微",
+    "醉酒驾驶机动车",
+    "累犯 从重处罚",
+    "theft of property, first offence, restitution made",
+]
+
+def onnx_runtime_available():
+    return onnxruntime is not None
+
+def model_export_dir(export_dir, model_name_or_path, quantize):
+    name = re.sub(r'[^0-9A-Za-z._-]+', '_', os.path.basename(os.path.normpath(model_name_or_path)) or 'model')
+    return os.path.join(export_dir, f"{name}-{'int8' if quantize else 'fp32'}")
+
+def _pooling_config(sentence_model):
+    pooling_mode = None
+    normalize = False
+    for module in sentence_model:
+        class_name = type(module).__name__
+        if class_name == 'Pooling':
+            if getattr(module, 'pooling_mode_mean_tokens', False):
+                pooling_mode = 'mean'
+            elif getattr(module, 'pooling_mode_cls_token', False):
+                pooling_mode = 'cls'
+        elif class_name == 'Normalize':
+            normalize = True
+        elif class_name != 'Transformer':
+            raise ValueError(f"不支持导出的模块: {class_name}")
+    if pooling_mode is None:
+        raise ValueError("仅支持mean或cls池化的模型")
+    return pooling_mode, normalize
+
+def export_onnx_model(sentence_model, output_dir, quantize=True):
+    # 将SentenceTransformer的Transformer部分导出为ONNX，池化与归一化在numpy中完成
+    import torch
+
+    pooling_mode, normalize = _pooling_config(sentence_model)
+    transformer = sentence_model[0]
+    tokenizer = transformer.tokenizer
+    os.makedirs(output_dir, exist_ok=True)
+
+    features = tokenizer(VALIDATION_TEXTS[:2], padding=True, truncation=True, return_tensors='pt')
+    input_names = [name for name in ONNX_INPUT_NAMES if name in features]
+
+    class TransformerOutput(torch.nn.Module):
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, *inputs):
+            return self.auto_model(**dict(zip(input_names, inputs)), return_dict=False)[0]
+
+    fp32_path = os.path.join(output_dir, 'model.onnx')
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names + ['last_hidden_state']}
+    with torch.no_grad():
+        torch.onnx.export(
+            TransformerOutput(transformer.auto_model).eval(),
+            tuple(features[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=['last_hidden_state'],
+            dynamic_axes=dynamic_axes,
+            opset_version=ONNX_OPSET_VERSION,
+            do_constant_folding=True
+        )
+
+    model_file = 'model.onnx'
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        # 动态int8量化: 权重离线量化，激活在推理时按批量化
+        quantize_dynamic(fp32_path, os.path.join(output_dir, 'model_int8.onnx'), weight_type=QuantType.QInt8)
+        model_file = 'model_int8.onnx'
+    tokenizer.save_pretrained(output_dir)
+
+    return {
+        'model_file': model_file,
+        'quantized': quantize,
+        'pooling': pooling_mode,
+        'normalize': normalize,
+        'max_seq_length': int(sentence_model.max_seq_length or tokenizer.model_max_length),
+        'dimension': int(sentence_model.get_sentence_embedding_dimension())
+    }
+
+class OnnxEncoder:
+    # 与SentenceTransformer.encode接口一致，KnowledgeAgent可直接替换使用
+    def __init__(self, model_dir, manifest, tokenizer=None, intra_op_threads=None):
+        if onnxruntime is None:
+            raise RuntimeError("未安装onnxruntime")
+        if tokenizer is None:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.tokenizer = tokenizer
+        self.model_dir = model_dir
+        self.intra_op_threads = intra_op_threads
+        self.manifest = manifest
+        self.pooling = manifest['pooling']
+        self.normalize = manifest['normalize']
+        self.max_seq_length = manifest['max_seq_length']
+        self.dimension = manifest['dimension']
+        self.session = self._create_session()
+
+    def _create_session(self):
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.intra_op_threads:
+            options.intra_op_num_threads = self.intra_op_threads
+        session = onnxruntime.InferenceSession(
+            os.path.join(self.model_dir, self.manifest['model_file']), options, providers=['CPUExecutionProvider']
+        )
+        self.input_names = [item.name for item in session.get_inputs()]
+        return session
+
+    def __getstate__(self):
+        # 推理会话不可序列化，传给子进程后在首次编码时按子进程的线程数重建
+        state = dict(self.__dict__)
+        state['session'] = None
+        return state
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def _encode_batch(self, texts):
+        if self.session is None:
+            self.session = self._create_session()
+        features = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_seq_length, return_tensors='np')
+        inputs = {name: np.asarray(features[name], dtype='int64') for name in self.input_names if name in features}
+        if 'token_type_ids' in self.input_names and 'token_type_ids' not in inputs:
+            inputs['token_type_ids'] = np.zeros_like(inputs['input_ids'])
+        hidden = self.session.run(None, inputs)[0]
+
+        if self.pooling == 'cls':
+            embeddings = hidden[:, 0]
+        else:
+            mask = inputs['attention_mask'][:, :, None].astype('float32')
+            embeddings = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings.astype('float32')
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else [str(text) for text in sentences]
+        embeddings = np.zeros((len(texts), self.dimension), dtype='float32')
+        # 按长度排序后分批，同批文本长度相近，padding更少
+        order = sorted(range(len(texts)), key=lambda position: -len(texts[position]))
+        for offset in range(0, len(order), batch_size):
+            positions = order[offset:offset + batch_size]
+            embeddings[positions] = self._encode_batch([texts[position] for position in positions])
+        return embeddings[0] if single else embeddings
+
+def embedding_agreement(reference, candidate):
+    reference = np.asarray(reference, dtype='float32')
+    candidate = np.asarray(candidate, dtype='float32')
+    reference = reference / np.clip(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12, None)
+    candidate = candidate / np.clip(np.linalg.norm(candidate, axis=1, keepdims=True), 1e-12, None)
+    cosines = np.sum(reference * candidate, axis=1)
+    return {'min_cosine': float(cosines.min()), 'mean_cosine': float(cosines.mean())}
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _write_manifest(model_dir, manifest):
+    manifest_tmp_path = os.path.join(model_dir, f"{ONNX_MANIFEST_NAME}.tmp")
+    with open(manifest_tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(manifest_tmp_path, os.path.join(model_dir, ONNX_MANIFEST_NAME))
+
+def encoder_identity(model_name_or_path, encoder):
+    # 同一模型的PyTorch、ONNX fp32与int8导出给出的向量不同，嵌入缓存与索引清单按此区分
+    manifest = getattr(encoder, 'manifest', None)
+    if manifest is None:
+        return f"{model_name_or_path}#torch"
+    precision = 'int8' if manifest.get('quantized') else 'fp32'
+    return f"{model_name_or_path}#onnx-{precision}-{manifest.get('model_sha256', '')[:16]}"
+
+def read_manifest(model_dir):
+    try:
+        with open(os.path.join(model_dir, ONNX_MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def load_onnx_encoder(model_name_or_path, export_dir, quantize, min_cosine, load_reference):
+    # 已导出且校验通过时直接加载，无需PyTorch；否则用load_reference()加载PyTorch模型导出并校验
+    model_dir = model_export_dir(export_dir, model_name_or_path, quantize)
+    manifest = read_manifest(model_dir)
+    if (manifest is not None and manifest.get('source_model') == model_name_or_path
+            and manifest.get('agreement', {}).get('min_cosine', -1.0) >= min_cosine
+            and os.path.exists(os.path.join(model_dir, manifest['model_file']))):
+        if 'model_sha256' not in manifest:
+            # 旧版本导出的清单没有模型哈希，补写一次
+            manifest['model_sha256'] = _file_sha256(os.path.join(model_dir, manifest['model_file']))
+            _write_manifest(model_dir, manifest)
+        return OnnxEncoder(model_dir, manifest)
+
+    reference_model = load_reference()
+    print(f"导出ONNX编码器{'(int8量化)' if quantize else ''}: {model_name_or_path} -> {model_dir}")
+    manifest = export_onnx_model(reference_model, model_dir, quantize)
+    manifest['source_model'] = model_name_or_path
+    encoder = OnnxEncoder(model_dir, manifest)
+
+    agreement = embedding_agreement(reference_model.encode(VALIDATION_TEXTS), encoder.encode(VALIDATION_TEXTS))
+    print(f"ONNX与PyTorch嵌入余弦相似度: 最小 {agreement['min_cosine']:.4f}, 平均 {agreement['mean_cosine']:.4f}")
+    if agreement['min_cosine'] < min_cosine:
+        raise ValueError(f"ONNX嵌入与PyTorch不一致(最小余弦 {agreement['min_cosine']:.4f} < {min_cosine})，现有索引将失效")
+    manifest['agreement'] = agreement
+    manifest['model_sha256'] = _file_sha256(os.path.join(model_dir, manifest['model_file']))
+    _write_manifest(model_dir, manifest)
+    return encoder
@@ -0,0 +1,72 @@
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# 每个子任务包含的批数；块越大进程间传输开销越小，但负载均衡越差
+CHUNK_BATCHES = 8
+
+_worker_encoder = None
+
+def resolve_workers(workers):
+    if workers is None:
+        return os.cpu_count() or 1
+    return max(1, int(workers))
+
+def _init_worker(encoder, threads):
+    # 编码器随进程启动参数序列化传入(与sentence-transformers的多进程池相同)，各进程平分CPU线程
+    global _worker_encoder
+    _worker_encoder = encoder
+    if hasattr(encoder, 'intra_op_threads'):
+        encoder.intra_op_threads = threads
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(threads)
+
+def _encode_chunk(texts, batch_size):
+    return np.asarray(_worker_encoder.encode(texts, batch_size=batch_size), dtype='float32')
+
+class ParallelEncoder:
+    # 进程池在多次encode之间复用，流式重建时每个数据块不必重新加载模型
+    def __init__(self, encoder, workers, batch_size=32):
+        self.workers = resolve_workers(workers)
+        self.batch_size = batch_size
+        self.chunk_size = batch_size * CHUNK_BATCHES
+        self.broken = False
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=_init_worker, initargs=(encoder, threads))
+
+    def encode(self, texts, show_progress=False):
+        # 文本按长度排序后切块，同块内长度相近以减少padding；最长的块先提交，缩短尾部等待
+        order = sorted(range(len(texts)), key=lambda position: -len(texts[position]))
+        chunks = [order[offset:offset + self.chunk_size] for offset in range(0, len(order), self.chunk_size)]
+        embeddings = None
+        done = 0
+        started = time.perf_counter()
+        try:
+            results = self._executor.map(_encode_chunk, ([texts[position] for position in chunk] for chunk in chunks),
+                                         [self.batch_size] * len(chunks))
+            for chunk, encoded in zip(chunks, results):
+                if embeddings is None:
+                    embeddings = np.zeros((len(texts), encoded.shape[1]), dtype='float32')
+                embeddings[chunk] = encoded
+                done += len(chunk)
+                if show_progress:
+                    elapsed = time.perf_counter() - started
+                    print(f"\r并行编码: {done}/{len(texts)} ({done / elapsed if elapsed > 0 else 0.0:.1f} 文档/秒, {self.workers} 进程)",
+                          end='' if done < len(texts) else '\n', flush=True)
+        except Exception:
+            self.broken = True
+            raise
+        return embeddings
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,177 @@
+import json
+import re
+import threading
+from utils.tracing import record_prompt_report
+
+# 各类提示词的总token预算(含固定模板)
+ANALYSIS_PROMPT_TOKEN_BUDGET = 6000
+DECISION_PROMPT_TOKEN_BUDGET = 12000
+PROMPT_TOKENIZER = 'cl100k_base'
+# 剩余预算低于该值时不再截断放入条目，直接丢弃
+MIN_ITEM_TOKENS = 64
+# 在控制台打印各提示词章节的token用量；用量总会记录在当前追踪中
+PROMPT_REPORT_LOGGING = True
+
+TRUNCATION_MARK = "……(已截断)"
+ELISION_MARK = "\n……(中间内容已省略)……\n"
+
+CJK_CHAR_PATTERN = re.compile(r'[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]')
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if not _encoding_loaded:
+            _encoding_loaded = True
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(PROMPT_TOKENIZER)
+            except Exception as e:
+                print(f"警告: tiktoken分词器不可用，使用字符数估算token - {e}")
+        return _encoding
+
+def count_tokens(text):
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # 估算: 中文字符约1个token，其余约4个字符1个token
+    cjk_chars = len(CJK_CHAR_PATTERN.findall(text))
+    return cjk_chars + (len(text) - cjk_chars + 3) // 4
+
+def _longest_prefix(text, max_tokens):
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+def _longest_suffix(text, max_tokens):
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[len(text) - middle:]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[len(text) - low:]
+
+def truncate_to_tokens(text, max_tokens, keep_tail=False):
+    if count_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ''
+    if keep_tail:
+        # 分析结论通常在末尾，保留开头约2/3与结尾约1/3
+        available = max(0, max_tokens - count_tokens(ELISION_MARK))
+        head_tokens = available * 2 // 3
+        return _longest_prefix(text, head_tokens) + ELISION_MARK + _longest_suffix(text, available - head_tokens)
+    return _longest_prefix(text, max(0, max_tokens - count_tokens(TRUNCATION_MARK))) + TRUNCATION_MARK
+
+class PromptBudget:
+    def __init__(self, total_tokens):
+        self.total_tokens = total_tokens
+        self.sections = []
+        self.report = None
+    
+    def add_text(self, name, text, weight=1.0, keep_tail=False):
+        self.sections.append({'name': name, 'kind': 'text', 'text': str(text or ''), 'weight': weight, 'keep_tail': keep_tail})
+        return self
+    
+    def add_items(self, name, items, weight=1.0, separator="\n\n", empty_text=''):
+        # items: [(文本, 相关度)]，预算不足时优先截断、丢弃相关度最低的条目
+        self.sections.append({
+            'name': name, 'kind': 'items', 'items': list(items), 'weight': weight,
+            'separator': separator, 'empty_text': empty_text
+        })
+        return self
+    
+    def build(self, template_tokens=0):
+        remaining = max(0, self.total_tokens - template_tokens)
+        remaining_weight = sum(section['weight'] for section in self.sections)
+        rendered = {}
+        section_reports = {}
+        
+        for section in self.sections:
+            # 前面章节未用完的预算按权重顺延给后面的章节
+            budget = int(remaining * section['weight'] / remaining_weight) if remaining_weight > 0 else 0
+            remaining_weight -= section['weight']
+            
+            if section['kind'] == 'text':
+                original_tokens = count_tokens(section['text'])
+                text = truncate_to_tokens(section['text'], budget, section['keep_tail'])
+                section_report = {'truncated': original_tokens > budget, 'original_tokens': original_tokens}
+            else:
+                text, section_report = self._fit_items(section, budget)
+            
+            tokens = count_tokens(text)
+            remaining = max(0, remaining - tokens)
+            rendered[section['name']] = text
+            section_reports[section['name']] = dict(section_report, tokens=tokens, budget=budget)
+        
+        self.report = {
+            'budget': self.total_tokens,
+            'template_tokens': template_tokens,
+            'sections': section_reports,
+            'total_tokens': template_tokens + sum(report['tokens'] for report in section_reports.values())
+        }
+        return rendered
+    
+    def _fit_items(self, section, budget):
+        separator_tokens = count_tokens(section['separator'])
+        ranked = sorted(section['items'], key=lambda item: item[1] or 0, reverse=True)
+        kept = []
+        truncated = 0
+        used = 0
+        for text, _ in ranked:
+            cost = count_tokens(text) + (separator_tokens if kept else 0)
+            if used + cost <= budget:
+                kept.append(text)
+                used += cost
+                continue
+            space = budget - used - (separator_tokens if kept else 0)
+            if space >= MIN_ITEM_TOKENS:
+                kept.append(truncate_to_tokens(text, space))
+                used = budget
+                truncated += 1
+            break
+        
+        text = section['separator'].join(kept) if kept else section['empty_text']
+        return text, {
+            'items': len(section['items']),
+            'kept': len(kept),
+            'truncated': truncated,
+            'dropped': len(section['items']) - len(kept)
+        }
+
+def format_prompt_report(report):
+    parts = [f"{name} {section['tokens']}/{section['budget']}" for name, section in report['sections'].items()]
+    return f"提示词token: 合计 {report['total_tokens']}/{report['budget']} (模板 {report['template_tokens']}; " + "; ".join(parts) + ")"
+
+def log_prompt_report(label, report):
+    if not report:
+        return
+    record_prompt_report(label, report)
+    if PROMPT_REPORT_LOGGING:
+        print(f"{label} {format_prompt_report(report)}")
+
+def format_case_data(case_data):
+    if isinstance(case_data, (dict, list)):
+        return json.dumps(case_data, ensure_ascii=False, indent=1)
+    return str(case_data)
+
+def build_budgeted_analysis_prompt(build_prompt, case_data, law_items, case_items, total_tokens=ANALYSIS_PROMPT_TOKEN_BUDGET):
+    budget = PromptBudget(total_tokens)
+    budget.add_text('案件信息', format_case_data(case_data), weight=1)
+    budget.add_items('相关法律条文', law_items, weight=2)
+    budget.add_items('相关案例', case_items, weight=1)
+    sections = budget.build(count_tokens(build_prompt('', '', '')))
+    prompt = build_prompt(sections['案件信息'], sections['相关法律条文'], sections['相关案例'])
+    return prompt, budget.report
@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import random
+import threading
+import time
+import weakref
+from contextlib import contextmanager, asynccontextmanager
+from utils.llm_errors import LLMError, LLMRateLimitError
+from utils.tracing import record_retry
+
+# 每个API Key每分钟请求数上限(None表示不限制)
+LLM_REQUESTS_PER_MINUTE_PER_KEY = 120
+# 每个模型每分钟请求数上限，未列出的模型使用DEFAULT
+LLM_MODEL_REQUESTS_PER_MINUTE = {
+    'meta-llama/llama-3.1-8b-instruct:free': 20
+}
+LLM_DEFAULT_MODEL_REQUESTS_PER_MINUTE = None
+# 令牌桶可累积的突发请求数
+LLM_RATE_LIMIT_BURST = 10
+LLM_MAX_CONCURRENCY = 8
+LLM_MAX_RETRIES = 4
+LLM_BACKOFF_BASE = 1.0
+LLM_BACKOFF_MAX = 30.0
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst=LLM_RATE_LIMIT_BURST):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, min(burst, rate_per_minute))
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def reserve(self):
+        # 预约一个令牌，返回需要等待的秒数；令牌可以透支，后到的请求顺延排队
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+def _key_id(api_key):
+    return hashlib.blake2b(str(api_key).encode('utf-8'), digest_size=8).hexdigest()
+
+class RequestScheduler:
+    def __init__(self, requests_per_minute_per_key=LLM_REQUESTS_PER_MINUTE_PER_KEY,
+                 model_requests_per_minute=None, default_model_requests_per_minute=LLM_DEFAULT_MODEL_REQUESTS_PER_MINUTE,
+                 max_concurrency=LLM_MAX_CONCURRENCY, max_retries=LLM_MAX_RETRIES,
+                 backoff_base=LLM_BACKOFF_BASE, backoff_max=LLM_BACKOFF_MAX, burst=LLM_RATE_LIMIT_BURST):
+        self.requests_per_minute_per_key = requests_per_minute_per_key
+        self.model_requests_per_minute = dict(LLM_MODEL_REQUESTS_PER_MINUTE if model_requests_per_minute is None else model_requests_per_minute)
+        self.default_model_requests_per_minute = default_model_requests_per_minute
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.burst = burst
+        
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._paused_until = {}
+        self._semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self._async_semaphores = weakref.WeakKeyDictionary()
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.throttled_seconds = 0.0
+    
+    def _bucket(self, scope, rate_per_minute):
+        if not rate_per_minute:
+            return None
+        with self._lock:
+            bucket = self._buckets.get(scope)
+            if bucket is None:
+                bucket = TokenBucket(rate_per_minute, self.burst)
+                self._buckets[scope] = bucket
+            return bucket
+    
+    def _reserve(self, api_key, model):
+        key_id = _key_id(api_key)
+        delay = 0.0
+        key_bucket = self._bucket(('key', key_id), self.requests_per_minute_per_key)
+        if key_bucket is not None:
+            delay = max(delay, key_bucket.reserve())
+        model_bucket = self._bucket(('model', model), self.model_requests_per_minute.get(model, self.default_model_requests_per_minute))
+        if model_bucket is not None:
+            delay = max(delay, model_bucket.reserve())
+        
+        with self._lock:
+            paused_until = self._paused_until.get(key_id, 0.0)
+            delay = max(delay, paused_until - time.monotonic())
+            self.requests += 1
+            if delay > 0:
+                self.throttled_seconds += delay
+        return max(0.0, delay)
+    
+    @contextmanager
+    def slot(self, api_key, model):
+        delay = self._reserve(api_key, model)
+        if delay > 0:
+            time.sleep(delay)
+        if self._semaphore is None:
+            yield
+            return
+        with self._semaphore:
+            yield
+    
+    def _async_semaphore(self):
+        if not self.max_concurrency:
+            return None
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._async_semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.max_concurrency)
+                self._async_semaphores[loop] = semaphore
+            return semaphore
+    
+    @asynccontextmanager
+    async def async_slot(self, api_key, model):
+        delay = self._reserve(api_key, model)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        semaphore = self._async_semaphore()
+        if semaphore is None:
+            yield
+            return
+        async with semaphore:
+            yield
+    
+    def should_retry(self, error, attempt):
+        return isinstance(error, LLMError) and error.retryable and attempt < self.max_retries
+    
+    def backoff_delay(self, api_key, error, attempt):
+        # 指数退避+全抖动；服务端给出Retry-After时以其为下限
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if error.retry_after is not None:
+            delay = max(delay, error.retry_after)
+        with self._lock:
+            self.retries += 1
+            if isinstance(error, LLMRateLimitError):
+                # 429时暂停该Key的所有请求，避免其他线程同时重试
+                self.rate_limited += 1
+                key_id = _key_id(api_key)
+                self._paused_until[key_id] = max(self._paused_until.get(key_id, 0.0), time.monotonic() + delay)
+        record_retry(error)
+        return delay
+    
+    def call(self, api_key, model, request):
+        attempt = 0
+        while True:
+            with self.slot(api_key, model):
+                try:
+                    return request()
+                except LLMError as e:
+                    error = e
+            if not self.should_retry(error, attempt):
+                raise error
+            time.sleep(self.backoff_delay(api_key, error, attempt))
+            attempt += 1
+    
+    async def call_async(self, api_key, model, request):
+        attempt = 0
+        while True:
+            async with self.async_slot(api_key, model):
+                try:
+                    return await request()
+                except LLMError as e:
+                    error = e
+            if not self.should_retry(error, attempt):
+                raise error
+            await asyncio.sleep(self.backoff_delay(api_key, error, attempt))
+            attempt += 1
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'retries': self.retries,
+                'rate_limited': self.rate_limited,
+                'throttled_seconds': self.throttled_seconds
+            }
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+def get_default_scheduler():
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = RequestScheduler()
+        return _default_scheduler
+
+def set_default_scheduler(scheduler):
+    # 压测等场景替换进程级调度器；之后新建的客户端使用新的限流与并发配置
+    global _default_scheduler
+    with _default_scheduler_lock:
+        _default_scheduler = scheduler
+    return scheduler
@@ -0,0 +1,238 @@
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+# 结构化日志: 每个阶段/LLM调用/追踪汇总输出一行JSON；默认写到标准错误，设置路径后改为写入该文件
+TRACE_LOG_PATH = os.environ.get('LAWAGENT_TRACE_LOG')
+# Prometheus指标端口(Streamlit等无HTTP服务的进程使用)，None表示不启动
+METRICS_PORT = int(os.environ['LAWAGENT_METRICS_PORT']) if os.environ.get('LAWAGENT_METRICS_PORT') else None
+
+logger = logging.getLogger('lawagent.trace')
+
+_current_trace = contextvars.ContextVar('lawagent_current_trace', default=None)
+_setup_lock = threading.Lock()
+_log_configured = False
+_metrics = None
+_metrics_server_started = False
+
+def _configure_logging():
+    global _log_configured
+    with _setup_lock:
+        if _log_configured:
+            return
+        _log_configured = True
+        logger.setLevel(logging.INFO)
+        if TRACE_LOG_PATH:
+            directory = os.path.dirname(TRACE_LOG_PATH)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            handler = logging.FileHandler(TRACE_LOG_PATH, encoding='utf-8')
+        elif logger.handlers or logging.getLogger().handlers:
+            # 宿主程序已配置日志时交给其处理器输出
+            return
+        else:
+            handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+
+def _log(event, **fields):
+    _configure_logging()
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(dict(fields, event=event, ts=time.time()), ensure_ascii=False, default=str))
+
+def _get_metrics():
+    global _metrics
+    if prometheus_client is None:
+        return None
+    with _setup_lock:
+        if _metrics is None:
+            _metrics = {
+                'stage_seconds': prometheus_client.Histogram(
+                    'lawagent_stage_seconds', '各处理阶段耗时(秒)', ['stage'],
+                    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+                ),
+                'llm_requests': prometheus_client.Counter(
+                    'lawagent_llm_requests_total', 'LLM调用次数', ['model', 'outcome']
+                ),
+                'llm_tokens': prometheus_client.Counter(
+                    'lawagent_llm_tokens_total', 'LLM消耗token数', ['model', 'kind']
+                ),
+                'llm_retries': prometheus_client.Counter(
+                    'lawagent_llm_retries_total', 'LLM请求重试次数', ['error']
+                ),
+                'cache_events': prometheus_client.Counter(
+                    'lawagent_cache_events_total', '缓存命中/未命中次数', ['cache', 'result']
+                )
+            }
+        return _metrics
+
+def start_metrics_server(port=None):
+    global _metrics_server_started
+    port = port or METRICS_PORT
+    if not port or prometheus_client is None:
+        return False
+    with _setup_lock:
+        if _metrics_server_started:
+            return True
+        _metrics_server_started = True
+    _get_metrics()
+    prometheus_client.start_http_server(port)
+    print(f"Prometheus指标已在端口 {port} 暴露 (/metrics)")
+    return True
+
+def metrics_payload():
+    if prometheus_client is None:
+        return None, None
+    _get_metrics()
+    return prometheus_client.generate_latest(), prometheus_client.CONTENT_TYPE_LATEST
+
+class Trace:
+    def __init__(self, name, **attrs):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.total_seconds = None
+        self.stages = []
+        self.llm_calls = []
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.retries = 0
+        self.prompt_reports = []
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage, seconds, **attrs):
+        with self._lock:
+            self.stages.append(dict(attrs, stage=stage, seconds=seconds))
+
+    def add_llm_call(self, call):
+        with self._lock:
+            self.llm_calls.append(call)
+
+    def add_cache_event(self, hit):
+        with self._lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+    def add_prompt_report(self, label, report):
+        with self._lock:
+            self.prompt_reports.append(dict(report, label=label))
+
+    def add_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def finish(self):
+        self.total_seconds = time.perf_counter() - self._started
+
+    def summary(self):
+        with self._lock:
+            llm_calls = list(self.llm_calls)
+            stages = list(self.stages)
+            prompt_reports = list(self.prompt_reports)
+        return {
+            'trace_id': self.id,
+            'name': self.name,
+            'attrs': self.attrs,
+            'total_seconds': self.total_seconds if self.total_seconds is not None else time.perf_counter() - self._started,
+            'stages': stages,
+            'llm_calls': len(llm_calls),
+            'llm_cached_calls': sum(1 for call in llm_calls if call['cached']),
+            'prompt_tokens': sum(call['prompt_tokens'] or 0 for call in llm_calls),
+            'completion_tokens': sum(call['completion_tokens'] or 0 for call in llm_calls),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'retries': self.retries,
+            'prompt_reports': prompt_reports
+        }
+
+def current_trace():
+    return _current_trace.get()
+
+@contextmanager
+def start_trace(name, **attrs):
+    trace = Trace(name, **attrs)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        trace.finish()
+        _log('trace', **trace.summary())
+
+@contextmanager
+def span(stage, **attrs):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_stage(stage, seconds, **attrs)
+        metrics = _get_metrics()
+        if metrics is not None:
+            metrics['stage_seconds'].labels(stage=stage).observe(seconds)
+        _log('stage', trace_id=trace.id if trace else None, stage=stage, seconds=seconds, **attrs)
+
+def record_llm_call(model, seconds, usage=None, cached=False, stream=False, error=None):
+    usage = usage or {}
+    call = {
+        'model': model,
+        'seconds': seconds,
+        'prompt_tokens': usage.get('prompt_tokens'),
+        'completion_tokens': usage.get('completion_tokens'),
+        'cached': cached,
+        'stream': stream,
+        'error': error
+    }
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_llm_call(call)
+
+    metrics = _get_metrics()
+    if metrics is not None:
+        outcome = 'error' if error else ('cached' if cached else 'ok')
+        metrics['llm_requests'].labels(model=model, outcome=outcome).inc()
+        for kind in ('prompt_tokens', 'completion_tokens'):
+            if call[kind]:
+                metrics['llm_tokens'].labels(model=model, kind=kind.split('_')[0]).inc(call[kind])
+    _log('llm_call', trace_id=trace.id if trace else None, **call)
+
+def record_prompt_report(label, report):
+    # 提示词各章节的token用量与预算，随追踪汇总返回
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_prompt_report(label, report)
+    _log('prompt', trace_id=trace.id if trace else None, label=label, **report)
+
+def record_cache(cache, hit):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_cache_event(hit)
+    metrics = _get_metrics()
+    if metrics is not None:
+        metrics['cache_events'].labels(cache=cache, result='hit' if hit else 'miss').inc()
+
+def record_retry(error):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_retry()
+    metrics = _get_metrics()
+    if metrics is not None:
+        metrics['llm_retries'].labels(error=type(error).__name__).inc()
+    _log('llm_retry', trace_id=trace.id if trace else None, error=type(error).__name__, message=str(error))